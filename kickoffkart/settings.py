@@ -58,7 +58,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "main.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "main.middleware.ReplicaPinMiddleware",
+    "main.middleware.ShardMoveMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -66,6 +70,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "main.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = 'kickoffkart.urls'
@@ -92,12 +97,96 @@ WSGI_APPLICATION = 'kickoffkart.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (default) or postgres. DB_CONN_MAX_AGE keeps
+# connections open between requests under WSGI; set it to 0 when serving
+# through ASGI (uvicorn), where each request runs on its own thread, and
+# use DB_POOL on Postgres instead.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
+if DB_ENGINE == "postgres":
+    DB_POOL = os.getenv("DB_POOL", "False").lower() == "true"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "kickoffkart"),
+            "USER": os.getenv("DB_USER", "postgres"),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            # Django's psycopg 3 pool replaces persistent connections
+            "CONN_MAX_AGE": 0 if DB_POOL else DB_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
     }
-}
+    if DB_POOL:
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+else:
+    # With SQLITE_TUNED (default) the file runs in WAL mode, so readers
+    # never block the writer, with synchronous=NORMAL (durable at every
+    # checkpoint, fsync-free commits in between) and mmap'd reads.
+    # IMMEDIATE transactions take the write lock up front: a deferred
+    # transaction that later upgrades gets "database is locked" at once,
+    # without waiting out SQLITE_BUSY_TIMEOUT.
+    SQLITE_TUNED = os.getenv("SQLITE_TUNED", "True").lower() == "true"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": Path(os.getenv("SQLITE_PATH", str(BASE_DIR / "db.sqlite3"))),
+            "CONN_MAX_AGE": DB_CONN_MAX_AGE,
+            "OPTIONS": {},
+        }
+    }
+    if SQLITE_TUNED:
+        DATABASES["default"]["OPTIONS"] = {
+            "timeout": float(os.getenv("SQLITE_BUSY_TIMEOUT", "20")),
+            "transaction_mode": "IMMEDIATE",
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))};"
+                "PRAGMA cache_size=-20000;"
+                "PRAGMA temp_store=MEMORY;"
+            ),
+        }
+
+# Read replicas for the catalog read endpoints (see main/routers.py):
+# SQLITE_REPLICAS is a comma-separated list of database files (refresh
+# them with `manage.py sync_replicas`), DB_REPLICA_HOSTS a list of
+# Postgres hosts. Clients that wrote stay on the primary for
+# REPLICA_STICKY_SECONDS.
+_replica_names = os.getenv(
+    "DB_REPLICA_HOSTS" if DB_ENGINE == "postgres" else "SQLITE_REPLICAS", ""
+)
+for _i, _name in enumerate(filter(None, map(str.strip, _replica_names.split(","))), start=1):
+    _replica = {
+        **DATABASES["default"],
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    _replica["HOST" if DB_ENGINE == "postgres" else "NAME"] = _name
+    DATABASES[f"replica{_i}"] = _replica
+REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith("replica")]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
+# Per-merchant catalog shards (see main/shards.py): SQLITE_SHARDS is a
+# comma-separated list of database files, DB_SHARD_HOSTS a list of
+# Postgres hosts. Migrate each with `manage.py migrate --database
+# shardN`; after adding one, run `manage.py rebalance_shards`. Shard
+# assignments are cached per process for SHARD_MAP_TTL seconds.
+_shard_names = os.getenv("DB_SHARD_HOSTS" if DB_ENGINE == "postgres" else "SQLITE_SHARDS", "")
+for _i, _name in enumerate(filter(None, map(str.strip, _shard_names.split(",")))):
+    _shard = {**DATABASES["default"], "OPTIONS": dict(DATABASES["default"]["OPTIONS"])}
+    _shard["HOST" if DB_ENGINE == "postgres" else "NAME"] = _name
+    DATABASES[f"shard{_i}"] = _shard
+SHARD_DATABASES = [alias for alias in DATABASES if alias.startswith("shard")]
+SHARD_MAP_TTL = int(os.getenv("SHARD_MAP_TTL", "5"))
+DATABASE_ROUTERS = ["main.shards.ShardRouter", "main.routers.ReplicaRouter"]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -131,6 +220,23 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Static files are served by WhiteNoise. With STATICFILES_MANIFEST (on in
+# production) collectstatic writes content-hashed names, which WhiteNoise
+# serves with far-future caching, plus gzip and brotli copies, and
+# pre-renders thumbnail variants of static images (see main/storage.py).
+# It needs a collectstatic run, so development and tests use plain names.
+STATICFILES_MANIFEST = os.getenv("STATICFILES_MANIFEST", str(PRODUCTION)).lower() == "true"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": (
+            "main.storage.ManifestStaticStorage"
+            if STATICFILES_MANIFEST
+            else "django.contrib.staticfiles.storage.StaticFilesStorage"
+        ),
+    },
+}
+
 # Media files (uploaded content)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -142,4 +248,133 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Standard auth redirects
 LOGIN_URL = "main:login"
 LOGIN_REDIRECT_URL = "main:show_main"
-LOGOUT_REDIRECT_URL = "main:login"
\ No newline at end of file
+LOGOUT_REDIRECT_URL = "main:login"
+
+# Product list pagination (keyset / cursor based)
+PRODUCT_PAGE_SIZE = int(os.getenv("PRODUCT_PAGE_SIZE", "50"))
+PRODUCT_PAGE_MAX = int(os.getenv("PRODUCT_PAGE_MAX", "200"))
+
+# Full JSON/XML exports stream in chunks instead of building one document
+PRODUCT_EXPORT_STREAMING = os.getenv("PRODUCT_EXPORT_STREAMING", "True").lower() == "true"
+PRODUCT_EXPORT_CHUNK_SIZE = int(os.getenv("PRODUCT_EXPORT_CHUNK_SIZE", "500"))
+
+# Caching
+# CACHE_BACKEND=locmem (default, per process) or file (shared by workers
+# on one host, stored under CACHE_LOCATION).
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "locmem").lower()
+if CACHE_BACKEND == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("CACHE_LOCATION", str(BASE_DIR / "cache")),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "kickoffkart",
+        }
+    }
+
+# Sessions and users from the cache (see main/auth.py). Logouts and
+# password changes are only seen by every worker if they share the
+# cache, so this defaults off for the per-process locmem cache in
+# production (several workers); it is safe with CACHE_BACKEND=file or a
+# single process.
+AUTH_CACHE = os.getenv(
+    "AUTH_CACHE", str(CACHE_BACKEND != "locmem" or not PRODUCTION)
+).lower() == "true"
+# ModelBackend stays listed so sessions created before the cached
+# backend (which store its path) stay logged in; it never re-checks a
+# password CachedModelBackend rejected (see main/auth.py)
+AUTHENTICATION_BACKENDS = [
+    "main.auth.CachedModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db"
+    if AUTH_CACHE
+    else "django.contrib.sessions.backends.db"
+)
+SESSION_CACHE_ALIAS = "default"
+USER_CACHE_ALIAS = "default"
+USER_CACHE_TIMEOUT = int(os.getenv("USER_CACHE_TIMEOUT", "60")) if AUTH_CACHE else 0
+# Flash messages ride in a cookie, so showing one never writes the session
+MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+
+# Per-user catalog cache (see main/cache.py). A write only invalidates
+# other workers' entries if they share the cache, so like AUTH_CACHE
+# this defaults off for the per-process locmem cache in production.
+CATALOG_CACHE = os.getenv(
+    "CATALOG_CACHE", str(CACHE_BACKEND != "locmem" or not PRODUCTION)
+).lower() == "true"
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "300")) if CATALOG_CACHE else 0
+
+# Rendered product cards on the dashboard, keyed on id + updated_at
+PRODUCT_CARD_CACHE_TIMEOUT = int(os.getenv("PRODUCT_CARD_CACHE_TIMEOUT", "3600"))
+
+# Batch lookup (products/json/batch/?ids=...) accepts at most this many ids
+PRODUCT_BATCH_MAX_IDS = int(os.getenv("PRODUCT_BATCH_MAX_IDS", "100"))
+
+# Bulk product API (see main/bulk.py)
+PRODUCT_BULK_MAX_ITEMS = int(os.getenv("PRODUCT_BULK_MAX_ITEMS", "10000"))
+PRODUCT_BULK_BATCH_SIZE = int(os.getenv("PRODUCT_BULK_BATCH_SIZE", "500"))
+
+# Delta sync feed: tombstones older than this are compacted by
+# `manage.py compact_tombstones`; clients with older cursors resync
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+
+# Server-sent catalog events (see main/events.py; ASGI only)
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "1000"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+# Resized thumbnails (see main/thumbnails.py). THUMBNAIL_ORIGIN, if set,
+# replaces the scheme and host of remote sources (e.g. a local fake origin)
+# and is the only host fetched from without the public-address check
+THUMBNAIL_WIDTHS = [160, 320, 640]
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_CACHE_DIR = Path(os.getenv("THUMBNAIL_CACHE_DIR", str(MEDIA_ROOT / "thumbnails")))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+THUMBNAIL_TOUCH_SECONDS = int(os.getenv("THUMBNAIL_TOUCH_SECONDS", "3600"))
+THUMBNAIL_ORIGIN = os.getenv("THUMBNAIL_ORIGIN") or None
+THUMBNAIL_FETCH_TIMEOUT = float(os.getenv("THUMBNAIL_FETCH_TIMEOUT", "10"))
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv("THUMBNAIL_MAX_SOURCE_BYTES", str(20 * 1024 * 1024)))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_MAX_REDIRECTS = int(os.getenv("THUMBNAIL_MAX_REDIRECTS", "3"))
+THUMBNAIL_FAILURE_TTL = int(os.getenv("THUMBNAIL_FAILURE_TTL", "60"))
+
+# Upper bounds (exclusive) of the price facet buckets, in Rupiah
+PRODUCT_PRICE_BUCKETS = [100_000, 250_000, 500_000, 1_000_000]
+
+# Per-request timing / SQL metrics (Server-Timing header + /metrics/)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+# Sampled cProfile captures (see main/profiling.py, manage.py list_profiles)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_HEADER = os.getenv("PROFILING_HEADER", "X-Profile")
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", str(BASE_DIR / "profiles")))
+PROFILING_MAX_CAPTURES = int(os.getenv("PROFILING_MAX_CAPTURES", "200"))
+
+# Threads the async auth views hash passwords on (see main/passwords.py)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+
+# Token buckets in front of login/register hashing (see main/throttle.py).
+# Each attempt costs one token per client IP and one per username; a
+# burst of 0 turns that key off. LOGIN_THROTTLE_SHARED keeps the buckets
+# in the cache so all workers share them (only with a shared
+# CACHE_BACKEND). Set LOGIN_THROTTLE_PROXY_COUNT to the number of
+# trusted proxies that append to X-Forwarded-For.
+LOGIN_THROTTLE_ENABLED = os.getenv("LOGIN_THROTTLE_ENABLED", "True").lower() == "true"
+LOGIN_THROTTLE_IP_BURST = int(os.getenv("LOGIN_THROTTLE_IP_BURST", "20"))
+LOGIN_THROTTLE_IP_PER_MINUTE = float(os.getenv("LOGIN_THROTTLE_IP_PER_MINUTE", "10"))
+LOGIN_THROTTLE_USERNAME_BURST = int(os.getenv("LOGIN_THROTTLE_USERNAME_BURST", "5"))
+LOGIN_THROTTLE_USERNAME_PER_MINUTE = float(os.getenv("LOGIN_THROTTLE_USERNAME_PER_MINUTE", "5"))
+LOGIN_THROTTLE_SHARED = os.getenv(
+    "LOGIN_THROTTLE_SHARED", str(CACHE_BACKEND != "locmem")
+).lower() == "true"
+LOGIN_THROTTLE_CACHE_ALIAS = "default"
+LOGIN_THROTTLE_PROXY_COUNT = int(os.getenv("LOGIN_THROTTLE_PROXY_COUNT", "0"))
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Connect signal receivers. The cache module goes last so the
+        # catalog version is bumped only after derived tables (search
+        # index, facets, change feed) have been updated.
+        from . import signals, search, facets, changes, events, auth  # noqa: F401
+        from . import cache  # noqa: F401
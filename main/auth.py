@@ -0,0 +1,83 @@
+# main/auth.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+
+# ------------------------------------------------------------------
+# Cached users for authenticated requests
+#
+# AuthenticationMiddleware turns the session into request.user on every
+# request: a session read, then a User fetch. With AUTH_CACHE on, the
+# session engine is cached_db (reads from the cache, writes through to
+# the database), and this backend keeps each User in the cache for
+# USER_CACHE_TIMEOUT seconds, so a warm request authenticates without
+# touching the database.
+#
+# Saving or deleting a User drops its entry. A password change is
+# therefore seen on the next request, where Django compares the
+# session's auth hash with the fresh user and logs stale sessions out.
+# Writes that skip signals (QuerySet.update) show up once the entry
+# expires. Logging out deletes the session from the cache and the
+# database alike.
+#
+# Sessions store the path of the backend that logged them in, so plain
+# ModelBackend stays in AUTHENTICATION_BACKENDS for sessions that
+# predate this one (they read the User from the database until the next
+# login). A login this backend turns down raises PermissionDenied, which
+# stops Django from hashing the same password again in ModelBackend.
+# ------------------------------------------------------------------
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        user = await super().aauthenticate(request, username, password, **kwargs)
+        if user is None:
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, "USER_CACHE_TIMEOUT", 0)
+        if not timeout:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = _cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                _cache().set(key, user, timeout)
+        return user
+
+    async def aget_user(self, user_id):
+        timeout = getattr(settings, "USER_CACHE_TIMEOUT", 0)
+        if not timeout:
+            return await super().aget_user(user_id)
+        key = user_cache_key(user_id)
+        user = await _cache().aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await _cache().aset(key, user, timeout)
+        return user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user(sender, instance, **kwargs):
+    _cache().delete(user_cache_key(instance.pk))
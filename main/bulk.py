@@ -0,0 +1,60 @@
+# main/bulk.py
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import stamp_products
+from .models import Product
+from .shards import shard_for
+from .signals import batched_catalog_changes, notify_catalog_changed
+
+
+# ------------------------------------------------------------------
+# Batched Product writes
+#
+# Each helper does all of its writes in one transaction on the user's
+# shard (one fsync on SQLite) and reports the whole batch through a single catalog_changed
+# per user, since bulk_create/bulk_update skip model signals. The rows
+# are stamped with their change_seq up front and the receivers run
+# before the transaction commits, so the batch lands all at once.
+# ------------------------------------------------------------------
+def _batch_size():
+    return getattr(settings, "PRODUCT_BULK_BATCH_SIZE", 500)
+
+
+def bulk_create_products(user, products):
+    for p in products:
+        p.user = user
+    db = shard_for(user.pk, for_write=True)
+    with transaction.atomic(using=db), batched_catalog_changes():
+        stamp_products(db, products)
+        Product.objects.shard(user).bulk_create(products, batch_size=_batch_size())
+        notify_catalog_changed(user.pk, created=products)
+    return products
+
+
+def bulk_update_products(user, products, fields):
+    now = timezone.now()
+    for p in products:
+        p.updated_at = now
+    fields = list(dict.fromkeys([*fields, "updated_at", "change_seq"]))
+    db = shard_for(user.pk, for_write=True)
+    with transaction.atomic(using=db), batched_catalog_changes():
+        stamp_products(db, products)
+        Product.objects.shard(user).bulk_update(products, fields, batch_size=_batch_size())
+        notify_catalog_changed(user.pk, updated=products)
+    return products
+
+
+def bulk_delete_products(user, pks):
+    """Delete the user's products among `pks`; return the pks that existed."""
+    size = _batch_size()
+    deleted = []
+    db = shard_for(user.pk, for_write=True)
+    with transaction.atomic(using=db), batched_catalog_changes():
+        # Chunked to stay under SQLite's bound-parameter limit
+        for start in range(0, len(pks), size):
+            qs = Product.objects.for_user(user).filter(pk__in=pks[start : start + size])
+            deleted.extend(str(pk) for pk in qs.values_list("pk", flat=True))
+            qs.delete()
+    return deleted
@@ -0,0 +1,153 @@
+# main/cache.py
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import receiver
+
+from .metrics import register_counter
+from .routers import PRIMARY, read_alias
+from .shards import shard_for
+from .signals import catalog_changed
+
+
+# ------------------------------------------------------------------
+# Versioned per-user catalog cache
+#
+# Every cached body is stored under the owner's current catalog
+# version. Writes never delete entries; they bump the version so the
+# old keys simply stop being read and age out on their own. The bump
+# waits for the write to commit: a reader that saw the new version
+# before then could cache the old rows under it. Keys also name the
+# database the body was read from (replicas lag; see main/routers.py).
+#
+# The version lives in the cache too, so every worker has to share it:
+# with CATALOG_CACHE_TIMEOUT at 0 (the default for locmem in
+# production, see settings) bodies are always built fresh.
+# ------------------------------------------------------------------
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def catalog_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _enabled():
+    return bool(getattr(settings, "CATALOG_CACHE_TIMEOUT", 0))
+
+
+def _version_key(user_id):
+    return f"catalog:version:{user_id}"
+
+
+def catalog_version(user_id):
+    cache = _cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a
+        # value that older, still-cached entries were stored under.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def acatalog_version(user_id):
+    """Async-cache version of catalog_version()."""
+    cache = _cache()
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_catalog_version(user_id):
+    cache = _cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+    _count("invalidations")
+
+
+def _entry(user_id, version, kind, params):
+    """(key, timeout) for a body built by reads on read_alias()."""
+    alias = read_alias()
+    timeout = settings.CATALOG_CACHE_TIMEOUT
+    if alias != PRIMARY:
+        # Built from a replica that may lag the version it's stored under
+        timeout = min(timeout, getattr(settings, "REPLICA_STICKY_SECONDS", 10))
+    return f"catalog:{user_id}:{version}:{alias}:{kind}:{_params_digest(params)}", timeout
+
+
+def _params_digest(params):
+    if hasattr(params, "lists"):
+        items = sorted((k, tuple(v)) for k, v in params.lists())
+    else:
+        items = params
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+def cached_catalog(user_id, kind, params, build):
+    """
+    Return the cached body for (user, kind, params), calling `build()`
+    and storing its result on a miss. The version is read *before*
+    building so a write that lands mid-build can't be cached as current.
+    """
+    if not _enabled():
+        return build()
+    cache = _cache()
+    key, timeout = _entry(user_id, catalog_version(user_id), kind, params)
+    body = cache.get(key)
+    if body is not None:
+        _count("hits")
+        return body
+    _count("misses")
+    body = build()
+    cache.set(key, body, timeout=timeout)
+    return body
+
+
+async def acached_catalog(user_id, kind, params, build):
+    """cached_catalog() for async views; `build` is a coroutine function."""
+    if not _enabled():
+        return await build()
+    cache = _cache()
+    key, timeout = _entry(user_id, await acatalog_version(user_id), kind, params)
+    body = await cache.aget(key)
+    if body is not None:
+        _count("hits")
+        return body
+    _count("misses")
+    body = await build()
+    await cache.aset(key, body, timeout=timeout)
+    return body
+
+
+@receiver(catalog_changed)
+def invalidate_catalog(sender, user_id, **kwargs):
+    if user_id is not None and _enabled():
+        transaction.on_commit(lambda: bump_catalog_version(user_id), using=shard_for(user_id))
+
+
+register_counter(
+    "kickoffkart_catalog_cache_events_total",
+    "Catalog cache hits, misses and invalidations in this process.",
+    catalog_cache_stats,
+)
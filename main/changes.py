@@ -0,0 +1,196 @@
+# main/changes.py
+from datetime import timedelta
+from heapq import merge
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .encoders import PRODUCT_VALUES
+from .models import ChangeSequence, Product, ProductTombstone
+from .shards import shard_databases, shard_for
+from .signals import catalog_changed
+
+
+# ------------------------------------------------------------------
+# Delta sync change feed
+#
+# Every catalog write draws numbers from its shard's counter inside its
+# own transaction: created and updated products are stamped before the
+# row is written (pre_save below for single saves, stamp_products() in
+# the bulk helpers) so Product.change_seq goes out with the INSERT or
+# UPDATE, and deleted ones leave a ProductTombstone. A client keeps the last number it has seen
+# and asks for everything after it, so a sync costs O(changes) rather
+# than O(catalog). A user's rows all live on one shard, so one counter
+# orders their feed (main/shards.py carries it over when they move).
+#
+# The counter row is bumped first, in the same transaction as the
+# stamps, and stays locked until commit. Numbers therefore become
+# visible in the order they were issued, so a cursor can't skip past a
+# write that commits late. Tombstones older than
+# SYNC_TOMBSTONE_RETENTION_DAYS are compacted away (see
+# `manage.py compact_tombstones`); cursors from before the compaction
+# are refused and the client must resync from zero.
+# ------------------------------------------------------------------
+# Sent inside the write's transaction with `user_id`, `using`
+# (the shard's alias) and `events`:
+# (seq, "created" | "updated" | "deleted", product or pk)
+changes_recorded = Signal()
+
+
+class InvalidSyncCursor(ValueError):
+    pass
+
+
+class SyncCursorExpired(ValueError):
+    pass
+
+
+def _allocate(db, count):
+    """Reserve `count` numbers on `db`. Call inside the transaction that uses them."""
+    counter = ChangeSequence.objects.using(db)
+    bump = {"last_seq": F("last_seq") + count}
+    if not counter.filter(pk=1).update(**bump):
+        counter.get_or_create(pk=1)
+        counter.filter(pk=1).update(**bump)
+    last = counter.values_list("last_seq", flat=True).get(pk=1)
+    return iter(range(last - count + 1, last + 1))
+
+
+def stamp_products(db, products):
+    """Give `products` the next numbers on `db`, before they are written."""
+    if not products:
+        return
+    seqs = _allocate(db, len(products))
+    for p in products:
+        p.change_seq = next(seqs)
+
+
+def record_changes(user_id, created=(), updated=(), deleted=()):
+    """
+    Tombstone `deleted` and announce the changes. Created and updated
+    products already carry the change_seq they were written with.
+    """
+    changed = {p.pk: ("updated", p) for p in updated}
+    changed.update((p.pk, ("created", p)) for p in created)
+    deleted = list(dict.fromkeys(deleted))
+    if not changed and not deleted:
+        return
+    db = shard_for(user_id)
+    with transaction.atomic(using=db, savepoint=False):
+        tombstones = []
+        if deleted:
+            seqs = _allocate(db, len(deleted))
+            tombstones = [
+                ProductTombstone(user_id=user_id, product_id=pk, seq=next(seqs)) for pk in deleted
+            ]
+            ProductTombstone.objects.using(db).bulk_create(
+                tombstones, batch_size=getattr(settings, "PRODUCT_BULK_BATCH_SIZE", 500)
+            )
+        events = sorted(
+            ((p.change_seq, kind, p) for kind, p in changed.values()), key=lambda e: e[0]
+        )
+        events.extend((t.seq, "deleted", t.product_id) for t in tombstones)
+        changes_recorded.send(sender=Product, user_id=user_id, using=db, events=events)
+
+
+def parse_since(raw):
+    try:
+        since = int(raw or 0)
+    except ValueError:
+        raise InvalidSyncCursor("since must be an integer")
+    if since < 0:
+        raise InvalidSyncCursor("since must not be negative")
+    return since
+
+
+async def acheck_since(since, user):
+    """
+    Raise SyncCursorExpired if tombstones after `since` were compacted on
+    `user`'s shard. Compaction doesn't bump catalog versions, so check
+    before any cache.
+    """
+    if not since:
+        return
+    counter = await ChangeSequence.objects.ashard(user)
+    compacted = await counter.filter(pk=1).values_list(
+        "compacted_through", flat=True
+    ).afirst()
+    if compacted and since < compacted:
+        raise SyncCursorExpired("Cursor predates tombstone compaction")
+
+
+async def achange_events(user, since, limit):
+    """
+    Return `(events, more)`: up to `limit` `(seq, value)` pairs after
+    `since` in sequence order, where `value` is a PRODUCT_VALUES tuple
+    for a live product or a pk string for a deleted one. `since=0` is a
+    full sync, which needs no tombstones.
+    """
+    products = (
+        (await Product.objects.afor_user(user))
+        .filter(change_seq__gt=since)
+        .order_by("change_seq")
+        .values_list("change_seq", *PRODUCT_VALUES)[: limit + 1]
+    )
+    events = [(row[0], row[1:]) async for row in products]
+    if since:
+        tombstones = (
+            (await ProductTombstone.objects.afor_user(user))
+            .filter(seq__gt=since)
+            .order_by("seq")
+            .values_list("seq", "product_id")[: limit + 1]
+        )
+        events = list(merge(events, [(seq, str(pk)) async for seq, pk in tombstones]))
+
+    return events[:limit], len(events) > limit
+
+
+async def achanges_since(user, since, limit):
+    """
+    Return `(rows, deleted, cursor, more)` for the delta sync endpoint;
+    see achange_events().
+    """
+    events, more = await achange_events(user, since, limit)
+    rows = [value for _, value in events if isinstance(value, tuple)]
+    deleted = [value for _, value in events if isinstance(value, str)]
+    cursor = events[-1][0] if events else since
+    return rows, deleted, cursor, more
+
+
+def compact_tombstones(older_than=None):
+    """Purge tombstones past the retention window; return how many were removed."""
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, "SYNC_TOMBSTONE_RETENTION_DAYS", 30))
+    cutoff = timezone.now() - older_than
+    removed = 0
+    for db in shard_databases():
+        with transaction.atomic(using=db):
+            horizon = ProductTombstone.objects.using(db).filter(
+                deleted_at__lt=cutoff
+            ).aggregate(horizon=Max("seq"))["horizon"]
+            if horizon is None:
+                continue
+            ChangeSequence.objects.using(db).get_or_create(pk=1)
+            ChangeSequence.objects.using(db).filter(pk=1).update(
+                compacted_through=Greatest(F("compacted_through"), horizon)
+            )
+            removed += ProductTombstone.objects.using(db).filter(seq__lte=horizon).delete()[0]
+    return removed
+
+
+@receiver(catalog_changed)
+def stamp_catalog_changes(sender, user_id, created=(), updated=(), deleted=(), **kwargs):
+    if user_id is not None:
+        record_changes(user_id, created, updated, deleted)
+
+
+@receiver(pre_save, sender=Product)
+def stamp_product(sender, instance, raw=False, using=None, **kwargs):
+    # Product.save() holds the transaction open until post_save is done
+    if not raw:
+        stamp_products(using, [instance])
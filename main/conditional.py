@@ -0,0 +1,214 @@
+# main/conditional.py
+import hashlib
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+from .models import Product
+from .shards import ashard_for
+
+
+# ------------------------------------------------------------------
+# Conditional GET (ETag / Last-Modified / 304)
+#
+# The validators come from one aggregate over the rows behind a
+# response: COUNT(*) catches deletes, MAX(updated_at) catches creates
+# and edits. A matching If-None-Match / If-Modified-Since gets a 304
+# before the view runs, so nothing is serialized.
+#
+# Only the ETag sees both halves. A delete leaves MAX(updated_at) where
+# it was (or moves it back), so Last-Modified is sent only by
+# single-row endpoints (last_modified=True), where a deleted row is a
+# 404 rather than a 304.
+#
+# Endpoints that return a handful of rows pass prefetch=True: the rows
+# are fetched once, the validators are derived from them in Python and
+# the view picks the same list up via prefetched_rows(), so a 200 costs
+# one query instead of an aggregate plus a fetch.
+#
+# Endpoints that span merchants pass one queryset per shard (see
+# Product.objects.on_each_shard()); their validators combine the
+# per-shard aggregates.
+# ------------------------------------------------------------------
+def _stamp(request, agg, require_rows):
+    if require_rows and not agg["count"]:
+        return None
+    raw = "|".join(
+        [
+            request.get_full_path(),
+            str(request.user.pk),
+            str(agg["count"]),
+            agg["latest"].isoformat() if agg["latest"] else "",
+        ]
+    )
+    etag = '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+    return etag, agg["latest"]
+
+
+def _rows_agg(rows):
+    return {"count": len(rows), "latest": max((r.updated_at for r in rows), default=None)}
+
+
+def _querysets(qs):
+    return qs if isinstance(qs, list) else [qs]
+
+
+def _memo_key(querysets):
+    return "|".join(f"{q.db}:{q.query}" for q in querysets)
+
+
+def _combine(aggs):
+    latest = [agg["latest"] for agg in aggs if agg["latest"]]
+    return {"count": sum(agg["count"] for agg in aggs), "latest": max(latest, default=None)}
+
+
+def _aggregate(qs):
+    return qs.order_by().aggregate(count=Count("pk"), latest=Max("updated_at"))
+
+
+def catalog_stamp(request, qs, require_rows=False, prefetch=False):
+    """
+    Return `(etag, last_modified)` for `qs` (a queryset or a list of
+    them), or None if there is nothing to validate. Memoized on the
+    request because Django asks for the ETag and Last-Modified separately.
+    """
+    querysets = _querysets(qs)
+    stamps = request.__dict__.setdefault("_catalog_stamps", {})
+    key = _memo_key(querysets)
+    if key not in stamps:
+        if prefetch:
+            rows = [row for q in querysets for row in q]
+            request.__dict__.setdefault("_catalog_rows", {})[key] = rows
+            agg = _rows_agg(rows)
+        else:
+            agg = _combine([_aggregate(q) for q in querysets])
+        stamps[key] = _stamp(request, agg, require_rows)
+    return stamps[key]
+
+
+def prefetched_rows(request, qs):
+    """The rows conditional_on(prefetch=True) loaded for `qs`, else a fresh fetch."""
+    querysets = _querysets(qs)
+    rows = request.__dict__.get("_catalog_rows", {}).get(_memo_key(querysets))
+    if rows is None:
+        return [row for q in querysets for row in q]
+    return list(rows)
+
+
+async def acatalog_stamp(request, qs, require_rows=False):
+    """catalog_stamp() on the async ORM; fills the same memo."""
+    querysets = _querysets(qs)
+    stamps = request.__dict__.setdefault("_catalog_stamps", {})
+    key = _memo_key(querysets)
+    if key not in stamps:
+        aggs = [
+            await q.order_by().aaggregate(count=Count("pk"), latest=Max("updated_at"))
+            for q in querysets
+        ]
+        stamps[key] = _stamp(request, _combine(aggs), require_rows)
+    return stamps[key]
+
+
+def conditional_on(get_queryset, require_rows=False, prefetch=False, last_modified=False):
+    """
+    Decorate a read view (sync or async) with ETag/Last-Modified
+    handling. `get_queryset(request, *args, **kwargs)` returns the rows
+    the response is built from (a queryset, or one per shard), or None to skip validation (e.g.
+    anonymous API callers who will get a 401 anyway). Sync views only
+    may pass `prefetch=True` (see above); single-row views may pass
+    `last_modified=True`.
+    """
+
+    def stamp(request, *args, **kwargs):
+        qs = get_queryset(request, *args, **kwargs)
+        if qs is None:
+            return None
+        return catalog_stamp(request, qs, require_rows=require_rows, prefetch=prefetch)
+
+    def etag(request, *args, **kwargs):
+        s = stamp(request, *args, **kwargs)
+        return s[0] if s else None
+
+    def modified(request, *args, **kwargs):
+        s = stamp(request, *args, **kwargs)
+        return s[1] if s else None
+
+    conditional = condition(
+        etag_func=etag, last_modified_func=modified if last_modified else None
+    )
+
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return conditional(view)
+        conditional_view = conditional(view)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            # condition() calls the validators synchronously, so resolve
+            # the user and run the aggregate here first; the validators
+            # then only read the memo. The lazy request.user would hit
+            # the database from the event loop, so pin the loaded user.
+            request.user = await request.auser()
+            # Likewise the getters pick the user's shard synchronously
+            await ashard_for(request.user.pk)
+            qs = get_queryset(request, *args, **kwargs)
+            if qs is not None:
+                await acatalog_stamp(request, qs, require_rows=require_rows)
+            return await conditional_view(request, *args, **kwargs)
+
+        return inner
+
+    return decorator
+
+
+# Querysets behind each read endpoint
+def all_products(request, *args, **kwargs):
+    return Product.objects.on_each_shard()
+
+
+def one_product(request, pk, **kwargs):
+    return [qs.filter(pk=pk) for qs in Product.objects.on_each_shard()]
+
+
+def parse_product_ids(params):
+    """
+    UUIDs from `?ids=a,b,c` (the parameter may also repeat), in request
+    order without duplicates. Raises ValueError if any is malformed or
+    there are none or too many.
+    """
+    pks = []
+    for raw in params.getlist("ids"):
+        for part in raw.split(","):
+            if part.strip():
+                pks.append(str(uuid.UUID(part.strip())))
+    pks = list(dict.fromkeys(pks))
+    maximum = getattr(settings, "PRODUCT_BATCH_MAX_IDS", 100)
+    if not pks:
+        raise ValueError("ids is required")
+    if len(pks) > maximum:
+        raise ValueError(f"At most {maximum} ids per request")
+    return pks
+
+
+def batch_products(request, *args, **kwargs):
+    try:
+        pks = parse_product_ids(request.GET)
+    except ValueError:
+        return None  # the view answers 400
+    return [qs.filter(pk__in=pks) for qs in Product.objects.on_each_shard()]
+
+
+def user_products(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return Product.objects.for_user(request.user)
+
+
+def user_product(request, pk, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return Product.objects.for_user(request.user).filter(pk=pk)
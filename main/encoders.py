@@ -0,0 +1,81 @@
+# main/encoders.py
+import json
+import uuid
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.urls import get_script_prefix, reverse
+
+
+# ------------------------------------------------------------------
+# Allocation-light product JSON
+#
+# Produces exactly the bytes JsonResponse would for a payload built
+# with views.product_to_dict(), but from values_list() tuples: no model
+# instances, no per-row dicts, and detail_url comes from a template
+# resolved once instead of a reverse() per product.
+# ------------------------------------------------------------------
+PRODUCT_VALUES = ("id", "name", "price", "description", "thumbnail", "category", "is_featured")
+
+_PLACEHOLDER = str(uuid.UUID(int=0))
+
+
+@lru_cache(maxsize=8)
+def _detail_url_parts(script_prefix):
+    # The script prefix is part of the key because reverse() depends on it
+    url = reverse("main:product_detail", kwargs={"pk": _PLACEHOLDER})
+    before, after = url.split(_PLACEHOLDER)
+    # JSON-escaped halves; the UUID in between never needs escaping
+    return encode_basestring_ascii(before)[:-1], encode_basestring_ascii(after)[1:]
+
+
+def iter_product_json(rows):
+    """Yield the JSON for a list of PRODUCT_VALUES tuples, piece by piece."""
+    url_head, url_tail = _detail_url_parts(get_script_prefix())
+    enc = encode_basestring_ascii
+    yield "["
+    first = True
+    for pk, name, price, description, thumbnail, category, is_featured in rows:
+        pk = str(pk)
+        yield (
+            ('{"pk": "' if first else ', {"pk": "')
+            + pk
+            + '", "name": ' + enc(name)
+            + ', "price": ' + int.__repr__(price)
+            + ', "description": ' + enc(description)
+            + ', "thumbnail": ' + enc(thumbnail)
+            + ', "category": ' + enc(category)
+            + (', "is_featured": true, "detail_url": ' if is_featured else ', "is_featured": false, "detail_url": ')
+            + url_head + pk + url_tail
+            + "}"
+        )
+        first = False
+    yield "]"
+
+
+class ProductRows:
+    """Marks a payload value to be encoded with iter_product_json()."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+def iter_payload_json(payload):
+    """
+    Yield `payload` as JSON with JsonResponse's formatting. Values
+    wrapped in ProductRows go through the fast path; everything else
+    through DjangoJSONEncoder.
+    """
+    yield "{"
+    for i, (key, value) in enumerate(payload.items()):
+        yield (", " if i else "") + encode_basestring_ascii(key) + ": "
+        if isinstance(value, ProductRows):
+            yield from iter_product_json(value.rows)
+        else:
+            yield json.dumps(value, cls=DjangoJSONEncoder)
+    yield "}"
+
+
+def payload_json(payload):
+    return "".join(iter_payload_json(payload))
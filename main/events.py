@@ -0,0 +1,168 @@
+# main/events.py
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from .changes import (
+    InvalidSyncCursor,
+    SyncCursorExpired,
+    acheck_since,
+    achange_events,
+    changes_recorded,
+    parse_since,
+)
+from .encoders import PRODUCT_VALUES, iter_product_json
+from .models import ChangeSequence
+
+
+# ------------------------------------------------------------------
+# Server-sent catalog events
+#
+# Each open /events/ stream subscribes an asyncio.Queue for its user.
+# When the write record_changes() numbered commits, its events are fanned out
+# to every subscriber of that user in this process; writes may happen
+# on any thread, so delivery goes through the subscriber's event loop.
+#
+# Event ids are change-feed sequence numbers (main/changes.py), so a
+# reconnect with Last-Event-ID replays what it missed from the
+# database. That also covers writes handled by other worker processes,
+# which in-process fan-out alone would not see until the next
+# reconnect. A subscriber that falls SSE_QUEUE_SIZE events behind is
+# closed, and the browser reconnects and resumes the same way.
+# ------------------------------------------------------------------
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=getattr(settings, "SSE_QUEUE_SIZE", 1000))
+        self.closed = False
+
+    def deliver(self, event):
+        # Runs on self.loop
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(user_id):
+    subscriber = _Subscriber(asyncio.get_running_loop())
+    with _subscribers_lock:
+        _subscribers.setdefault(user_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(user_id, subscriber):
+    with _subscribers_lock:
+        subs = _subscribers.get(user_id)
+        if subs is not None:
+            subs.discard(subscriber)
+            if not subs:
+                del _subscribers[user_id]
+
+
+def _product_json(row):
+    return "".join(iter_product_json([row]))[1:-1]
+
+
+def _event_data(kind, obj):
+    if kind == "deleted":
+        return json.dumps({"pk": str(obj)})
+    return _product_json(tuple(getattr(obj, field) for field in PRODUCT_VALUES))
+
+
+@receiver(changes_recorded)
+def publish_changes(sender, user_id, events, using=None, **kwargs):
+    """Queue `events` for the user's open streams once the write commits."""
+
+    def fan_out():
+        with _subscribers_lock:
+            subs = list(_subscribers.get(user_id, ()))
+        if not subs:
+            return
+        payload = [(seq, kind, _event_data(kind, obj)) for seq, kind, obj in events]
+        for subscriber in subs:
+            for event in payload:
+                try:
+                    subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+                except RuntimeError:
+                    pass  # loop already closed; its stream is gone
+
+    transaction.on_commit(fan_out, using=using)
+
+
+def format_event(seq, kind, data):
+    return f"id: {seq}\nevent: {kind}\ndata: {data}\n\n"
+
+
+async def _replay(user, since):
+    """Yield (seq, kind, data) for changes after `since` from the change feed."""
+    limit = getattr(settings, "PRODUCT_PAGE_MAX", 200)
+    more = True
+    while more:
+        events, more = await achange_events(user, since, limit)
+        for seq, value in events:
+            # The feed keeps no created/updated distinction; clients
+            # treat both as an upsert.
+            if isinstance(value, tuple):
+                yield seq, "updated", _product_json(value)
+            else:
+                yield seq, "deleted", json.dumps({"pk": value})
+            since = seq
+
+
+async def event_stream(user, last_event_id):
+    """
+    The SSE body for one connection. Replays from `last_event_id` when
+    given, then streams live events with a comment heartbeat every
+    SSE_HEARTBEAT_SECONDS.
+    """
+    heartbeat = getattr(settings, "SSE_HEARTBEAT_SECONDS", 15)
+    subscriber = subscribe(user.pk)
+    try:
+        yield f"retry: {getattr(settings, 'SSE_RETRY_MS', 3000)}\n\n"
+        try:
+            since = parse_since(last_event_id) if last_event_id else None
+            if since is not None:
+                await acheck_since(since, user)
+        except (InvalidSyncCursor, SyncCursorExpired):
+            since = None
+            yield "event: reset\ndata: {}\n\n"
+
+        if since is None:
+            # Give the browser a resume point even if nothing happens yet
+            counter = await ChangeSequence.objects.ashard(user)
+            since = await counter.filter(pk=1).values_list("last_seq", flat=True).afirst() or 0
+            yield f"id: {since}\nevent: ready\ndata: {{}}\n\n"
+        else:
+            async for seq, kind, data in _replay(user, since):
+                since = max(since, seq)
+                yield format_event(seq, kind, data)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if event is None:
+                return  # fell behind; the browser reconnects and replays
+            seq, kind, data = event
+            if seq <= since:
+                continue  # already sent during replay
+            since = seq
+            yield format_event(seq, kind, data)
+    finally:
+        unsubscribe(user.pk, subscriber)
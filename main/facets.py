@@ -0,0 +1,115 @@
+# main/facets.py
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.dispatch import receiver
+
+from .models import CategoryFacet, Product
+from .shards import shard_for
+from .signals import catalog_changed
+
+
+# ------------------------------------------------------------------
+# Per-user category summary
+#
+# Single-row writes move the counts of the product's old and new
+# category with F() updates, so a write costs a statement or two
+# whatever the catalog size. Batches (bulk API, imports) and writes
+# whose previous category isn't known are rebuilt with one GROUP BY
+# over the owner's products instead, as is anything repaired with
+# `manage.py rebuild_facets` (concurrent edits of one product can make
+# the incremental counts drift). Reads (nav bar, facets API) only touch
+# the small CategoryFacet table.
+# ------------------------------------------------------------------
+def refresh_category_facets(user_id):
+    db = shard_for(user_id)
+    rows = (
+        Product.objects.using(db)
+        .filter(user_id=user_id)
+        .order_by()
+        .values("category")
+        .annotate(
+            product_count=Count("pk"),
+            featured_count=Count("pk", filter=Q(is_featured=True)),
+        )
+    )
+    facets = [CategoryFacet(user_id=user_id, **row) for row in rows]
+    with transaction.atomic(using=db, savepoint=False):
+        CategoryFacet.objects.using(db).filter(user_id=user_id).delete()
+        CategoryFacet.objects.using(db).bulk_create(facets)
+    return facets
+
+
+def facet_deltas(created=(), updated=(), deleted=(), previous=None):
+    """
+    {category: [products, featured]} changes for one catalog_changed, or
+    None when an updated or deleted row's stored category is unknown.
+    """
+    previous = previous or {}
+    deltas = defaultdict(lambda: [0, 0])
+
+    def move(facet, sign):
+        category, featured = facet
+        deltas[category][0] += sign
+        deltas[category][1] += sign if featured else 0
+
+    for p in created:
+        move((p.category, p.is_featured), 1)
+    for p in updated:
+        if str(p.pk) not in previous:
+            return None
+        move(previous[str(p.pk)], -1)
+        move((p.category, p.is_featured), 1)
+    for pk in deleted:
+        if pk not in previous:
+            return None
+        move(previous[pk], -1)
+    return {category: delta for category, delta in deltas.items() if delta != [0, 0]}
+
+
+def apply_facet_deltas(user_id, deltas):
+    db = shard_for(user_id)
+    facets = CategoryFacet.objects.using(db).filter(user_id=user_id)
+    with transaction.atomic(using=db, savepoint=False):
+        for category, (count, featured) in deltas.items():
+            bump = {
+                # Clamped so counts that drifted can't go negative
+                "product_count": Greatest(F("product_count") + count, 0),
+                "featured_count": Greatest(F("featured_count") + featured, 0),
+            }
+            if not facets.filter(category=category).update(**bump) and count > 0:
+                # First product in the category; ignore_conflicts covers a
+                # concurrent writer creating the row first
+                CategoryFacet.objects.using(db).bulk_create(
+                    [CategoryFacet(user_id=user_id, category=category)], ignore_conflicts=True
+                )
+                facets.filter(category=category).update(**bump)
+        emptied = [category for category, (count, _) in deltas.items() if count < 0]
+        if emptied:
+            facets.filter(category__in=emptied, product_count=0).delete()
+
+
+def user_facets(request):
+    """The current user's facets, loaded at most once per request."""
+    if not request.user.is_authenticated:
+        return []
+    if not hasattr(request, "_category_facets"):
+        request._category_facets = list(
+            CategoryFacet.objects.for_user(request.user).order_by("category")
+        )
+    return request._category_facets
+
+
+@receiver(catalog_changed)
+def update_category_facets(
+    sender, user_id, created=(), updated=(), deleted=(), previous=None, batched=False, **kwargs
+):
+    if user_id is None:
+        return
+    deltas = None if batched else facet_deltas(created, updated, deleted, previous)
+    if deltas is None:
+        refresh_category_facets(user_id)
+    elif deltas:
+        apply_facet_deltas(user_id, deltas)
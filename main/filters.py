@@ -0,0 +1,132 @@
+# main/filters.py
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .pagination import PRODUCT_SORTS
+
+
+# ------------------------------------------------------------------
+# Product list filters and facet counts
+#
+# Query params understood by api_product_list:
+#   category   - repeatable (?category=boots&category=balls)
+#   min_price  - inclusive
+#   max_price  - inclusive
+#   is_featured - true/false
+#   sort       - one of PRODUCT_SORTS (default "featured")
+# ------------------------------------------------------------------
+class InvalidFilter(ValueError):
+    pass
+
+
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"0", "false", "no", "off"}
+
+
+def _int_param(params, name):
+    raw = params.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise InvalidFilter(f"{name} must be an integer")
+
+
+def parse_filters(params):
+    categories = [c for c in params.getlist("category") if c]
+    featured = params.get("is_featured", "").lower()
+    if featured and featured not in _TRUE | _FALSE:
+        raise InvalidFilter("is_featured must be true or false")
+    sort = params.get("sort") or "featured"
+    if sort not in PRODUCT_SORTS:
+        raise InvalidFilter(f"sort must be one of {', '.join(PRODUCT_SORTS)}")
+    return {
+        "categories": categories,
+        "min_price": _int_param(params, "min_price"),
+        "max_price": _int_param(params, "max_price"),
+        "is_featured": (featured in _TRUE) if featured else None,
+        "sort": sort,
+    }
+
+
+def _price_q(filters):
+    q = Q()
+    if filters["min_price"] is not None:
+        q &= Q(price__gte=filters["min_price"])
+    if filters["max_price"] is not None:
+        q &= Q(price__lte=filters["max_price"])
+    return q
+
+
+def _category_q(filters):
+    return Q(category__in=filters["categories"]) if filters["categories"] else Q()
+
+
+def _featured_q(filters):
+    return Q(is_featured=filters["is_featured"]) if filters["is_featured"] is not None else Q()
+
+
+def apply_filters(qs, filters):
+    return qs.filter(_category_q(filters), _price_q(filters), _featured_q(filters))
+
+
+# ------------------------------------------------------------------
+# Facets (one GROUP BY query)
+#
+# Each facet ignores its own filter so clients can show "other
+# options" counts: category counts honour the price filter but not the
+# category filter, and price-bucket counts the other way round. Rows
+# are grouped by (category, price bucket) with two conditional counts,
+# which is enough to derive both facets in Python.
+# ------------------------------------------------------------------
+def price_buckets():
+    return list(getattr(settings, "PRODUCT_PRICE_BUCKETS", [100_000, 250_000, 500_000, 1_000_000]))
+
+
+def _bucket_case(bounds):
+    return Case(
+        *[When(price__lt=bound, then=Value(i)) for i, bound in enumerate(bounds)],
+        default=Value(len(bounds)),
+        output_field=IntegerField(),
+    )
+
+
+def _facet_rows(qs, filters, bounds):
+    return (
+        qs.filter(_featured_q(filters))
+        .order_by()
+        .values("category", bucket=_bucket_case(bounds))
+        .annotate(
+            in_price=Count("pk", filter=_price_q(filters)),
+            in_category=Count("pk", filter=_category_q(filters)),
+        )
+    )
+
+
+def _fold_facets(rows, bounds):
+    categories, buckets = {}, [0] * (len(bounds) + 1)
+    for row in rows:
+        categories[row["category"]] = categories.get(row["category"], 0) + row["in_price"]
+        buckets[row["bucket"]] += row["in_category"]
+
+    edges = [0, *bounds, None]
+    return {
+        "categories": [
+            {"category": c, "count": n} for c, n in sorted(categories.items()) if n
+        ],
+        "price": [
+            {"min": edges[i], "max": edges[i + 1], "count": n} for i, n in enumerate(buckets)
+        ],
+    }
+
+
+def facet_counts(qs, filters):
+    bounds = price_buckets()
+    return _fold_facets(_facet_rows(qs, filters, bounds), bounds)
+
+
+async def afacet_counts(qs, filters):
+    """facet_counts() on the async ORM."""
+    bounds = price_buckets()
+    return _fold_facets([row async for row in _facet_rows(qs, filters, bounds)], bounds)
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from main.encoders import PRODUCT_VALUES, ProductRows, payload_json
+from main.models import Product
+from main.views import product_to_dict
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare product_to_dict + JsonResponse encoding with the values_list() fast path: "
+        "checks the bytes are identical and reports timings. Seeds data inside a "
+        "transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options["products"], options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, count, repeat):
+        user = User.objects.create(username="__bench_serialization__")
+        Product.objects.bulk_create(
+            [
+                Product(
+                    user=user,
+                    name=f'Bench "Boot" {i} — ünïcode',
+                    price=i * 1000,
+                    description=f"Line one\nline two <b>{i}</b>",
+                    thumbnail=f"https://example.com/img/{i}.png",
+                    category=("boots", "balls", "gloves")[i % 3],
+                    is_featured=i % 7 == 0,
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
+        qs = Product.objects.filter(user=user).order_by("-is_featured", "name", "id")
+
+        def current():
+            data = [product_to_dict(p) for p in qs]
+            return json.dumps({"ok": True, "products": data, "next": None}, cls=DjangoJSONEncoder)
+
+        def fast():
+            rows = qs.values_list(*PRODUCT_VALUES)
+            return payload_json({"ok": True, "products": ProductRows(rows), "next": None})
+
+        expected, actual = current(), fast()
+        if expected != actual:
+            raise CommandError("Fast path output differs from product_to_dict output")
+        self.stdout.write(f"Outputs identical: {len(expected.encode())} bytes, {count} products")
+
+        timings = {}
+        for name, func in (("product_to_dict", current), ("values_list fast path", fast)):
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+            self.stdout.write(f"{name:>24}: {best * 1000:8.1f} ms (best of {repeat})")
+
+        speedup = timings["product_to_dict"] / timings["values_list fast path"]
+        self.stdout.write(self.style.SUCCESS(f"Speedup: {speedup:.1f}x"))
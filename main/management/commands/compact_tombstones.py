@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.changes import compact_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete delta sync tombstones older than the retention window. Clients whose cursor "
+        "predates the purge get cursor_expired and resync from zero. Meant for cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.SYNC_TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones younger than this (default SYNC_TOMBSTONE_RETENTION_DAYS).",
+        )
+
+    def handle(self, *args, **options):
+        removed = compact_tombstones(timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} tombstones."))
@@ -0,0 +1,45 @@
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.product_io import FORMATS, ImportFormatError, export_products, guess_format
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a user's products to CSV or NDJSON in constant memory. The output has an id "
+        "column and otherwise the same columns import_products reads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", required=True, help="Username whose products to export.")
+        parser.add_argument("--output", default="-", help="Output file (default stdout).")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from --output, else ndjson.")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.PRODUCT_EXPORT_CHUNK_SIZE,
+            help="Rows fetched per query (default PRODUCT_EXPORT_CHUNK_SIZE).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}")
+        path = options["output"]
+        fmt = options["format"]
+        if fmt is None:
+            try:
+                fmt = "ndjson" if path == "-" else guess_format(path)
+            except ImportFormatError as exc:
+                raise CommandError(exc)
+
+        if path == "-":
+            count = export_products(user, sys.stdout, fmt, options["chunk_size"])
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as out:
+                count = export_products(user, out, fmt, options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} products to {path}."))
@@ -0,0 +1,131 @@
+import io
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import ProductImport
+from main.product_io import (
+    FORMATS,
+    ImportFormatError,
+    guess_format,
+    import_products,
+    read_rows,
+    source_key,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream products from a CSV or NDJSON file into a user's catalog. Rows are validated "
+        "with ProductForm and inserted in batches; invalid rows are reported and skipped, "
+        "as are rows whose id is already one of the user's products. "
+        "Progress is checkpointed per batch, so --resume continues an interrupted import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file, or - for stdin (stdin can't be resumed).")
+        parser.add_argument("--user", required=True, help="Username that will own the products.")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PRODUCT_BULK_BATCH_SIZE,
+            help="Rows per transaction (default PRODUCT_BULK_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished import of this same file for this user.",
+        )
+        parser.add_argument(
+            "--progress-every", type=int, default=10_000, help="Report progress every N rows."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['user']!r}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        path = options["path"]
+        try:
+            fmt = options["format"] or guess_format(path)
+        except ImportFormatError as exc:
+            raise CommandError(exc)
+
+        if path == "-":
+            if options["resume"]:
+                raise CommandError("An import from stdin can't be resumed")
+            raw, key = sys.stdin.buffer, ""
+        else:
+            try:
+                raw = open(path, "rb")
+            except OSError as exc:
+                raise CommandError(exc)
+            key = source_key(raw)
+
+        with raw:
+            job = self._job(user, path, key, options["resume"])
+            # utf-8-sig: spreadsheet exports often start with a BOM
+            text = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            try:
+                self._run(user, text, fmt, job, options)
+            except ImportFormatError as exc:
+                raise CommandError(exc)
+            except UnicodeDecodeError as exc:
+                raise CommandError(f"Input is not UTF-8: {exc}")
+
+    def _job(self, user, path, key, resume):
+        if resume:
+            job = (
+                ProductImport.objects.for_user(user)
+                .filter(source_key=key, finished_at__isnull=True)
+                .order_by("-started_at")
+                .first()
+            )
+            if job is None:
+                raise CommandError("No unfinished import of this file to resume")
+            self.stdout.write(f"Resuming after row {job.rows_done} ({job.created_count} created).")
+            return job
+        return ProductImport.objects.shard(user, for_write=True).create(
+            user=user, source_name=str(path)[-255:], source_key=key
+        )
+
+    def _run(self, user, text, fmt, job, options):
+        every = max(1, options["progress_every"])
+        start, start_rows = time.perf_counter(), job.rows_done
+        next_report = job.rows_done + every
+
+        def on_error(line_number, errors):
+            details = "; ".join(f"{field}: {' '.join(msgs)}" for field, msgs in errors.items())
+            self.stderr.write(f"line {line_number}: {details}")
+
+        def on_batch(job):
+            nonlocal next_report
+            if job.rows_done >= next_report:
+                next_report = job.rows_done + every
+                self.stdout.write(self._progress(job, start, start_rows))
+
+        import_products(
+            user,
+            read_rows(text, fmt),
+            job,
+            options["batch_size"],
+            on_batch=on_batch,
+            on_error=on_error,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Done: {self._progress(job, start, start_rows)}.")
+        )
+
+    def _progress(self, job, start, start_rows):
+        rate = (job.rows_done - start_rows) / max(time.perf_counter() - start, 1e-9)
+        return (
+            f"{job.rows_done} rows read, {job.created_count} created, "
+            f"{job.failed_count} failed, {job.skipped_count} already present "
+            f"({rate:.0f} rows/s)"
+        )
@@ -0,0 +1,66 @@
+import io
+import json
+import pstats
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.profiling import profiles_dir
+
+
+class Command(BaseCommand):
+    help = "Summarize captured request profiles by view and list the slowest captures."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--view", help="Only captures for this view name (e.g. main:show_main).")
+        parser.add_argument("--top", type=int, default=10, help="How many slow captures to list.")
+        parser.add_argument(
+            "--stats",
+            type=int,
+            default=0,
+            metavar="N",
+            help="Also print the top N functions (by cumulative time) of the slowest capture.",
+        )
+
+    def handle(self, *args, **options):
+        directory = profiles_dir()
+        captures = []
+        for meta_path in directory.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text())
+            except (OSError, ValueError):
+                continue
+            if options["view"] and meta.get("view") != options["view"]:
+                continue
+            meta["stem"] = meta_path.with_suffix("")
+            captures.append(meta)
+        if not captures:
+            raise CommandError(f"No captures found in {directory}")
+
+        by_view = {}
+        for c in captures:
+            by_view.setdefault(c["view"], []).append(c["duration_ms"])
+        self.stdout.write(f"{'view':<36} {'n':>5} {'median ms':>10} {'max ms':>10}")
+        for view, durations in sorted(by_view.items(), key=lambda kv: -max(kv[1])):
+            self.stdout.write(
+                f"{view:<36} {len(durations):>5} "
+                f"{statistics.median(durations):>10.1f} {max(durations):>10.1f}"
+            )
+
+        slowest = sorted(captures, key=lambda c: -c["duration_ms"])[: options["top"]]
+        self.stdout.write("")
+        self.stdout.write("Slowest captures:")
+        for c in slowest:
+            self.stdout.write(
+                f"{c['duration_ms']:>10.1f} ms  {c['status']}  {c['method']} {c['path']}\n"
+                f"{'':>14}{c['stem']}.prof"
+            )
+
+        if options["stats"]:
+            self.stdout.write("")
+            # OutputWrapper appends a newline to every write(), which
+            # would break up pstats' column-by-column output.
+            buf = io.StringIO()
+            stats = pstats.Stats(f"{slowest[0]['stem']}.prof", stream=buf)
+            stats.sort_stats("cumulative").print_stats(options["stats"])
+            self.stdout.write(buf.getvalue(), ending="")
@@ -0,0 +1,163 @@
+import itertools
+import statistics
+import threading
+import time
+from collections import Counter
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with N concurrent clients and report throughput and latency "
+        "per concurrency level. Used to compare one ASGI worker with gunicorn sync workers:\n"
+        "  gunicorn kickoffkart.wsgi -w 1 -b 127.0.0.1:8001\n"
+        "  uvicorn kickoffkart.asgi:application --workers 1 --port 8002\n"
+        "then run this command against each URL. With --create every request POSTs a new "
+        "product instead, as a concurrent-write stress test (e.g. SQLITE_TUNED=False vs True); "
+        "add --users N to spread the writes over N merchants, and so over the catalog shards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Server base URL.")
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Path to request (repeatable; default /api/products/). Requests cycle through them.",
+        )
+        parser.add_argument("--username", default="loadtest")
+        parser.add_argument("--password", default="loadtest-Passw0rd!")
+        parser.add_argument(
+            "--users",
+            type=int,
+            default=1,
+            help="Log in as N accounts (<username>-0 ... <username>-N-1); clients take turns.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            default="1,8,32,64",
+            help="Comma-separated numbers of concurrent clients to try.",
+        )
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout.")
+        parser.add_argument(
+            "--create",
+            action="store_true",
+            help="POST new products to /api/products/create/ instead of GETting --path.",
+        )
+
+    def handle(self, *args, **options):
+        base = options["url"].rstrip("/")
+        paths = options["path"] or ["/api/products/"]
+        if options["create"]:
+            paths = ["/api/products/create/"]
+        try:
+            levels = [int(n) for n in options["concurrency"].split(",") if n.strip()]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers")
+
+        if options["users"] < 1:
+            raise CommandError("--users must be positive")
+        if options["users"] == 1:
+            usernames = [options["username"]]
+        else:
+            usernames = [f"{options['username']}-{i}" for i in range(options["users"])]
+        cookies = [self._session_cookie(base, name, options["password"]) for name in usernames]
+        self.stdout.write(f"Target {base}, paths {', '.join(paths)}")
+        self.stdout.write(
+            f"{'clients':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>9} "
+            f"{'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        for clients in levels:
+            latencies, errors, elapsed = self._run_level(
+                base, paths, cookies, clients, options["duration"], options["timeout"], options["create"]
+            )
+            done = len(latencies)
+            if done:
+                ordered = sorted(latencies)
+                p50 = statistics.median(ordered)
+                p95 = ordered[min(done - 1, int(done * 0.95))]
+                p99 = ordered[min(done - 1, int(done * 0.99))]
+            else:
+                p50 = p95 = p99 = float("nan")
+            self.stdout.write(
+                f"{clients:>8} {done:>9} {done / elapsed:>9.1f} {p50:>9.1f} "
+                f"{p95:>9.1f} {p99:>9.1f} {sum(errors.values()):>7}"
+            )
+            if errors:
+                kinds = ", ".join(f"{kind} x{n}" for kind, n in errors.most_common())
+                self.stdout.write(f"{'':>8} errors: {kinds}")
+
+    def _post_form(self, url, data):
+        body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(url, data=body, method="POST")
+        try:
+            return urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as exc:
+            return exc
+
+    def _session_cookie(self, base, username, password):
+        """Log in once (registering the account if needed); clients share the session."""
+        credentials = {"username": username, "password": password}
+        response = self._post_form(f"{base}/api/auth/login/", credentials)
+        if response.status != 200:
+            response = self._post_form(f"{base}/api/auth/register/", credentials)
+        if response.status not in (200, 201):
+            raise CommandError(f"Could not log in or register {username!r} (HTTP {response.status})")
+        cookies = SimpleCookie()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookies.load(header)
+        if "sessionid" not in cookies:
+            raise CommandError("Login response did not set a session cookie")
+        return f"sessionid={cookies['sessionid'].value}"
+
+    def _run_level(self, base, paths, cookies, clients, duration, timeout, create=False):
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+        serial = itertools.count()
+
+        def client(index):
+            own, own_errors, i = [], Counter(), index
+            cookie = cookies[index % len(cookies)]
+            while time.perf_counter() < deadline:
+                body = None
+                if create:
+                    n = next(serial)
+                    body = urllib.parse.urlencode({
+                        "name": f"Load test product {index}-{n}",
+                        "price": 100_000 + n,
+                        "description": "Created by manage.py load_test --create",
+                        "thumbnail": f"https://example.com/load-test/{n}.png",
+                        "category": ("boots", "balls", "gloves", "jerseys")[n % 4],
+                    }).encode()
+                request = urllib.request.Request(
+                    base + paths[i % len(paths)], data=body, headers={"Cookie": cookie}
+                )
+                i += 1
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=timeout) as response:
+                        response.read()
+                except urllib.error.HTTPError as exc:
+                    # A 500 here is usually "database is locked"
+                    own_errors[f"HTTP {exc.code}"] += 1
+                    continue
+                except (urllib.error.URLError, OSError) as exc:
+                    own_errors[type(exc).__name__] += 1
+                    continue
+                own.append((time.perf_counter() - start) * 1000)
+            with lock:
+                latencies.extend(own)
+                errors.update(own_errors)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(client, range(clients)))
+        return latencies, errors, time.perf_counter() - start
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.models import ShardAssignment
+from main.shards import PRIMARY, home_shard, move_merchant, shard_databases, shard_for, sharded
+
+
+class Command(BaseCommand):
+    help = (
+        "Move merchants' catalog rows between shards while the site keeps running. Without "
+        "--user, moves every merchant the hash now places on another shard (run it after adding "
+        "a shard to SQLITE_SHARDS / DB_SHARD_HOSTS). Reads are served throughout; a merchant's "
+        "writes get a 503 while they are being moved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", action="append", help="Username to move (repeatable); default: all misplaced."
+        )
+        parser.add_argument("--to", help="Target shard alias for --user (default: its hash shard).")
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=settings.SHARD_MAP_TTL + 1,
+            help="Seconds to wait for every process to see an assignment change "
+            "(default SHARD_MAP_TTL + 1).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only list the planned moves.")
+
+    def handle(self, *args, **options):
+        if not sharded():
+            raise CommandError("No shards configured (set SQLITE_SHARDS or DB_SHARD_HOSTS)")
+        shards = shard_databases()
+        target = options["to"]
+        if target and target not in shards:
+            raise CommandError(f"Unknown shard {target!r}; configured: {', '.join(shards)}")
+        if target and not options["user"]:
+            raise CommandError("--to needs --user")
+        if options["grace"] < settings.SHARD_MAP_TTL:
+            raise CommandError("--grace must be at least SHARD_MAP_TTL")
+
+        plan = []
+        if options["user"]:
+            for username in options["user"]:
+                try:
+                    user = User.objects.using(PRIMARY).get(username=username)
+                except User.DoesNotExist:
+                    raise CommandError(f"No user {username!r}")
+                plan.append((user.pk, username, shard_for(user.pk), target or home_shard(user.pk)))
+        else:
+            assignments = ShardAssignment.objects.using(PRIMARY).select_related("user")
+            for a in assignments.order_by("pk"):
+                home = home_shard(a.user_id)
+                if a.alias != home or a.moving:
+                    plan.append((a.user_id, a.user.username, a.alias, home))
+
+        moved = 0
+        for user_id, username, source, dest in plan:
+            if source == dest:
+                self.stdout.write(f"{username}: already on {dest}")
+            else:
+                self.stdout.write(f"{username}: {source} -> {dest}")
+            if options["dry_run"]:
+                continue
+            # Also clears `moving` left behind by an interrupted run
+            count = move_merchant(user_id, dest, options["grace"], options["batch_size"])
+            if source != dest:
+                moved += 1
+                self.stdout.write(f"  moved {count} products")
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Would move {len(plan)} merchants."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} merchants."))
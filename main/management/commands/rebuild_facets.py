@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main.facets import refresh_category_facets
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the per-user category facets from the Product table. Single-row writes "
+        "update them incrementally; run this to repair counts that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", action="append", help="Username to rebuild (repeatable); default: all."
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(username__in=options["user"])
+            missing = set(options["user"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"No user {', '.join(sorted(missing))}")
+        total = 0
+        for user_id in list(users.values_list("pk", flat=True)):
+            refresh_category_facets(user_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt facets for {total} users."))
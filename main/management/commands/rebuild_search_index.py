@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from main.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SQLite FTS5 product search index from the Product table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        conn = connections[options["database"]]
+        if not fts_available(conn):
+            raise CommandError(
+                "No FTS5 index on this database (not SQLite, or migrations not applied). "
+                "Postgres search needs no index rebuild."
+            )
+        total = rebuild_index(batch_size=options["batch_size"], conn=conn)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} products."))
@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto every file in SQLITE_REPLICAS with SQLite's "
+        "online backup API. Local stand-in for replication when trying the replica router; "
+        "run it again (or from cron) to simulate replication lag."
+    )
+
+    def handle(self, *args, **options):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas:
+            raise CommandError("No replicas configured (set SQLITE_REPLICAS)")
+        primary = connections["default"]
+        if primary.vendor != "sqlite":
+            raise CommandError("Only SQLite replicas are synced here; Postgres replicates itself")
+
+        primary.ensure_connection()
+        for alias in replicas:
+            target = sqlite3.connect(str(connections[alias].settings_dict["NAME"]))
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f"Synced {alias}")
+        self.stdout.write(self.style.SUCCESS(f"Copied the primary to {len(replicas)} replicas."))
@@ -0,0 +1,88 @@
+# main/metrics.py
+import threading
+from bisect import bisect_left
+
+
+# ------------------------------------------------------------------
+# In-process histograms, rendered in Prometheus text format
+#
+# Each worker process keeps its own numbers; scrape every worker (or
+# aggregate in Prometheus) for a full picture.
+# ------------------------------------------------------------------
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # per-bucket counts (+Inf last), sum
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: (list(v[0]), v[1]) for k, v in self._series.items()}
+        for label, (counts, total) in sorted(snapshot.items()):
+            running = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                running += count
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{bound}"}} {running}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {running}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUEST_SECONDS = Histogram(
+    "kickoffkart_request_duration_seconds", "Total view time per URL name.", SECONDS_BUCKETS
+)
+DB_SECONDS = Histogram(
+    "kickoffkart_db_duration_seconds", "Time spent in SQL per request.", SECONDS_BUCKETS
+)
+DB_QUERIES = Histogram(
+    "kickoffkart_db_queries", "SQL statements executed per request.", COUNT_BUCKETS
+)
+TEMPLATE_SECONDS = Histogram(
+    "kickoffkart_template_duration_seconds", "Template render time per request.", SECONDS_BUCKETS
+)
+
+HISTOGRAMS = (REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, TEMPLATE_SECONDS)
+
+# Extra counters contributed by other modules: name -> (help, callable
+# returning {label_value: number} or a plain number)
+_counters = {}
+
+
+def register_counter(name, help_text, collect):
+    _counters[name] = (help_text, collect)
+
+
+def render_prometheus():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for name, (help_text, collect) in sorted(_counters.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        value = collect()
+        if isinstance(value, dict):
+            for label, number in sorted(value.items()):
+                lines.append(f'{name}{{kind="{label}"}} {number}')
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,218 @@
+# main/middleware.py
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from django.template.backends.django import Template
+
+from .metrics import DB_QUERIES, DB_SECONDS, REQUEST_SECONDS, TEMPLATE_SECONDS
+from .routers import PIN_COOKIE, begin_request, end_request
+from .shards import ShardMoving
+
+
+# ------------------------------------------------------------------
+# Request timing / SQL instrumentation
+#
+# Measures total time, SQL time and count, and template render time
+# per request, reports them in a Server-Timing header and feeds the
+# histograms in main/metrics.py. With METRICS_ENABLED off the class
+# raises MiddlewareNotUsed, so Django drops it from the chain entirely.
+#
+# The middleware runs natively in both WSGI and ASGI mode. Async views
+# run their queries on sync_to_async threads, each with its own
+# connection, so the SQL timer is attached to every connection as it
+# opens instead of around the request; the ContextVar (which those
+# threads inherit) says which request to charge.
+# ------------------------------------------------------------------
+_current = ContextVar("request_metrics", default=None)
+
+
+class _RequestStats:
+    __slots__ = ("db_seconds", "queries", "template_seconds")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.template_seconds = 0.0
+
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - start
+        stats.queries += 1
+
+
+def _install_timer(connection, **kwargs):
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+_original_render = Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _current.get()
+    if stats is None:
+        return _original_render(self, context, request)
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template_seconds += time.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        connection_created.connect(_install_timer, dispatch_uid="request_metrics_timer")
+        for conn in connections.all(initialized_only=True):
+            _install_timer(conn)
+        # Nested {% include %}/{% extends %} render through the engine's
+        # internal Template, so only the outer render is counted here.
+        Template.render = _timed_render
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = _RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = _RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._report(request, response, stats, time.perf_counter() - start)
+
+    def _report(self, request, response, stats, total):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unresolved"
+        REQUEST_SECONDS.observe(view, total)
+        DB_SECONDS.observe(view, stats.db_seconds)
+        DB_QUERIES.observe(view, stats.queries)
+        TEMPLATE_SECONDS.observe(view, stats.template_seconds)
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f"app;dur={total * 1000:.1f}",
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+                f"tpl;dur={stats.template_seconds * 1000:.1f}",
+            ]
+        )
+        return response
+
+
+# ------------------------------------------------------------------
+# Read-your-own-writes for the replica router (see main/routers.py)
+#
+# A request that wrote to the primary gets a cookie holding the time
+# until which its client must keep reading from the primary. Without
+# REPLICA_DATABASES configured the middleware drops out of the chain.
+# ------------------------------------------------------------------
+class ReplicaPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REPLICA_DATABASES", None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin_request(self._pinned_until(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self._pin(response, state)
+
+    async def __acall__(self, request):
+        token = begin_request(self._pinned_until(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self._pin(response, state)
+
+    def _pinned_until(self, request):
+        try:
+            return float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            return 0
+
+    def _pin(self, response, state):
+        if state.wrote:
+            window = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                PIN_COOKIE,
+                f"{time.time() + window:.0f}",
+                max_age=window,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+# ------------------------------------------------------------------
+# Writes during a shard move (see main/shards.py)
+#
+# While rebalance_shards copies a merchant, their writes raise
+# ShardMoving; answer those with a 503 and Retry-After rather than a
+# 500. Without SHARD_DATABASES the middleware drops out of the chain.
+# ------------------------------------------------------------------
+class ShardMoveMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SHARD_DATABASES", None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, ShardMoving):
+            return None
+        response = JsonResponse({"ok": False, "error": "merchant_moving"}, status=503)
+        response["Retry-After"] = str(settings.SHARD_MAP_TTL)
+        return response
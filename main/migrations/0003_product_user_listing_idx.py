@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_product_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', '-is_featured', 'name', 'id'], name='product_user_listing_idx'),
+        ),
+    ]
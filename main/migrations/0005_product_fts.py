@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:40
+
+from django.db import migrations
+
+# Frozen copies of main.search as of this migration, so later changes
+# there can't alter what it creates
+FTS_TABLE = "main_product_fts"
+
+CREATE_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, description, category, owner, product_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+
+def fts_rowid(pk):
+    return pk.int & ((1 << 63) - 1)
+
+
+def create_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    schema_editor.execute(CREATE_FTS_SQL)
+
+    Product = apps.get_model("main", "Product")
+    rows = [
+        (fts_rowid(p.pk), p.name, p.description, p.category, f"u{p.user_id or 0}", str(p.pk))
+        for p in Product.objects.using(connection.alias).iterator()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category, owner, product_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
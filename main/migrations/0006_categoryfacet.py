@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_facets(apps, schema_editor):
+    Product = apps.get_model("main", "Product")
+    CategoryFacet = apps.get_model("main", "CategoryFacet")
+    db = schema_editor.connection.alias
+    rows = (
+        Product.objects.using(db)
+        .filter(user__isnull=False)
+        .values("user_id", "category")
+        .annotate(n=Count("pk"), featured=Count("pk", filter=Q(is_featured=True)))
+    )
+    CategoryFacet.objects.using(db).bulk_create(
+        [
+            CategoryFacet(
+                user_id=r["user_id"],
+                category=r["category"],
+                product_count=r["n"],
+                featured_count=r["featured"],
+            )
+            for r in rows
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_product_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=50)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('featured_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_facets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'category'), name='categoryfacet_user_category_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
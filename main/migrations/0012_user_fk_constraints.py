@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Mirrors main.models.USER_FK_CONSTRAINT: the per-user foreign keys are
+# only enforced when no shards are configured
+USER_FK_CONSTRAINT = not getattr(settings, "SHARD_DATABASES", None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_shard_assignment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categoryfacet',
+            name='user',
+            field=models.ForeignKey(db_constraint=USER_FK_CONSTRAINT, on_delete=django.db.models.deletion.CASCADE, related_name='category_facets', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=USER_FK_CONSTRAINT, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='productimport',
+            name='user',
+            field=models.ForeignKey(db_constraint=USER_FK_CONSTRAINT, on_delete=django.db.models.deletion.CASCADE, related_name='product_imports', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='producttombstone',
+            name='user',
+            field=models.ForeignKey(db_constraint=USER_FK_CONSTRAINT, on_delete=django.db.models.deletion.CASCADE, related_name='product_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,12 +1,21 @@
 ﻿import uuid
-from django.db import models
+from django.conf import settings
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
+from .shards import ShardedManager
+
+# With shards, catalog rows and their users live in different databases,
+# so the per-user foreign keys can only be enforced without them
+USER_FK_CONSTRAINT = not getattr(settings, "SHARD_DATABASES", None)
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
-    # User foreign key
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # User foreign key (see USER_FK_CONSTRAINT)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=USER_FK_CONSTRAINT
+    )
 
     # REQUIRED fields per checklist:
     name = models.CharField(max_length=100)          # CharField
@@ -16,5 +25,170 @@ class Product(models.Model):
     category = models.CharField(max_length=50)       # CharField
     is_featured = models.BooleanField(default=False) # BooleanField
 
+    # Drives ETag / Last-Modified on the read endpoints
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Position in the delta sync change feed (see main/changes.py)
+    change_seq = models.BigIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            # Matches the keyset ordering used by the product list endpoints
+            models.Index(
+                fields=["user", "-is_featured", "name", "id"],
+                name="product_user_listing_idx",
+            ),
+            models.Index(fields=["user", "updated_at"], name="product_user_updated_idx"),
+            # Category-filtered listing and facet GROUP BY
+            models.Index(
+                fields=["user", "category", "-is_featured", "name", "id"],
+                name="product_user_cat_listing_idx",
+            ),
+            # Price range filters and price sorts
+            models.Index(fields=["user", "price", "id"], name="product_user_price_idx"),
+            models.Index(fields=["user", "name", "id"], name="product_user_name_idx"),
+            models.Index(fields=["user", "change_seq"], name="product_user_change_seq_idx"),
+            # Thumbnail proxy checks a source belongs to some product
+            models.Index(fields=["thumbnail"], name="product_thumbnail_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # The stored category, so a later save or delete can move the
+        # facet counts incrementally (see main/facets.py)
+        if "category" in product.__dict__ and "is_featured" in product.__dict__:
+            product._stored_facet = (product.category, product.is_featured)
+        return product
+
+    def save(self, *args, **kwargs):
+        # One transaction for the row, the change_seq stamped on it in
+        # pre_save and whatever the catalog_changed receivers derive from
+        # it (see main/signals.py)
+        if kwargs.get("update_fields"):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "change_seq"}
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.name} (Rp{self.price})"
+
+
+class CategoryFacet(models.Model):
+    """
+    Per-user category summary, maintained on Product writes (see
+    main/facets.py) so navigation and facet reads never scan Product.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="category_facets",
+        db_constraint=USER_FK_CONSTRAINT,
+    )
+    category = models.CharField(max_length=50)
+    product_count = models.PositiveIntegerField(default=0)
+    featured_count = models.PositiveIntegerField(default=0)
+
+    objects = ShardedManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "category"], name="categoryfacet_user_category_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.category} ({self.product_count})"
+
+
+class ChangeSequence(models.Model):
+    """
+    Single-row counter behind the delta sync feed (one per shard). `last_seq`
+    is the last number handed out; tombstones at or below `compacted_through`
+    have been purged, so older cursors can no longer be served.
+    """
+    last_seq = models.BigIntegerField(default=0)
+    compacted_through = models.BigIntegerField(default=0)
+
+    objects = ShardedManager()
+
+
+class ProductTombstone(models.Model):
+    """Marks a deleted product in the delta sync feed until compacted."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="product_tombstones",
+        db_constraint=USER_FK_CONSTRAINT,
+    )
+    product_id = models.UUIDField()
+    seq = models.BigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "seq"], name="tombstone_user_seq_idx"),
+            models.Index(fields=["deleted_at"], name="tombstone_deleted_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} (deleted, seq {self.seq})"
+
+
+class ProductImport(models.Model):
+    """
+    Checkpoint of one `manage.py import_products` run. `rows_done` moves
+    forward in the same transaction as each batch it covers, so
+    --resume continues exactly after the last committed batch.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="product_imports",
+        db_constraint=USER_FK_CONSTRAINT,
+    )
+    source_name = models.CharField(max_length=255)
+    # sha256 of the input's size and leading bytes; identifies the file to resume
+    source_key = models.CharField(max_length=64)
+    rows_done = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "source_key", "-started_at"], name="productimport_source_idx"),
+        ]
+
+    @property
+    def skipped_count(self):
+        """Rows left out because their id was already in the catalog."""
+        return self.rows_done - self.created_count - self.failed_count
+
+    def __str__(self):
+        return f"{self.source_name} ({self.rows_done} rows)"
+
+
+class ShardAssignment(models.Model):
+    """
+    The shard holding a merchant's catalog rows (see main/shards.py).
+    Kept on the primary only. `moving` is set while rebalance_shards
+    copies the merchant elsewhere; their writes are refused meanwhile.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="product_shard"
+    )
+    alias = models.CharField(max_length=64)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.name} (Rp{self.price})"
\ No newline at end of file
+        return f"{self.user_id} on {self.alias}"
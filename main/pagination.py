@@ -0,0 +1,141 @@
+# main/pagination.py
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# ------------------------------------------------------------------
+# Keyset (cursor) pagination
+#
+# Instead of OFFSET, each page remembers the sort key of its last row
+# and the next page asks for rows strictly "after" it. With a matching
+# composite index that makes page N as cheap as page 1.
+# ------------------------------------------------------------------
+PRODUCT_SORTS = {
+    "featured": ("-is_featured", "name", "id"),
+    "name": ("name", "id"),
+    "price": ("price", "id"),
+    "-price": ("-price", "id"),
+}
+PRODUCT_ORDERING = PRODUCT_SORTS["featured"]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort="featured"):
+    """Return the ordering values stored in `cursor`, which must belong to `sort`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Malformed cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(PRODUCT_SORTS[sort]) + 1
+        or values[0] != sort
+    ):
+        raise InvalidCursor("Cursor does not match ordering")
+    return [_sort_value(key, value) for key, value in zip(PRODUCT_SORTS[sort], values[1:])]
+
+
+def _sort_value(key, value):
+    # Cursors come back from clients: a value the sort field can't hold
+    # would otherwise only blow up once the query runs
+    from .models import Product
+
+    if value is None or isinstance(value, (dict, list)):
+        raise InvalidCursor("Cursor value has the wrong type")
+    try:
+        return Product._meta.get_field(key.lstrip("-")).to_python(value)
+    except ValidationError:
+        raise InvalidCursor("Cursor value has the wrong type")
+
+
+def cursor_values(obj, ordering=PRODUCT_ORDERING, fields=None):
+    """Sort-key values of `obj`, a model instance or a `fields` tuple."""
+    values = []
+    for key in ordering:
+        field = key.lstrip("-")
+        value = obj[fields.index(field)] if fields else getattr(obj, field)
+        if field == "id":
+            value = str(value)
+        values.append(value)
+    return values
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the "row comes after `values`" predicate for `ordering`:
+
+        (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+
+    with `>` flipped to `<` for descending keys.
+    """
+    condition = Q()
+    equal = Q()
+    for key, value in zip(ordering, values):
+        field = key.lstrip("-")
+        op = "lt" if key.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{field}__{op}": value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+def parse_limit(raw):
+    default = getattr(settings, "PRODUCT_PAGE_SIZE", 50)
+    maximum = getattr(settings, "PRODUCT_PAGE_MAX", 200)
+    try:
+        limit = int(raw) if raw else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def _page_query(qs, cursor, limit, sort, fields):
+    ordering = PRODUCT_SORTS[sort]
+    limit = parse_limit(limit)
+    qs = qs.order_by(*ordering)
+    if fields:
+        qs = qs.values_list(*fields)
+    if cursor:
+        qs = qs.filter(keyset_filter(ordering, decode_cursor(cursor, sort)))
+    return qs[: limit + 1], limit
+
+
+def _page(rows, limit, sort, fields):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([sort, *cursor_values(rows[-1], PRODUCT_SORTS[sort], fields)])
+    return rows, next_cursor
+
+
+def paginate(qs, cursor=None, limit=None, sort="featured", fields=None):
+    """
+    Return `(rows, next_cursor)` for one page of `qs` in `sort` order
+    (a key of PRODUCT_SORTS). The cursor records its sort so it can't be
+    replayed against a different ordering. With `fields`, rows are
+    values_list() tuples instead of model instances.
+
+    Fetches `limit + 1` rows so we know whether another page exists
+    without a separate COUNT query.
+    """
+    page_qs, limit = _page_query(qs, cursor, limit, sort, fields)
+    return _page(list(page_qs), limit, sort, fields)
+
+
+async def apaginate(qs, cursor=None, limit=None, sort="featured", fields=None):
+    """paginate() on the async ORM."""
+    page_qs, limit = _page_query(qs, cursor, limit, sort, fields)
+    return _page([row async for row in page_qs], limit, sort, fields)
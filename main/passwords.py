@@ -0,0 +1,75 @@
+# main/passwords.py
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password, verify_password
+from django.contrib.auth.signals import user_login_failed
+
+
+# ------------------------------------------------------------------
+# Password hashing off the event loop
+#
+# A PBKDF2 check is tens of milliseconds of pure CPU. Django's own
+# aauthenticate() runs it on the event loop, which stalls every other
+# request on the worker. The async auth views run it here instead, on a
+# pool of PASSWORD_HASH_WORKERS threads, so a burst of logins queues
+# for the pool rather than blocking reads or starting unbounded
+# threads. Database lookups stay on the async ORM.
+# ------------------------------------------------------------------
+MODEL_BACKEND = "main.auth.CachedModelBackend"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "PASSWORD_HASH_WORKERS", 4),
+                thread_name_prefix="password-hash",
+            )
+        return _executor
+
+
+async def run_hasher(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool(), functools.partial(func, *args))
+
+
+async def ahash_password(raw_password):
+    return await run_hasher(make_password, raw_password)
+
+
+async def aauthenticate(request, username, password):
+    """
+    ModelBackend.aauthenticate() with the hasher moved to the pool.
+    Returns the user (with `backend` set, as authenticate() does) or None.
+    """
+    UserModel = get_user_model()
+    try:
+        user = await UserModel._default_manager.aget_by_natural_key(username)
+    except UserModel.DoesNotExist:
+        # Hash anyway so unknown usernames take as long as wrong passwords
+        await ahash_password(password)
+        user = None
+    else:
+        is_correct, must_update = await run_hasher(verify_password, password, user.password)
+        if is_correct and must_update:
+            user.password = await ahash_password(password)
+            await user.asave(update_fields=["password"])
+        if not (is_correct and getattr(user, "is_active", True)):
+            user = None
+
+    if user is None:
+        await user_login_failed.asend(
+            sender=__name__, credentials={"username": username}, request=request
+        )
+        return None
+    user.backend = MODEL_BACKEND
+    return user
@@ -0,0 +1,201 @@
+# main/product_io.py
+import csv
+import hashlib
+import json
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bulk import bulk_create_products
+from .forms import ProductForm
+from .models import Product, ProductImport
+from .shards import shard_for
+
+
+# ------------------------------------------------------------------
+# Streaming product import / export (CSV and NDJSON)
+#
+# Both directions hold one batch in memory at a time. Imported rows go
+# through ProductForm, so they obey the same rules as the add form, and
+# valid ones are written with bulk_create_products() in batches.
+#
+# Each batch commits together with its ProductImport checkpoint. An
+# interrupted import can therefore resume right after the last batch
+# that made it to the database: no rows are lost and none are
+# duplicated.
+#
+# Exports carry each product's id. On import, a row whose id is already
+# one of the user's products is skipped, so re-importing an export
+# doesn't duplicate the catalog. Every other row becomes a new product
+# with a fresh id.
+# ------------------------------------------------------------------
+FORMATS = ("csv", "ndjson")
+IMPORT_FIELDS = tuple(ProductForm._meta.fields)
+EXPORT_FIELDS = ("id", *IMPORT_FIELDS)
+
+_TRUE = {"1", "true", "yes", "y", "on"}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    if ext in ("ndjson", "jsonl"):
+        return "ndjson"
+    if ext == "csv":
+        return "csv"
+    raise ImportFormatError(f"Can't tell the format of {path!r}; pass --format")
+
+
+def source_key(fh, sample_size=1024 * 1024):
+    """Identify a seekable binary file by its size and first `sample_size` bytes."""
+    size = os.fstat(fh.fileno()).st_size
+    digest = hashlib.sha256(str(size).encode())
+    digest.update(fh.read(sample_size))
+    fh.seek(0)
+    return digest.hexdigest()
+
+
+# ------------------------------------------------------------------
+# Reading
+# ------------------------------------------------------------------
+def read_rows(fh, fmt):
+    """
+    Yield `(line_number, row)` for each record of text stream `fh`. `row`
+    is a dict, or an ImportFormatError for an NDJSON line that doesn't parse.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        missing = [f for f in ("name", "price") if f not in (reader.fieldnames or ())]
+        if missing:
+            raise ImportFormatError(f"CSV header is missing {', '.join(missing)}")
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(fh, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as exc:
+            yield line_number, ImportFormatError(f"Invalid JSON: {exc}")
+
+
+def _form_data(row):
+    data = {field: row.get(field) for field in IMPORT_FIELDS}
+    data = {k: "" if v is None else v for k, v in data.items()}
+    # CheckboxInput reads any non-empty string as checked, "0" included
+    if isinstance(data["is_featured"], str):
+        data["is_featured"] = data["is_featured"].strip().lower() in _TRUE
+    return data
+
+
+def _exported_id(row):
+    """The id a row from export_products() carries, or None."""
+    value = row.get("id") if isinstance(row, dict) else None
+    if value in (None, ""):
+        return None
+    try:
+        return Product._meta.pk.to_python(value)
+    except ValidationError:
+        return None
+
+
+def validate_row(row):
+    """Return `(product, None)` for a valid row or `(None, errors)`."""
+    if isinstance(row, Exception):
+        return None, {"__all__": [str(row)]}
+    if not isinstance(row, dict):
+        return None, {"__all__": ["Expected an object"]}
+    form = ProductForm(_form_data(row))
+    if not form.is_valid():
+        return None, {field: list(errors) for field, errors in form.errors.items()}
+    return form.save(commit=False), None
+
+
+def import_products(user, rows, job, batch_size, on_batch=None, on_error=None):
+    """
+    Validate and insert `rows` (from read_rows()) for `user`, skipping the
+    `job.rows_done` rows an earlier run already committed and rows whose
+    id is one of the user's products. Calls `on_error(line_number, errors)`
+    per invalid row and `on_batch(job)` after each commit.
+    """
+    rows = islice(rows, job.rows_done, None)
+    # The checkpoint lives on the user's shard, so it commits with the batch
+    db = shard_for(user.pk, for_write=True)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        ids = {_exported_id(row) for _, row in chunk} - {None}
+        existing = set()
+        if ids:
+            mine = Product.objects.for_user(user).filter(pk__in=ids)
+            existing = set(mine.values_list("pk", flat=True))
+        valid, skipped = [], 0
+        for line_number, row in chunk:
+            if _exported_id(row) in existing:
+                skipped += 1
+                continue
+            product, errors = validate_row(row)
+            if errors:
+                if on_error:
+                    on_error(line_number, errors)
+            else:
+                valid.append(product)
+
+        # The batch, what catalog_changed receivers derive from it and the
+        # checkpoint commit together
+        with transaction.atomic(using=db):
+            if valid:
+                bulk_create_products(user, valid)
+            ProductImport.objects.shard(user).filter(pk=job.pk).update(
+                rows_done=F("rows_done") + len(chunk),
+                created_count=F("created_count") + len(valid),
+                failed_count=F("failed_count") + len(chunk) - len(valid) - skipped,
+                updated_at=timezone.now(),
+            )
+        job.rows_done += len(chunk)
+        job.created_count += len(valid)
+        job.failed_count += len(chunk) - len(valid) - skipped
+        if on_batch:
+            on_batch(job)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=["finished_at", "updated_at"])
+    return job
+
+
+# ------------------------------------------------------------------
+# Writing
+# ------------------------------------------------------------------
+def export_products(user, out, fmt, chunk_size):
+    """Write the user's products to text stream `out`; return the row count."""
+    rows = (
+        Product.objects.for_user(user)
+        .order_by("id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            out.write(encoder.encode(dict(zip(EXPORT_FIELDS, row))))
+            out.write("\n")
+            count += 1
+    return count
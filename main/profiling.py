@@ -0,0 +1,269 @@
+# main/profiling.py
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+
+# ------------------------------------------------------------------
+# Sampled per-request profiler
+#
+# Opt-in with PROFILING_ENABLED. A request is profiled when it wins the
+# PROFILING_SAMPLE_RATE draw, or when a staff user sends the
+# PROFILING_HEADER header. Each capture writes three files to
+# PROFILING_DIR, sharing one stem:
+#   .prof       - cProfile data (snakeviz, pstats, gprof2dot)
+#   .collapsed  - folded stacks for flamegraph.pl / speedscope
+#   .json       - request metadata, read by `manage.py list_profiles`
+# Only the newest PROFILING_MAX_CAPTURES captures are kept.
+#
+# The profiler runs around the rest of the middleware chain, so the
+# view's exceptions still reach every process_exception() (a
+# ShardMoving still becomes ShardMoveMiddleware's 503). cProfile follows
+# one thread, so under ASGI a capture merges two profilers: one on the
+# request's sync thread, where sync views and the async ORM run, and one
+# on the event loop that is only switched on while this request's
+# coroutine is running, not while other requests' tasks are.
+# ------------------------------------------------------------------
+def profiles_dir():
+    return Path(getattr(settings, "PROFILING_DIR", Path(settings.BASE_DIR) / "profiles"))
+
+
+def _frame_name(func):
+    filename, lineno, name = func
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def collapsed_stacks(stats, max_depth=64, min_share=0.0005):
+    """
+    Turn pstats data into folded stacks ("a;b;c <microseconds>").
+
+    cProfile only records caller->callee edges, not whole stacks, so a
+    function's time is split between its callers in proportion to each
+    edge's cumulative time. That is the usual approximation flamegraph
+    tools make for cProfile data.
+
+    The number of distinct caller paths grows exponentially with the
+    call graph, so branches carrying less than min_share of the total
+    time are dropped. That bounds the walk to roughly
+    max_depth / min_share frames.
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    roots = [f for f, (_, _, _, _, callers) in raw.items() if not set(callers) - {f}]
+    min_weight = max(1e-6, sum(raw[r][3] for r in roots) * min_share)
+
+    folded = {}
+
+    def visit(func, path, weight):
+        _, _, tt, ct, _ = raw[func]
+        if ct <= 0 or weight < min_weight:
+            return
+        factor = min(1.0, weight / ct)
+        path = path + (_frame_name(func),)
+        own = tt * factor
+        if own > 0:
+            key = ";".join(path)
+            folded[key] = folded.get(key, 0.0) + own
+        if len(path) >= max_depth:
+            return
+        for callee in callees.get(func, ()):
+            if _frame_name(callee) in path:
+                continue  # recursion; its time is already in this frame's subtree
+            edge_ct = raw[callee][4][func][3]
+            visit(callee, path, edge_ct * factor)
+
+    for root in roots:
+        visit(root, (), raw[root][3])
+    return "".join(
+        f"{stack} {int(seconds * 1_000_000)}\n"
+        for stack, seconds in sorted(folded.items())
+        if int(seconds * 1_000_000) > 0
+    )
+
+
+def _rotate(directory, keep):
+    captures = sorted(directory.glob("*.json"))
+    for meta in captures[: max(0, len(captures) - keep)]:
+        for suffix in (".json", ".prof", ".collapsed"):
+            meta.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def save_capture(profilers, request, view_name, status, elapsed):
+    directory = profiles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = timezone.now().strftime("%Y%m%dT%H%M%S")
+    # View names contain dots once ':' is replaced, so append suffixes
+    # rather than using Path.with_suffix on the stem.
+    stem = f"{stamp}-{view_name.replace(':', '.')}-{uuid.uuid4().hex[:8]}"
+
+    for profiler in profilers:
+        profiler.create_stats()
+    stats = pstats.Stats(*profilers)
+    stats.dump_stats(directory / f"{stem}.prof")
+    (directory / f"{stem}.collapsed").write_text(collapsed_stacks(stats))
+    (directory / f"{stem}.json").write_text(
+        json.dumps(
+            {
+                "view": view_name,
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 3),
+                "captured_at": timezone.now().isoformat(),
+            }
+        )
+    )
+    _rotate(directory, getattr(settings, "PROFILING_MAX_CAPTURES", 200))
+
+
+class _Stepped:
+    """Await `awaitable` with `profiler` on only while it runs on the loop."""
+
+    def __init__(self, profiler, awaitable):
+        self.profiler = profiler
+        self.awaitable = awaitable
+
+    def __await__(self):
+        steps = self.awaitable.__await__()
+        resume, value = steps.send, None
+        while True:
+            self.profiler.enable()
+            try:
+                signal = resume(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.disable()
+            try:
+                resume, value = steps.send, (yield signal)
+            except BaseException as exc:
+                resume, value = steps.throw, exc
+
+
+class _ProfiledStream:
+    """Keep profiling while a streaming response is being consumed."""
+
+    def __init__(self, iterator, profiler, finish):
+        self.iterator = iterator
+        self.profiler = profiler
+        self.finish = finish
+
+    def __iter__(self):
+        try:
+            while True:
+                self.profiler.enable()
+                try:
+                    chunk = next(self.iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.profiler.disable()
+                yield chunk
+        finally:
+            self.finish()
+
+    async def __aiter__(self):
+        try:
+            while True:
+                try:
+                    chunk = await _Stepped(self.profiler, anext(self.iterator))
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            self.finish()
+
+
+class ProfilingMiddleware:
+    """Place last in MIDDLEWARE, so a capture is mostly the view."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        self.header = getattr(settings, "PROFILING_HEADER", "X-Profile")
+
+    def _sampled(self):
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def _requested_by_staff(self, user):
+        return bool(user and user.is_authenticated and user.is_staff)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        wanted = self._sampled() or (
+            self.header
+            and request.headers.get(self.header)
+            and self._requested_by_staff(getattr(request, "user", None))
+        )
+        if not wanted:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        return self._finish(request, response, [profiler], start, stream_profiler=profiler)
+
+    async def __acall__(self, request):
+        wanted = self._sampled()
+        if not wanted and self.header and request.headers.get(self.header):
+            auser = getattr(request, "auser", None)
+            wanted = self._requested_by_staff(await auser() if auser else None)
+        if not wanted:
+            return await self.get_response(request)
+        threads, loop = cProfile.Profile(), cProfile.Profile()
+        start = time.perf_counter()
+        # Thread-sensitive: the same thread the request's sync code runs on
+        await sync_to_async(threads.enable)()
+        try:
+            response = await _Stepped(loop, self.get_response(request))
+        finally:
+            await sync_to_async(threads.disable)()
+        # A sync stream is read on that thread after this returns; only
+        # async streams (consumed on the loop) are followed
+        return self._finish(
+            request, response, [threads, loop], start, stream_profiler=loop, stream_async=True
+        )
+
+    def _finish(self, request, response, profilers, start, stream_profiler, stream_async=False):
+        match = getattr(request, "resolver_match", None)
+        view_name = match.view_name if match else "unresolved"
+
+        def finish():
+            elapsed = time.perf_counter() - start
+            save_capture(profilers, request, view_name, response.status_code, elapsed)
+
+        if response.streaming and response.is_async == stream_async:
+            content = response.streaming_content
+            stream = _ProfiledStream(
+                aiter(content) if stream_async else iter(content), stream_profiler, finish
+            )
+            response.streaming_content = stream.__aiter__() if stream_async else iter(stream)
+        else:
+            finish()
+        return response
@@ -0,0 +1,127 @@
+# main/routers.py
+import functools
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+
+# ------------------------------------------------------------------
+# Read replicas
+#
+# Writes, and every read by default, go to `default`. Reads made inside
+# replica_reads() / replica_scope() (the catalog read endpoints and the
+# nav bar) go to one of REPLICA_DATABASES instead, chosen once per
+# request so that a request's ETag stamp and rows come from one copy.
+#
+# Replicas lag, so a client that just wrote must not read from one.
+# ReplicaPinMiddleware (main/middleware.py) notices any write during a
+# request and sets a cookie that pins the client to the primary for
+# REPLICA_STICKY_SECONDS. Requests carrying it ignore replica_reads().
+# Keep that window above the worst replication lag. Cached catalog
+# bodies (main/cache.py) are keyed by the read_alias() that built them,
+# so a pinned client never gets a body another session built from a
+# lagging replica, and replica-built bodies expire within that window.
+# ------------------------------------------------------------------
+PRIMARY = "default"
+PIN_COOKIE = "db_pin"
+
+
+class _RoutingState:
+    __slots__ = ("pinned", "wrote", "replica", "replica_reads")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None
+        self.replica_reads = 0
+
+
+# Set per request by ReplicaPinMiddleware; sync_to_async threads inherit
+# the same object, so writes they make are seen by the middleware.
+_state = ContextVar("db_routing", default=None)
+
+
+def begin_request(pinned_until):
+    return _state.set(_RoutingState(pinned=time.time() < pinned_until))
+
+
+def end_request(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def _replicas():
+    return getattr(settings, "REPLICA_DATABASES", ())
+
+
+@contextmanager
+def replica_scope():
+    """replica_reads() for a block of code rather than a whole view."""
+    state = _state.get()
+    if state is None or not _replicas():
+        yield
+        return
+    state.replica_reads += 1
+    try:
+        yield
+    finally:
+        state.replica_reads -= 1
+
+
+def replica_reads(view):
+    """Let the reads `view` makes go to a replica (sync or async view)."""
+    if iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with replica_scope():
+                return await view(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with replica_scope():
+                return view(*args, **kwargs)
+
+    return wrapper
+
+
+def read_alias():
+    """The database catalog reads made here go to (PRIMARY or the request's replica)."""
+    state = _state.get()
+    if state is None or not state.replica_reads or state.pinned or state.wrote:
+        return PRIMARY
+    if state.replica is None:
+        state.replica = random.choice(_replicas())
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Sessions and users stay on the primary: a fresh login must be
+        # readable before any replica catches up
+        if model._meta.app_label != "main":
+            return None
+        alias = read_alias()
+        return None if alias == PRIMARY else alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in _replicas():
+            return False
+        return None
@@ -0,0 +1,223 @@
+# main/search.py
+import re
+import uuid
+
+from django.db import OperationalError, connection, connections, transaction
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import Product
+from .shards import shard_for
+from .signals import catalog_changed
+
+
+# ------------------------------------------------------------------
+# Full-text product search
+#
+# SQLite: an FTS5 virtual table (created by migration 0005) holds
+# name/description/category plus an "owner" token, so a query like
+# `owner:u42 AND ("boot"*)` intersects posting lists instead of
+# filtering every match by user. Rows are keyed by a 63-bit rowid
+# derived from the product UUID, which keeps deletes O(log n). Each
+# shard indexes the products it holds.
+#
+# Postgres: ranked SearchVector/SearchQuery on the fly.
+# Anything else: icontains.
+# ------------------------------------------------------------------
+FTS_TABLE = "main_product_fts"
+
+CREATE_FTS_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    name, description, category, owner, product_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# bm25 column weights: name, description, category, owner
+_BM25 = f"bm25({FTS_TABLE}, 10.0, 2.0, 5.0, 0.0)"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Aliases known to have the FTS table (it never disappears once created)
+_fts_aliases = set()
+
+
+def fts_rowid(pk):
+    return pk.int & ((1 << 63) - 1)
+
+
+def _owner_token(user_id):
+    return f"u{user_id or 0}"
+
+
+def fts_available(conn=None):
+    conn = conn or connection
+    if conn.vendor != "sqlite":
+        return False
+    if conn.alias in _fts_aliases:
+        return True
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        found = cursor.fetchone() is not None
+    if found:
+        _fts_aliases.add(conn.alias)
+    return found
+
+
+def _fts_row(p):
+    return (fts_rowid(p.pk), p.name, p.description, p.category, _owner_token(p.user_id), str(p.pk))
+
+
+def index_products(products, conn=None, fresh=False):
+    """(Re)index `products`; `fresh` ones were just created, so nothing is replaced."""
+    conn = conn or connection
+    rows = [_fts_row(p) for p in products]
+    if not rows:
+        return
+    with conn.cursor() as cursor:
+        if not fresh:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(r[0],) for r in rows]
+            )
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category, owner, product_id) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def unindex_products(pks, conn=None):
+    conn = conn or connection
+    if not pks:
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+            [(fts_rowid(uuid.UUID(str(pk))),) for pk in pks],
+        )
+
+
+def unindex_owner(user_id, conn=None):
+    """Drop every indexed product of `user_id` (used when a merchant moves shard)."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [f"owner:{_owner_token(user_id)}"],
+        )
+
+
+def rebuild_index(batch_size=2000, conn=None):
+    conn = conn or connection
+    total = 0
+    with transaction.atomic(using=conn.alias):
+        with conn.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        batch = []
+        for p in Product.objects.using(conn.alias).iterator(chunk_size=batch_size):
+            batch.append(p)
+            if len(batch) >= batch_size:
+                index_products(batch, conn)
+                total += len(batch)
+                batch = []
+        index_products(batch, conn)
+        total += len(batch)
+        with conn.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+@receiver(catalog_changed)
+def sync_search_index(sender, user_id=None, created=(), updated=(), deleted=(), **kwargs):
+    conn = connections[shard_for(user_id)]
+    if not fts_available(conn):
+        return
+    # Part of the write's transaction (see main/signals.py)
+    with transaction.atomic(using=conn.alias, savepoint=False):
+        unindex_products(deleted, conn)
+        index_products(updated, conn)
+        index_products(created, conn, fresh=True)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def unindex_deleted_user(sender, instance, **kwargs):
+    # Their products' deletes aren't reported through catalog_changed
+    conn = connections[shard_for(instance.pk)]
+    if fts_available(conn):
+        unindex_owner(instance.pk, conn)
+
+
+# ------------------------------------------------------------------
+# Querying
+# ------------------------------------------------------------------
+def _fts_match(user_id, terms):
+    # Quote every token so user input can't inject FTS syntax; the
+    # trailing * gives prefix matching ("boo" finds "boots").
+    words = " AND ".join('"%s"*' % t for t in terms)
+    return f"owner:{_owner_token(user_id)} AND {{name description category}}: ({words})"
+
+
+def _search_fts(user, terms, offset, limit, conn):
+    sql = (
+        f"SELECT product_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+        # rowid breaks bm25 ties so OFFSET pages don't overlap or skip
+        f"ORDER BY {_BM25}, rowid LIMIT %s OFFSET %s"
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(sql, [_fts_match(user.pk, terms), limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+    by_pk = {str(p.pk): p for p in Product.objects.shard(user).filter(pk__in=ids)}
+    return [by_pk[i] for i in ids if i in by_pk]
+
+
+def _search_postgres(user, query, offset, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    vector = (
+        SearchVector("name", weight="A")
+        + SearchVector("category", weight="B")
+        + SearchVector("description", weight="C")
+    )
+    search_query = SearchQuery(query, search_type="websearch")
+    qs = (
+        Product.objects.for_user(user)
+        .annotate(rank=SearchRank(vector, search_query))
+        .filter(rank__gt=0)
+        .order_by("-rank", "name", "id")
+    )
+    return list(qs[offset : offset + limit])
+
+
+def _search_fallback(user, terms, offset, limit):
+    qs = Product.objects.for_user(user)
+    for term in terms:
+        qs = qs.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) | Q(category__icontains=term)
+        )
+    return list(qs.order_by("-is_featured", "name", "id")[offset : offset + limit])
+
+
+def search_products(user, query, page=1, limit=20):
+    """
+    Return `(products, has_next)` for one page of ranked results.
+    Fetches one extra row to know whether a next page exists.
+    """
+    terms = _TOKEN_RE.findall(query or "")
+    if not terms:
+        return [], False
+    offset = (page - 1) * limit
+    conn = connections[shard_for(user.pk)]
+    if fts_available(conn):
+        try:
+            rows = _search_fts(user, terms, offset, limit + 1, conn)
+        except OperationalError:
+            rows = _search_fallback(user, terms, offset, limit + 1)
+    elif conn.vendor == "postgresql":
+        rows = _search_postgres(user, query, offset, limit + 1)
+    else:
+        rows = _search_fallback(user, terms, offset, limit + 1)
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,392 @@
+# main/shards.py
+import hashlib
+import time
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+# ------------------------------------------------------------------
+# Per-merchant sharding of the catalog tables
+#
+# With SHARD_DATABASES configured, every row of a model whose default
+# manager is a ShardedManager (Product and the per-user tables that
+# are written in the same transactions) lives on one shard per
+# merchant. Users, sessions and the ShardAssignment map stay on the
+# primary. Shards only add write capacity when they sit on separate
+# disks or hosts: SQLite files on one machine share its CPU and fsyncs,
+# and load tests there showed no more writes per second than one file.
+#
+# A merchant's shard is picked once, by a jump consistent hash of the
+# user id, and recorded in ShardAssignment by their first catalog write;
+# reads for a merchant without one go to the hashed shard, which holds
+# nothing of theirs yet, and never write. Lookups are cached per
+# process for SHARD_MAP_TTL seconds. Adding a shard therefore moves
+# nobody by itself: `manage.py rebalance_shards` moves the ~1/N of
+# merchants the hash now places elsewhere, one at a time, while the
+# site keeps serving them (see move_merchant()).
+#
+# Code that knows the merchant goes through the manager:
+# Product.objects.for_user(user), .shard(user). Saves and deletes of
+# loaded rows are routed by ShardRouter from the instance. Reads that
+# span merchants (the public list/detail/batch endpoints) query each
+# shard in turn via on_each_shard() / locate().
+#
+# Without SHARD_DATABASES nothing is bound: querysets go through the
+# routers exactly as before, so replica reads keep working.
+# ------------------------------------------------------------------
+PRIMARY = "default"
+
+# Placement cache: user_id -> (alias, moving, expires, assigned)
+_placements = {}
+_MAX_PLACEMENTS = 100_000
+
+
+class ShardMoving(Exception):
+    """A write for a merchant whose rows are being moved between shards."""
+
+
+def shard_databases():
+    return list(getattr(settings, "SHARD_DATABASES", None) or [PRIMARY])
+
+
+def sharded():
+    return bool(getattr(settings, "SHARD_DATABASES", None))
+
+
+def _jump_hash(key, buckets):
+    # Lamping & Veach: growing `buckets` by one remaps only 1/buckets of keys
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def home_shard(user_id):
+    """The shard the hash places `user_id` on among the configured shards."""
+    shards = shard_databases()
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return shards[_jump_hash(int.from_bytes(digest, "big"), len(shards))]
+
+
+def _placement(user_id, for_write=False):
+    from .models import ShardAssignment
+
+    now = time.monotonic()
+    cached = _placements.get(user_id)
+    if cached is None or cached[2] < now or (for_write and not cached[3]):
+        assignments = ShardAssignment.objects.using(PRIMARY)
+        row = assignments.filter(user_id=user_id).values_list("alias", "moving").first()
+        if row is None and for_write:
+            assignment, _ = assignments.get_or_create(
+                user_id=user_id, defaults={"alias": home_shard(user_id)}
+            )
+            row = (assignment.alias, assignment.moving)
+        alias, moving = row or (home_shard(user_id), False)
+        if len(_placements) >= _MAX_PLACEMENTS:
+            _placements.clear()
+        cached = _placements[user_id] = (
+            alias,
+            moving,
+            now + getattr(settings, "SHARD_MAP_TTL", 5),
+            row is not None,
+        )
+    return cached
+
+
+def forget(user_id):
+    _placements.pop(user_id, None)
+
+
+def shard_for(user_id, for_write=False):
+    """
+    The database alias holding `user_id`'s catalog rows. Raises
+    ShardMoving for a write while the merchant is being moved.
+    """
+    if not sharded():
+        return PRIMARY
+    if user_id is None:
+        return shard_databases()[0]
+    alias, moving, _, _ = _placement(user_id, for_write)
+    if for_write and moving:
+        raise ShardMoving(f"User {user_id} is moving off {alias}")
+    return alias
+
+
+async def ashard_for(user_id, for_write=False):
+    """shard_for() that does its lookup off the event loop."""
+    if sharded() and user_id is not None:
+        cached = _placements.get(user_id)
+        if cached is None or cached[2] < time.monotonic() or (for_write and not cached[3]):
+            await sync_to_async(_placement)(user_id, for_write)
+    return shard_for(user_id, for_write=for_write)
+
+
+def _user_id(user):
+    return getattr(user, "pk", user)
+
+
+def is_sharded(model):
+    """Whether `model` (a class or instance) lives on the catalog shards."""
+    return isinstance(model._meta.default_manager, ShardedManager)
+
+
+def _user_models():
+    from django.apps import apps
+
+    return [
+        model
+        for model in apps.get_app_config("main").get_models()
+        if is_sharded(model) and any(f.name == "user" for f in model._meta.fields)
+    ]
+
+
+# ------------------------------------------------------------------
+# Manager and router
+# ------------------------------------------------------------------
+class ShardedManager(models.Manager):
+    def shard(self, user, for_write=False):
+        """All rows on `user`'s shard (a User or a user id)."""
+        qs = self.get_queryset()
+        if sharded():
+            qs = qs.using(shard_for(_user_id(user), for_write=for_write))
+        return qs
+
+    async def ashard(self, user, for_write=False):
+        qs = self.get_queryset()
+        if sharded():
+            qs = qs.using(await ashard_for(_user_id(user), for_write=for_write))
+        return qs
+
+    def create(self, **kwargs):
+        # QuerySet.create() saves to the queryset's database, which the
+        # router picks without seeing the instance; route by its user
+        if not sharded():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+    async def acreate(self, **kwargs):
+        if not sharded():
+            return await super().acreate(**kwargs)
+        return await sync_to_async(self.create)(**kwargs)
+
+    def for_user(self, user):
+        """`user`'s own rows, on their shard."""
+        return self.shard(user).filter(user=user)
+
+    async def afor_user(self, user):
+        return (await self.ashard(user)).filter(user=user)
+
+    def on_each_shard(self):
+        """One queryset per shard, for reads that span merchants."""
+        if not sharded():
+            # Bound now, like the single-database path always was
+            return [self.using(router.db_for_read(self.model))]
+        return [self.using(alias) for alias in shard_databases()]
+
+    def locate(self, user=None, **lookup):
+        """get(**lookup) from whichever shard has the row, `user`'s first."""
+        aliases = shard_databases() if sharded() else [None]
+        if user is not None and sharded():
+            mine = shard_for(_user_id(user))
+            aliases.sort(key=lambda alias: alias != mine)
+        for alias in aliases:
+            try:
+                return self.using(alias).get(**lookup)
+            except self.model.DoesNotExist:
+                continue
+        raise self.model.DoesNotExist(
+            f"{self.model._meta.object_name} matching query does not exist."
+        )
+
+    async def aexists_anywhere(self, **lookup):
+        for qs in self.on_each_shard():
+            if await qs.filter(**lookup).aexists():
+                return True
+        return False
+
+
+class ShardRouter:
+    """Sends saves and deletes of loaded catalog rows to their merchant's shard."""
+
+    def _route(self, model, hints, for_write):
+        if not sharded():
+            return None
+        instance = hints.get("instance")
+        if is_sharded(model):
+            if instance is not None and hasattr(instance, "user_id"):
+                return shard_for(instance.user_id, for_write=for_write)
+            return None
+        # product.user and friends: users live on the primary only
+        if instance is not None and is_sharded(instance):
+            return PRIMARY
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints, for_write=False)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints, for_write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Catalog rows point at users on the primary (no FK constraint)
+        if sharded() and (is_sharded(obj1) or is_sharded(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name == "shardassignment":
+            return db == PRIMARY
+        return None
+
+
+# ------------------------------------------------------------------
+# Moving a merchant
+#
+# 1. Mark the assignment `moving` and wait `grace` seconds (at least
+#    SHARD_MAP_TTL) so every process refuses the merchant's writes.
+# 2. Copy their rows to the target in one transaction. Reads are still
+#    served from the source meanwhile.
+# 3. Point the assignment at the target, still `moving`, and wait
+#    again so no process reads or writes the source any more.
+# 4. Clear `moving` and delete the rows from the source.
+#
+# Writes are refused (503, see ShardMoveMiddleware) for two grace
+# periods plus the copy. The target's change counter is raised to the
+# source's, so sync cursors the merchant's clients hold stay valid:
+# products keep their change_seq, and tombstones are renumbered above
+# both counters (surrogate ids are re-assigned by the target).
+# ------------------------------------------------------------------
+def _assigned(user_id):
+    from .models import ShardAssignment
+
+    return (
+        ShardAssignment.objects.using(PRIMARY)
+        .filter(pk=user_id)
+        .values_list("alias", "moving")
+        .first()
+    )
+
+
+def _update_assignment(user_id, **fields):
+    from .models import ShardAssignment
+
+    ShardAssignment.objects.using(PRIMARY).filter(pk=user_id).update(
+        updated_at=timezone.now(), **fields
+    )
+    forget(user_id)
+
+
+def purge(alias, user_id):
+    """Delete `user_id`'s catalog rows on `alias`, without per-row signals."""
+    from .search import fts_available, unindex_owner
+
+    conn = connections[alias]
+    quote = conn.ops.quote_name
+    with transaction.atomic(using=alias):
+        with conn.cursor() as cursor:
+            for model in _user_models():
+                column = model._meta.get_field("user").column
+                cursor.execute(
+                    f"DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} = %s",
+                    [user_id],
+                )
+        if fts_available(conn):
+            unindex_owner(user_id, conn)
+
+
+def _copy(user_id, source, target, batch_size):
+    from .changes import _allocate
+    from .models import ChangeSequence, Product, ProductTombstone
+    from .search import fts_available, index_products
+
+    purge(target, user_id)  # leftovers of an interrupted move
+    index = fts_available(connections[target])
+    copied = 0
+    with transaction.atomic(using=target):
+        # Raising compacted_through too makes the target refuse cursors
+        # older than the source's horizon, whose tombstones are gone
+        counter = (
+            ChangeSequence.objects.using(source)
+            .filter(pk=1)
+            .values("last_seq", "compacted_through")
+            .first()
+        )
+        if counter:
+            ChangeSequence.objects.using(target).get_or_create(pk=1)
+            ChangeSequence.objects.using(target).filter(pk=1).update(
+                last_seq=Greatest(F("last_seq"), counter["last_seq"]),
+                compacted_through=Greatest(F("compacted_through"), counter["compacted_through"]),
+            )
+
+        for model in _user_models():
+            surrogate = isinstance(model._meta.pk, models.AutoField)
+            rows = (
+                model._base_manager.using(source)
+                .filter(user_id=user_id)
+                .order_by("seq" if model is ProductTombstone else "pk")
+                .iterator(chunk_size=batch_size)
+            )
+            while chunk := list(islice(rows, batch_size)):
+                if surrogate:
+                    # The target numbers its own rows; ids from the source collide
+                    for row in chunk:
+                        row.pk = None
+                if model is ProductTombstone:
+                    # Tombstone seqs are unique per shard, so they are drawn
+                    # again, in order, above every cursor the merchant's
+                    # clients hold. Those clients get these deletes once more.
+                    seqs = _allocate(target, len(chunk))
+                    for row in chunk:
+                        row.seq = next(seqs)
+                # auto_now fields are re-stamped; clients just revalidate once
+                model._base_manager.using(target).bulk_create(chunk)
+                if model is Product:
+                    copied += len(chunk)
+                    if index:
+                        index_products(chunk, connections[target], fresh=True)
+    return copied
+
+
+def move_merchant(user_id, target, grace, batch_size=500):
+    """Move `user_id`'s catalog rows to shard `target`; return the products moved."""
+    _placement(user_id, for_write=True)  # make sure an assignment exists
+    source, moving = _assigned(user_id)
+    if source == target:
+        if moving:
+            _update_assignment(user_id, moving=False)  # finish an interrupted move
+        return 0
+
+    _update_assignment(user_id, moving=True)
+    time.sleep(grace)
+    try:
+        copied = _copy(user_id, source, target, batch_size)
+    except BaseException:
+        _update_assignment(user_id, moving=False)  # the source is still authoritative
+        raise
+    _update_assignment(user_id, alias=target)
+    time.sleep(grace)
+    _update_assignment(user_id, moving=False)
+    purge(source, user_id)
+    return copied
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def purge_deleted_user(sender, instance, **kwargs):
+    # The ORM cascade only reaches rows on the user's own database
+    if not sharded():
+        return
+    assigned = _assigned(instance.pk)
+    if assigned and assigned[0] != PRIMARY:
+        purge(assigned[0], instance.pk)
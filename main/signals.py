@@ -0,0 +1,107 @@
+# main/signals.py
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Product
+
+
+# ------------------------------------------------------------------
+# One signal for "a user's catalog changed"
+#
+# Sent after single-row saves/deletes (via post_save/post_delete below)
+# and once per user per batch inside batched_catalog_changes(), in both
+# cases inside the write's own transaction (products deleted along with
+# their owner are not reported: nobody is left to sync them to, and the
+# owner's derived rows go with the user): receivers that maintain
+# derived rows (search index, facets, change feed) commit or roll back
+# with it, and anything visible outside the database (cache versions,
+# SSE fan-out) waits for transaction.on_commit(). Receivers get:
+#   user_id  - owner of the touched products (may be None)
+#   created  - list of new Product instances
+#   updated  - list of changed Product instances
+#   deleted  - list of deleted product pks (as strings)
+#   previous - {pk: (category, is_featured)} as stored before the write,
+#              for the updated/deleted rows whose stored values are known
+#   batched  - True when sent by batched_catalog_changes()
+# ------------------------------------------------------------------
+catalog_changed = Signal()
+
+_batch = threading.local()
+
+
+def notify_catalog_changed(user_id, created=(), updated=(), deleted=(), previous=None):
+    pending = getattr(_batch, "pending", None)
+    if pending is None:
+        catalog_changed.send(
+            sender=Product,
+            user_id=user_id,
+            created=list(created),
+            updated=list(updated),
+            deleted=list(deleted),
+            previous=dict(previous or {}),
+            batched=False,
+        )
+        return
+    changes = pending.setdefault(
+        user_id, {"created": [], "updated": [], "deleted": [], "previous": {}}
+    )
+    changes["created"].extend(created)
+    changes["updated"].extend(updated)
+    changes["deleted"].extend(deleted)
+    for pk, facet in (previous or {}).items():
+        changes["previous"].setdefault(pk, facet)  # the state before the batch
+
+
+@contextmanager
+def batched_catalog_changes():
+    """
+    Coalesce catalog_changed into one send per user, emitted when the
+    block exits cleanly. Open it *inside* the batch's
+    transaction.atomic() so the receivers' writes commit with it.
+    """
+    if getattr(_batch, "pending", None) is not None:
+        yield
+        return
+    _batch.pending = {}
+    try:
+        yield
+        pending = _batch.pending
+    finally:
+        _batch.pending = None
+    for user_id, changes in pending.items():
+        catalog_changed.send(sender=Product, user_id=user_id, batched=True, **changes)
+
+
+def _stored(instance):
+    # Set by Product.from_db() and after each save below
+    stored = getattr(instance, "_stored_facet", None)
+    return {str(instance.pk): stored} if stored else {}
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    if created:
+        notify_catalog_changed(instance.user_id, created=[instance])
+    else:
+        notify_catalog_changed(instance.user_id, updated=[instance], previous=_stored(instance))
+    instance._stored_facet = (instance.category, instance.is_featured)
+
+
+def _owner_deleted(origin):
+    # post_delete's origin is the instance or queryset delete() was called on
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is get_user_model()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, origin=None, **kwargs):
+    if _owner_deleted(origin):
+        return
+    notify_catalog_changed(
+        instance.user_id, deleted=[str(instance.pk)], previous=_stored(instance)
+    )
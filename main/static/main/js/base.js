@@ -0,0 +1,141 @@
+// Basic CSRF helper
+function getCookie(name) {
+  const value = `; ${document.cookie}`;
+  const parts = value.split(`; ${name}=`);
+  if (parts.length === 2) return decodeURIComponent(parts.pop().split(';').shift());
+}
+const CSRF_TOKEN = getCookie('csrftoken');
+
+// Shared toast + fetch helpers
+function showToast(msg, variant = "danger") {
+  const toastEl = document.getElementById('appToast');
+  const body = document.getElementById('appToastBody');
+  body.textContent = msg;
+  toastEl.className = `toast align-items-center text-bg-${variant} border-0`;
+  new bootstrap.Toast(toastEl).show();
+}
+async function jsonFetch(url, opts = {}) {
+  const headers = opts.headers || {};
+  const method = (opts.method || 'GET').toUpperCase();
+  if (['POST','PUT','PATCH','DELETE'].includes(method)) {
+    headers['X-CSRFToken'] = CSRF_TOKEN;
+  }
+  headers['X-Requested-With'] = 'XMLHttpRequest';
+  if (opts.json) {
+    headers['Content-Type'] = 'application/json';
+    opts.body = JSON.stringify(opts.json);
+  }
+  const res = await fetch(url, { ...opts, headers, credentials: 'same-origin' });
+  let data = null;
+  try { data = await res.json(); } catch(_) {}
+  if (!res.ok) {
+    const err = (data && (data.error || JSON.stringify(data.errors || data))) || res.statusText;
+    throw new Error(err);
+  }
+  return data;
+}
+
+// Auth modals logic (form-encoded + credentials)
+document.addEventListener('DOMContentLoaded', function () {
+  const formLogin      = document.getElementById('formLogin');
+  const formRegister   = document.getElementById('formRegister');
+  const btnLogout      = document.getElementById('btn-logout');
+  const loginErrors    = document.getElementById('loginErrors');
+  const registerErrors = document.getElementById('registerErrors');
+
+  function showErrors(el, errors) {
+    if (!el) return;
+    if (!errors) {
+      el.classList.add("d-none");
+      el.innerHTML = "";
+      return;
+    }
+    el.classList.remove("d-none");
+    el.innerHTML = Object.entries(errors).map(([k,v]) =>
+      `<div><strong>${k}:</strong> ${Array.isArray(v)? v.join(", ") : v}</div>`).join("");
+  }
+
+  // LOGIN (form-encoded + credentials)
+  if (formLogin) {
+    const modalLogin = new bootstrap.Modal(document.getElementById('modalLogin'));
+    formLogin.addEventListener('submit', async (e) => {
+      e.preventDefault();
+      showErrors(loginErrors, null);
+      const formData = new FormData(formLogin);
+      const body = new URLSearchParams(formData);
+
+      try {
+        const resp = await fetch(formLogin.dataset.api, {
+          method: 'POST',
+          headers: {
+            'X-CSRFToken': CSRF_TOKEN,
+            'Accept': 'application/json',
+            'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8'
+          },
+          body,
+          credentials: 'same-origin'
+        });
+        const data = await resp.json();
+        if (!resp.ok || !data.ok) {
+          showErrors(loginErrors, data.errors || {"__all__": (data.error || "Login failed")});
+          showToast('Login failed');
+          return;
+        }
+        modalLogin.hide();
+        window.location = data.redirect || document.body.dataset.home;
+      } catch (err) {
+        showErrors(loginErrors, {"__all__":"Network error"});
+        showToast('Login network error');
+      }
+    });
+  }
+
+  // REGISTER (still form-encoded)
+  if (formRegister) {
+    const modalRegister = new bootstrap.Modal(document.getElementById('modalRegister'));
+    formRegister.addEventListener('submit', async (e) => {
+      e.preventDefault();
+      showErrors(registerErrors, null);
+      const formData = new FormData(formRegister);
+      const body = new URLSearchParams(formData);
+      try {
+        const resp = await fetch(formRegister.dataset.api, {
+          method: 'POST',
+          headers: {
+            'X-CSRFToken': CSRF_TOKEN,
+            'Accept': 'application/json',
+            'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8'
+          },
+          body,
+          credentials: 'same-origin'
+        });
+        const data = await resp.json();
+        if (!resp.ok || !data.ok) {
+          showErrors(registerErrors, data.errors || {"__all__":"Registration failed"});
+          showToast('Registration failed');
+          return;
+        }
+        modalRegister.hide();
+        window.location = document.body.dataset.home;
+      } catch (err) {
+        showErrors(registerErrors, {"__all__":"Network error"});
+        showToast('Registration network error');
+      }
+    });
+  }
+
+  // LOGOUT
+  if (btnLogout) {
+    btnLogout.addEventListener('click', async (e) => {
+      e.preventDefault();
+      try {
+        await fetch(btnLogout.dataset.api, {
+          method: 'POST',
+          headers: { 'X-CSRFToken': CSRF_TOKEN, 'X-Requested-With': 'XMLHttpRequest' },
+          credentials: 'same-origin'
+        });
+      } catch(_) {}
+      window.location.reload();
+    });
+  }
+});
@@ -0,0 +1,310 @@
+document.addEventListener('DOMContentLoaded', () => {
+  // Expose loadProducts globally so base nav helpers can call it if needed
+  window.loadProducts = loadProducts;
+
+  const refreshBtn = document.getElementById('btn-refresh');
+  const loadingEl = document.getElementById('product-loading');
+  const errorEl = document.getElementById('product-error');
+  const emptyEl = document.getElementById('product-empty');
+  const ajaxGrid = document.getElementById('productGrid');
+  const serverGrid = document.querySelector('[data-server-grid]');
+  const serverEmpty = document.querySelector('[data-server-empty]');
+  const loadMoreBtn = document.getElementById('btn-load-more');
+  let nextCursor = null;
+  // Product details for the edit modal by pk; reloads and card updates
+  // drop entries that go stale
+  const details = new Map();
+  const BATCH_MAX_IDS = 100; // PRODUCT_BATCH_MAX_IDS
+
+  const addForm = document.getElementById('addProductForm');
+  const addBtn = document.getElementById('btnAddSave');
+  const editForm = document.getElementById('editProductForm');
+  const editBtn = document.getElementById('btnEditSave');
+
+  function show(el){ el && el.classList.remove('d-none'); }
+  function hide(el){ el && el.classList.add('d-none'); }
+
+  // Resized variants from the thumbnail proxy (main/thumbnails.py)
+  const CARD_IMAGE_SIZES = "(min-width: 992px) 25vw, (min-width: 768px) 33vw, (min-width: 576px) 50vw, 100vw";
+  function thumbSrcset(src, fmt) {
+    return [160, 320, 640]
+      .map(w => `/thumbnails/${w}/${fmt}/?src=${encodeURIComponent(src)} ${w}w`)
+      .join(', ');
+  }
+  function thumbHTML(p) {
+    return `
+        <picture>
+          <source type="image/webp" sizes="${CARD_IMAGE_SIZES}" srcset="${thumbSrcset(p.thumbnail, 'webp')}">
+          <img src="/thumbnails/320/jpeg/?src=${encodeURIComponent(p.thumbnail)}" sizes="${CARD_IMAGE_SIZES}"
+               srcset="${thumbSrcset(p.thumbnail, 'jpeg')}" class="card-img-top" alt="${p.name}" loading="lazy">
+        </picture>`;
+  }
+
+  function cardHTML(p) {
+    return `
+    <div class="col-12 col-sm-6 col-md-4 col-lg-3" data-pk="${p.pk}">
+      <div class="card h-100 shadow-sm">
+        ${p.thumbnail ? thumbHTML(p) : ""}
+        <div class="card-body d-flex flex-column">
+          <div class="d-flex align-items-start justify-content-between mb-2">
+            <h5 class="card-title mb-0">${p.name}</h5>
+            ${p.is_featured ? `<span class="badge badge-featured">Featured</span>` : ""}
+          </div>
+          <p class="card-text text-muted small flex-grow-1">${(p.description || "").slice(0,120)}</p>
+          <div class="d-flex justify-content-between align-items-center mb-2">
+            <span class="badge text-bg-secondary">${p.category || ''}</span>
+            <span class="price">Rp${p.price}</span>
+          </div>
+          <div class="d-flex gap-2">
+            <a class="btn btn-outline-secondary btn-sm" href="${p.detail_url}">Detail</a>
+            <button class="btn btn-outline-primary btn-sm btn-edit" data-pk="${p.pk}">Edit</button>
+            <button class="btn btn-outline-danger btn-sm btn-delete" data-pk="${p.pk}">Delete</button>
+          </div>
+        </div>
+      </div>
+    </div>`;
+  }
+
+  function getQueryParam(name){
+    const params = new URLSearchParams(window.location.search);
+    return params.get(name);
+  }
+
+  function listURL(cursor) {
+    const category = getQueryParam('category');
+    const url = new URL(ajaxGrid.dataset.listUrl, window.location.origin);
+    if (category) url.searchParams.set("category", category);
+    if (cursor) url.searchParams.set("cursor", cursor);
+    return url.toString();
+  }
+
+  function setNextCursor(cursor) {
+    nextCursor = cursor || null;
+    if (nextCursor) show(loadMoreBtn); else hide(loadMoreBtn);
+  }
+
+  async function loadMore() {
+    if (!nextCursor) return;
+    loadMoreBtn.disabled = true;
+    try {
+      const data = await jsonFetch(listURL(nextCursor));
+      ajaxGrid.insertAdjacentHTML('beforeend', (data.products || []).map(cardHTML).join(''));
+      setNextCursor(data.next);
+    } catch (err) {
+      showToast("Load more failed: " + err.message);
+    } finally {
+      loadMoreBtn.disabled = false;
+    }
+  }
+
+  async function loadProducts() {
+    details.clear();
+
+    // Hide server fallback when AJAX active
+    hide(serverGrid);
+    hide(serverEmpty);
+
+    hide(errorEl); hide(emptyEl); hide(ajaxGrid);
+    setNextCursor(null);
+    show(loadingEl);
+
+    try {
+      const data = await jsonFetch(listURL());
+      const list = data.products || [];
+      ajaxGrid.innerHTML = list.map(cardHTML).join('');
+      setNextCursor(data.next);
+      hide(loadingEl);
+      if (!list.length) {
+        show(emptyEl);
+      } else {
+        show(ajaxGrid);
+      }
+    } catch (err) {
+      hide(loadingEl); hide(ajaxGrid); hide(emptyEl);
+      errorEl.textContent = "Failed to load products: " + err.message;
+      show(errorEl);
+      showToast("Load products failed");
+    }
+  }
+
+  // Grid patches shared by the local handlers and the event stream;
+  // both may report the same change, so each is idempotent.
+  function findCard(pk) {
+    return ajaxGrid.querySelector(`[data-pk="${pk}"]`) ||
+           document.querySelector(`[data-server-grid] [data-pk="${pk}"]`);
+  }
+
+  function upsertCard(p) {
+    details.delete(String(p.pk));
+    const category = getQueryParam('category');
+    if (category && p.category !== category) return removeCard(p.pk);
+    const card = findCard(p.pk);
+    if (card) {
+      card.outerHTML = cardHTML(p);
+    } else {
+      ajaxGrid.insertAdjacentHTML('afterbegin', cardHTML(p));
+      hide(serverGrid); hide(serverEmpty); hide(emptyEl);
+      show(ajaxGrid);
+    }
+  }
+
+  function removeCard(pk) {
+    details.delete(String(pk));
+    const card = findCard(pk);
+    if (card) card.remove();
+    if (!ajaxGrid.querySelector('[data-pk]') && !document.querySelector('[data-server-grid] [data-pk]')) {
+      show(emptyEl);
+    }
+  }
+
+  // Live updates from other tabs and devices (ASGI only; a 204 from a
+  // WSGI server closes the stream for good). EventSource reconnects
+  // on its own and resumes from the last event id.
+  if (window.EventSource) {
+    const events = new EventSource(ajaxGrid.dataset.eventsUrl);
+    const upsert = (e) => upsertCard(JSON.parse(e.data));
+    events.addEventListener('created', upsert);
+    events.addEventListener('updated', upsert);
+    events.addEventListener('deleted', (e) => removeCard(JSON.parse(e.data).pk));
+    events.addEventListener('reset', () => loadProducts());
+  }
+
+  if (refreshBtn) refreshBtn.addEventListener('click', loadProducts);
+  if (loadMoreBtn) loadMoreBtn.addEventListener('click', loadMore);
+
+  // ADD
+  if (addForm && addBtn) {
+    addForm.addEventListener('submit', async (e) => {
+      e.preventDefault();
+      addBtn.disabled = true;
+        const originalText = addBtn.textContent;
+      addBtn.textContent = 'Saving...';
+      const formData = new FormData(addForm);
+      // Mark this as AJAX
+      try {
+        const resp = await fetch(addForm.action, {
+          method: 'POST',
+          headers: { 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': CSRF_TOKEN },
+          body: formData
+        });
+        const data = await resp.json();
+        if (!resp.ok || !data.ok) {
+          showToast('Add failed', 'danger');
+          if (data.errors) console.error(data.errors);
+        } else {
+          upsertCard(data.product);
+          addForm.reset();
+          bootstrap.Modal.getInstance(document.getElementById('modalAdd')).hide();
+          showToast('Product added', 'success');
+        }
+      } catch (err) {
+        showToast('Network error while adding', 'danger');
+      } finally {
+        addBtn.disabled = false;
+        addBtn.textContent = originalText;
+      }
+    });
+  }
+
+  // Edit-modal prefill: the first Edit click fetches every card on
+  // screen in one batch request, so later clicks need no round trip
+  async function loadDetails(pk) {
+    if (!details.has(pk)) {
+      const onScreen = [...document.querySelectorAll('.btn-edit[data-pk]')]
+        .map((b) => b.dataset.pk)
+        .filter((id) => id !== pk && !details.has(id));
+      const ids = [pk, ...new Set(onScreen)].slice(0, BATCH_MAX_IDS);
+      const res = await fetch(`/products/json/batch/?ids=${ids.join(',')}`, { headers: { 'X-Requested-With': 'XMLHttpRequest' }});
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      // A Django serialization list
+      for (const item of await res.json()) {
+        details.set(String(item.pk), { pk: item.pk, ...item.fields });
+      }
+    }
+    if (!details.has(pk)) throw new Error('product not found');
+    return details.get(pk);
+  }
+
+  // EDIT open (prefill)
+  document.body.addEventListener('click', async (e) => {
+    const btn = e.target.closest('.btn-edit');
+    if (!btn) return;
+    const pk = btn.dataset.pk;
+    try {
+      const obj = await loadDetails(pk);
+      document.getElementById('edit_pk').value = obj.pk || pk;
+      document.getElementById('edit_name').value = obj.name || '';
+      document.getElementById('edit_price').value = obj.price ?? '';
+      document.getElementById('edit_description').value = obj.description || '';
+      document.getElementById('edit_thumbnail').value = obj.thumbnail || '';
+      document.getElementById('edit_category').value = obj.category || '';
+      document.getElementById('edit_is_featured').checked = !!obj.is_featured;
+
+      // Set form action to edit URL
+      editForm.action = `/products/${pk}/edit/`;
+
+      new bootstrap.Modal(document.getElementById('modalEdit')).show();
+    } catch (err) {
+      showToast('Failed to load product: ' + err.message);
+    }
+  });
+
+  // EDIT submit
+  if (editForm && editBtn) {
+    editForm.addEventListener('submit', async (e) => {
+      e.preventDefault();
+      editBtn.disabled = true;
+      const originalText = editBtn.textContent;
+      editBtn.textContent = 'Saving...';
+      const pk = document.getElementById('edit_pk').value;
+      const formData = new FormData(editForm);
+      try {
+        const resp = await fetch(editForm.action, {
+          method: 'POST',
+          headers: { 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': CSRF_TOKEN },
+          body: formData
+        });
+        const data = await resp.json();
+        if (!resp.ok || !data.ok) {
+          showToast('Update failed', 'danger');
+          if (data.errors) console.error(data.errors);
+        } else {
+          upsertCard(data.product);
+          bootstrap.Modal.getInstance(document.getElementById('modalEdit')).hide();
+          showToast('Product updated', 'success');
+        }
+      } catch (err) {
+        showToast('Network error while updating', 'danger');
+      } finally {
+        editBtn.disabled = false;
+        editBtn.textContent = originalText;
+      }
+    });
+  }
+
+  // DELETE
+  document.body.addEventListener('click', async (e) => {
+    const btn = e.target.closest('.btn-delete');
+    if (!btn) return;
+    const pk = btn.dataset.pk;
+    if (!confirm('Delete this product?')) return;
+    try {
+      const resp = await fetch(`/products/${pk}/delete/`, {
+        method: 'POST',
+        headers: { 'X-Requested-With': 'XMLHttpRequest', 'X-CSRFToken': CSRF_TOKEN }
+      });
+      const data = await resp.json();
+      if (!resp.ok || !data.ok) {
+        showToast('Delete failed', 'danger');
+      } else {
+        removeCard(pk);
+        showToast('Product deleted', 'success');
+      }
+    } catch (err) {
+        showToast('Network error while deleting', 'danger');
+    }
+  });
+
+  // Initial load (replaces server-rendered fallback)
+  loadProducts();
+});
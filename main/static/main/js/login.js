@@ -0,0 +1,7 @@
+document.addEventListener('DOMContentLoaded', function () {
+  const el = document.getElementById('modalLogin');
+  if (el && window.bootstrap) {
+    const m = new bootstrap.Modal(el);
+    m.show(); // auto-open the login modal
+  }
+});
@@ -0,0 +1,31 @@
+# main/storage.py
+import logging
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+from .thumbnails import ThumbnailError, prerender
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+logger = logging.getLogger(__name__)
+
+
+class ManifestStaticStorage(CompressedManifestStaticFilesStorage):
+    """
+    WhiteNoise's hashed + gzip/brotli storage. collectstatic also renders
+    the thumbnail variants (main/thumbnails.py) of every static image,
+    so products pointing at bundled images never render on first view.
+    An image that can't be rendered is logged and left to render on
+    demand instead of failing the whole collectstatic.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in paths:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                try:
+                    prerender(name)
+                except ThumbnailError as exc:
+                    logger.warning("Skipping thumbnails of %s: %s", name, exc)
@@ -0,0 +1,68 @@
+# main/streaming.py
+from itertools import chain, islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import serializers
+
+
+# ------------------------------------------------------------------
+# Streaming exports that keep the exact Django serializer output
+#
+# The queryset is read with .iterator() and serialized one chunk at a
+# time. Each chunk is serialized with the stock serializer and its
+# document wrapper ("[...]" for JSON, "<django-objects>...</...>" for
+# XML) is stripped, so the concatenated stream is byte-for-byte what
+# serializers.serialize() would have produced for the whole queryset.
+# A list of querysets (one per shard) is read one after the other.
+#
+# Under ASGI a StreamingHttpResponse given a sync iterator reads it to
+# the end before sending anything, so ASGI views use
+# aiter_serialized(), which pulls each chunk on the request's sync
+# thread and keeps memory bounded by one chunk there too.
+# ------------------------------------------------------------------
+_SEPARATORS = {"json": ", ", "xml": ""}
+
+
+def _document_parts(fmt):
+    empty = serializers.serialize(fmt, [])
+    if fmt == "json":
+        return empty[:1], empty[1:]
+    footer = "</django-objects>"
+    return empty[: -len(footer)], footer
+
+
+def _chunks(querysets, size):
+    rows = chain.from_iterable(qs.iterator(chunk_size=size) for qs in querysets)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_serialized(fmt, queryset, chunk_size=None):
+    chunk_size = chunk_size or getattr(settings, "PRODUCT_EXPORT_CHUNK_SIZE", 500)
+    header, footer = _document_parts(fmt)
+    separator = _SEPARATORS[fmt]
+    querysets = queryset if isinstance(queryset, list) else [queryset]
+
+    yield header
+    first = True
+    for chunk in _chunks(querysets, chunk_size):
+        body = serializers.serialize(fmt, chunk)[len(header) : -len(footer)]
+        yield body if first else separator + body
+        first = False
+    yield footer
+
+
+async def aiter_serialized(fmt, queryset, chunk_size=None):
+    """iter_serialized() as an async iterator, for StreamingHttpResponse under ASGI."""
+    chunks = iter_serialized(fmt, queryset, chunk_size)
+    # Thread-sensitive, so the queryset cursor stays on one thread/connection
+    step = sync_to_async(next)
+    try:
+        while (chunk := await step(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -1,3 +1,1083 @@
-from django.test import TestCase
+"""
+Endpoint benchmark and query-count regression suite.
+
+Seeds BENCH_USERS users with BENCH_PRODUCTS products each, drives every
+route in main/urls.py through the test client BENCH_ITERATIONS times and
+compares the results with main/bench_baselines.json:
+
+  * queries - SQL statements on a cold request (empty cache); any growth
+    fails, which is how N+1 regressions show up.
+  * p95_ms  - 95th percentile latency; fails above baseline times
+    BENCH_LATENCY_TOLERANCE (default 3, since machines differ), with at
+    least BENCH_LATENCY_SLACK_MS of headroom so millisecond routes don't
+    flap.
+
+Run `BENCH_UPDATE_BASELINES=1 python manage.py test main` to rewrite
+the baselines after an intentional change. Query counts are only
+compared when the shard count matches the one the baselines were
+recorded with, latency only when the seed size matches too.
+
+Below the benchmark, one focused TestCase per feature pins down its
+behaviour (responses, 304s, sync feed, shards, ...). The catalog tests
+run against whichever databases are configured, so run the suite once
+more with `SQLITE_SHARDS=/tmp/s0.sqlite3,/tmp/s1.sqlite3` to cover the
+sharded paths; ShardMoveTests needs two shards and is skipped otherwise.
+"""
+import asyncio
+import gc
+import io
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate, get_user
+from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.conf import settings
+from django.db import connections, transaction
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from main import passwords, routers, shards, throttle, thumbnails
+from main import urls as main_urls
+from main.bulk import bulk_create_products, bulk_delete_products
+from main.cache import cached_catalog
+from main.changes import compact_tombstones
+from main.facets import refresh_category_facets
+from main.models import (
+    CategoryFacet,
+    ChangeSequence,
+    Product,
+    ProductImport,
+    ProductTombstone,
+    ShardAssignment,
+)
+from main.pagination import encode_cursor
+from main.product_io import FORMATS, export_products, import_products, read_rows
+from main.search import search_products
+from main.storage import ManifestStaticStorage
+from PIL import Image
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+BASELINES_PATH = Path(__file__).resolve().parent / "bench_baselines.json"
+
+BENCH_USERS = int(os.getenv("BENCH_USERS", "3"))
+BENCH_PRODUCTS = int(os.getenv("BENCH_PRODUCTS", "200"))
+BENCH_ITERATIONS = int(os.getenv("BENCH_ITERATIONS", "10"))
+BENCH_LATENCY_TOLERANCE = float(os.getenv("BENCH_LATENCY_TOLERANCE", "3"))
+BENCH_LATENCY_SLACK_MS = float(os.getenv("BENCH_LATENCY_SLACK_MS", "20"))
+BENCH_UPDATE_BASELINES = os.getenv("BENCH_UPDATE_BASELINES") == "1"
+
+PASSWORD = "bench-Passw0rd!"
+
+
+def product_data(i=0, **overrides):
+    data = {
+        "name": f"Bench product {i}",
+        "price": 100_000 + i * 1_000,
+        "description": f"Seeded product number {i}",
+        "thumbnail": f"https://example.com/img/{i}.png",
+        "category": ("boots", "balls", "gloves", "jerseys")[i % 4],
+        "is_featured": i % 5 == 0,
+    }
+    data.update(overrides)
+    return data
+
+
+# ------------------------------------------------------------------
+# How to call each route. `kwargs` / `data` / `json_body` / `setup`
+# receive the running BenchContext; `setup` runs before every
+# iteration and, like building the request, is not timed.
+# ------------------------------------------------------------------
+class Route:
+    def __init__(
+        self, method="get", kwargs=None, data=None, json_body=None, setup=None, auth=True, staff=False
+    ):
+        self.method = method
+        self.kwargs = kwargs or (lambda ctx: {})
+        self.data = data or (lambda ctx: {})
+        self.json_body = json_body
+        self.setup = setup
+        self.auth = auth
+        self.staff = staff
+
+
+class BenchContext:
+    def __init__(self, name, user, client):
+        self.name = name
+        self.user = user
+        self.client = client
+        self.counter = 0
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+    def own_product(self):
+        return Product.objects.for_user(self.user).order_by("name").first()
+
+    def fresh_product(self):
+        return Product.objects.create(user=self.user, **product_data(10_000 + self.next_id()))
+
+
+def _own_pk(ctx):
+    return {"pk": ctx.own_product().pk}
+
+
+def _own_pks(ctx):
+    pks = Product.objects.for_user(ctx.user).values_list("pk", flat=True)[:20]
+    return {"ids": ",".join(str(pk) for pk in pks)}
+
+
+def _fresh_pk(ctx):
+    return {"pk": ctx.fresh_product().pk}
+
+
+def _new_username(ctx):
+    return {"username": f"bench-new-{ctx.next_id()}", "password": PASSWORD}
+
+
+def _relogin(ctx):
+    ctx.client.force_login(ctx.user)
+
+
+ROUTES = {
+    "show_main": Route(),
+    "add_product": Route("post", data=lambda ctx: product_data(ctx.next_id())),
+    "product_detail": Route(kwargs=_own_pk),
+    "product_edit": Route("post", kwargs=_own_pk, data=lambda ctx: product_data(ctx.next_id())),
+    "product_delete": Route("post", kwargs=_fresh_pk),
+    "product_list_json": Route(),
+    "product_list_xml": Route(),
+    "product_detail_json": Route(kwargs=_own_pk),
+    "product_detail_xml": Route(kwargs=_own_pk),
+    "product_batch_json": Route(data=_own_pks),
+    "product_batch_xml": Route(data=_own_pks),
+    "product_thumbnail": Route(
+        kwargs=lambda ctx: {"width": 320, "fmt": "webp"},
+        data=lambda ctx: {"src": ctx.own_product().thumbnail},
+        auth=False,
+    ),
+    "api_product_list": Route(),
+    "api_product_facets": Route(),
+    "api_product_search": Route(data=lambda ctx: {"q": "bench product"}),
+    "api_product_changes": Route(data=lambda ctx: {"since": 1}),
+    "api_product_events": Route(),
+    "api_product_detail": Route(kwargs=_own_pk),
+    "api_product_create": Route("post", data=lambda ctx: product_data(ctx.next_id())),
+    "api_product_update": Route("post", kwargs=_own_pk, data=lambda ctx: product_data(ctx.next_id())),
+    "api_product_delete": Route("post", kwargs=_fresh_pk),
+    "api_product_bulk_create": Route(
+        "post", json_body=lambda ctx: [product_data(ctx.next_id()) for _ in range(20)]
+    ),
+    "api_product_bulk_update": Route(
+        "post",
+        json_body=lambda ctx: [
+            {"pk": str(pk), "price": ctx.next_id()}
+            for pk in Product.objects.for_user(ctx.user).values_list("pk", flat=True)[:20]
+        ],
+    ),
+    "api_product_bulk_delete": Route(
+        "post", json_body=lambda ctx: [str(ctx.fresh_product().pk) for _ in range(5)]
+    ),
+    "api_login": Route("post", data=lambda ctx: {"username": ctx.user.username, "password": PASSWORD}),
+    "api_logout": Route("post", setup=_relogin),
+    "api_register": Route("post", data=_new_username, auth=False),
+    "login": Route(auth=False),
+    "metrics": Route(staff=True),
+}
+
+
+# ------------------------------------------------------------------
+# Stands in for the remote hosts product thumbnails point at: every GET
+# returns the same JPEG (or `status`, or a redirect to `location`).
+# Point THUMBNAIL_ORIGIN at `url` to use it.
+# ------------------------------------------------------------------
+class FakeOrigin:
+    def __init__(self, size=(1200, 900), status=200, location=None):
+        out = io.BytesIO()
+        Image.new("RGB", size, (40, 120, 60)).save(out, "JPEG")
+        body = out.getvalue()
+        self.requests = 0
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                origin.requests += 1
+                if location or status != 200:
+                    self.send_response(302 if location else status)
+                    if location:
+                        self.send_header("Location", location)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _route_names():
+    return [p.name for p in main_urls.urlpatterns if isinstance(p, URLPattern)]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _load_baselines():
+    if BASELINES_PATH.exists():
+        return json.loads(BASELINES_PATH.read_text())
+    return {"config": {}, "routes": {}}
+
+
+class EndpointBenchmarkTests(TestCase):
+    # Catalog rows live on the shards when SQLITE_SHARDS is set
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        origin = cls.enterClassContext(FakeOrigin())
+        thumbnails = cls.enterClassContext(tempfile.TemporaryDirectory())
+        # The auth routes are timed on the hashing path, not the 429s
+        cls.enterClassContext(
+            override_settings(
+                THUMBNAIL_ORIGIN=origin.url,
+                THUMBNAIL_CACHE_DIR=thumbnails,
+                LOGIN_THROTTLE_ENABLED=False,
+            )
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = []
+        for u in range(BENCH_USERS):
+            user = User.objects.create_user(username=f"bench-user-{u}", password=PASSWORD)
+            bulk_create_products(
+                user, [Product(**product_data(i)) for i in range(BENCH_PRODUCTS)]
+            )
+            cls.users.append(user)
+        cls.staff = User.objects.create_user(username="bench-staff", is_staff=True)
+
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        shards._placements.clear()
+
+    def test_every_route_has_a_benchmark(self):
+        missing = sorted(set(_route_names()) - set(ROUTES))
+        self.assertEqual(missing, [], "Add these routes to ROUTES in main/tests.py")
+
+    def _request(self, route, ctx):
+        if route.setup:
+            route.setup(ctx)
+        url = reverse(f"main:{ctx.name}", kwargs=route.kwargs(ctx))
+        call = getattr(ctx.client, route.method)
+        if route.json_body:
+            args = (url, json.dumps(route.json_body(ctx)))
+            extra = {"content_type": "application/json"}
+        else:
+            args, extra = (url, route.data(ctx)), {}
+        with ExitStack() as stack:
+            # Count every database's queries, shards and replicas included
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections
+            ]
+            start = time.perf_counter()
+            response = call(*args, **extra)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        self.assertLess(response.status_code, 500, f"{ctx.name} returned {response.status_code}")
+        return elapsed * 1000, sum(len(queries) for queries in captured)
+
+    def _measure(self, name, route):
+        client = Client()
+        ctx = BenchContext(name, self.staff if route.staff else self.users[0], client)
+        if route.auth:
+            client.force_login(ctx.user)
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        # Start each route with a clean heap so a full collection that
+        # earlier routes made due doesn't land in this one's timings
+        gc.collect()
+        timings, cold_queries = [], None
+        for _ in range(BENCH_ITERATIONS):
+            elapsed, queries = self._request(route, ctx)
+            if cold_queries is None:
+                cold_queries = queries
+            timings.append(elapsed)
+        return {
+            "queries": cold_queries,
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(_percentile(timings, 95), 3),
+            "p99_ms": round(_percentile(timings, 99), 3),
+        }
+
+    def test_routes_within_baseline(self):
+        baselines = _load_baselines()
+        config = {
+            "users": BENCH_USERS,
+            "products": BENCH_PRODUCTS,
+            "shards": len(settings.SHARD_DATABASES),
+        }
+        # Cross-shard reads cost a query per shard
+        compare_queries = baselines.get("config", {}).get("shards") == config["shards"]
+        compare_latency = baselines.get("config") == config
+        results = {}
+
+        for name in _route_names():
+            route = ROUTES.get(name)
+            if route is None:
+                continue
+            results[name] = result = self._measure(name, route)
+            baseline = baselines["routes"].get(name)
+            if BENCH_UPDATE_BASELINES:
+                continue
+            with self.subTest(route=name):
+                self.assertIsNotNone(
+                    baseline, "No baseline; run with BENCH_UPDATE_BASELINES=1 and commit it"
+                )
+                if compare_queries:
+                    self.assertLessEqual(
+                        result["queries"], baseline["queries"], f"{name}: query count grew"
+                    )
+                if compare_latency:
+                    limit = max(
+                        baseline["p95_ms"] * BENCH_LATENCY_TOLERANCE,
+                        baseline["p95_ms"] + BENCH_LATENCY_SLACK_MS,
+                    )
+                    self.assertLessEqual(
+                        result["p95_ms"], limit, f"{name}: p95 {result['p95_ms']}ms > {limit:.1f}ms"
+                    )
+
+        if BENCH_UPDATE_BASELINES:
+            BASELINES_PATH.write_text(
+                json.dumps({"config": config, "routes": results}, indent=2, sort_keys=True) + "\n"
+            )
+
+
+# ------------------------------------------------------------------
+# Behaviour
+# ------------------------------------------------------------------
+class CatalogTestCase(TestCase):
+    """A merchant with a few products and a logged-in client."""
+
+    # Catalog rows live on the shards when SQLITE_SHARDS is set
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="merchant", password=PASSWORD)
+        bulk_create_products(cls.user, [Product(**product_data(i)) for i in range(6)])
+        cls.shard = shards.shard_for(cls.user.pk)
+
+    def setUp(self):
+        caches[settings.CATALOG_CACHE_ALIAS].clear()
+        # Rolled-back tests leave user ids, and placements cached for them, behind
+        shards._placements.clear()
+        self.client.force_login(self.user)
+
+
+class ExportStreamingTests(CatalogTestCase):
+    def test_wsgi_export_streams_serializer_output(self):
+        response = self.client.get(reverse("main:product_list_json"))
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        body = b"".join(response.streaming_content).decode()
+        expected = serializers.serialize("json", chain(*Product.objects.on_each_shard()))
+        self.assertEqual(json.loads(body), json.loads(expected))
+
+    async def test_asgi_export_streams_asynchronously(self):
+        # A sync iterator would make Django buffer the whole body under ASGI
+        response = await AsyncClient().get(reverse("main:product_list_xml"))
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+        expected = await sync_to_async(serializers.serialize)(
+            "xml", chain(*Product.objects.on_each_shard())
+        )
+        self.assertEqual(body, expected)
+
+
+class ProductImportTests(CatalogTestCase):
+    def _import(self, text, fmt):
+        job = ProductImport.objects.shard(self.user, for_write=True).create(
+            user=self.user, source_name=f"export.{fmt}", source_key="k" * 64
+        )
+        return import_products(self.user, read_rows(io.StringIO(text), fmt), job, batch_size=4)
+
+    def test_reimporting_an_export_skips_existing_products(self):
+        for fmt in FORMATS:
+            with self.subTest(fmt=fmt):
+                out = io.StringIO()
+                self.assertEqual(export_products(self.user, out, fmt, chunk_size=4), 6)
+                job = self._import(out.getvalue(), fmt)
+                self.assertEqual((job.created_count, job.failed_count, job.skipped_count), (0, 0, 6))
+                self.assertEqual(Product.objects.for_user(self.user).count(), 6)
+
+    def test_ids_of_other_catalogs_are_new_products(self):
+        other = User.objects.create_user(username="other")
+        theirs = Product.objects.create(user=other, **product_data(80))
+        row = json.dumps({"id": str(theirs.pk), **product_data(80)})
+        job = self._import(row + "\n", "ndjson")
+        self.assertEqual((job.created_count, job.skipped_count), (1, 0))
+        mine = Product.objects.for_user(self.user).get(name=theirs.name)
+        self.assertNotEqual(mine.pk, theirs.pk)
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def _names(self):
+        response = self.client.get(reverse("main:api_product_list"))
+        return sorted(p["name"] for p in response.json()["products"])
+
+    def test_cached_until_a_write_bumps_the_version(self):
+        before = self._names()
+        # QuerySet.update() sends no catalog_changed, so the cache can't know
+        Product.objects.for_user(self.user).update(name="Renamed")
+        self.assertEqual(self._names(), before)
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True) as callbacks:
+            Product.objects.for_user(self.user).first().save()
+            # The version only moves once the write commits
+            self.assertEqual(self._names(), before)
+        self.assertTrue(callbacks)
+        self.assertEqual(self._names(), ["Renamed"] * 6)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    def test_disabled_cache_always_builds_fresh(self):
+        self._names()
+        Product.objects.for_user(self.user).update(name="Renamed")
+        self.assertEqual(self._names(), ["Renamed"] * 6)
+
+
+class ReplicaCacheTests(CatalogTestCase):
+    def _read(self, pinned, build):
+        token = routers.begin_request(time.time() + 60 if pinned else 0)
+        try:
+            with routers.replica_scope():
+                return cached_catalog(self.user.pk, "products", {}, build)
+        finally:
+            routers.end_request(token)
+
+    @override_settings(REPLICA_DATABASES=["replica0"])
+    def test_replica_body_never_reaches_a_pinned_client(self):
+        # Another session reads a lagging replica after the write's bump
+        self.assertEqual(self._read(False, lambda: "stale"), "stale")
+        self.assertEqual(self._read(False, lambda: "unused"), "stale")
+        # The writer is pinned to the primary and must not get it
+        self.assertEqual(self._read(True, lambda: "fresh"), "fresh")
+        self.assertEqual(self._read(True, lambda: "unused"), "fresh")
+
+
+class ConditionalGetTests(CatalogTestCase):
+    LATER = "Sun, 01 Jan 2090 00:00:00 GMT"
+
+    def test_list_etag_revalidates(self):
+        for name in ("api_product_list", "product_list_json"):
+            with self.subTest(route=name):
+                url = reverse(f"main:{name}")
+                etag = self.client.get(url)["ETag"]
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                product = Product.objects.create(user=self.user, **product_data(99))
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+                product.delete()
+
+    def test_list_delete_is_not_hidden_by_if_modified_since(self):
+        for name in ("api_product_list", "product_list_json"):
+            with self.subTest(route=name):
+                url = reverse(f"main:{name}")
+                response = self.client.get(url)
+                # MAX(updated_at) can't see deletes, so lists send no Last-Modified
+                self.assertFalse(response.has_header("Last-Modified"))
+                etag = response["ETag"]
+                Product.objects.for_user(self.user).first().delete()
+                for headers in ({"HTTP_IF_MODIFIED_SINCE": self.LATER}, {"HTTP_IF_NONE_MATCH": etag}):
+                    self.assertEqual(self.client.get(url, **headers).status_code, 200)
+
+    def test_detail_last_modified(self):
+        product = Product.objects.for_user(self.user).first()
+        url = reverse("main:api_product_detail", kwargs={"pk": product.pk})
+        last_modified = self.client.get(url)["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+            product.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 404)
+
+
+class CategoryFacetTests(CatalogTestCase):
+    def _facets(self):
+        return {
+            f.category: (f.product_count, f.featured_count)
+            for f in CategoryFacet.objects.for_user(self.user)
+        }
+
+    def _rebuilt(self):
+        return {
+            f.category: (f.product_count, f.featured_count)
+            for f in refresh_category_facets(self.user.pk)
+        }
+
+    def test_single_writes_update_counts_without_regrouping(self):
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            product = Product.objects.create(
+                user=self.user, **product_data(50, category="socks", is_featured=True)
+            )
+            product.category = "boots"
+            product.is_featured = False
+            product.save()
+            Product.objects.for_user(self.user).filter(category="balls").first().delete()
+        self.assertFalse(any("GROUP BY" in q["sql"] for q in queries.captured_queries))
+        facets = self._facets()
+        self.assertNotIn("socks", facets)  # emptied rows are dropped
+        self.assertEqual(facets, self._rebuilt())
+
+    def test_loaded_product_moves_between_categories(self):
+        product = Product.objects.for_user(self.user).filter(category="boots", is_featured=True).get()
+        product.category = "gloves"
+        product.save()
+        self.assertEqual(self._facets()["boots"], (1, 0))
+        self.assertEqual(self._facets()["gloves"], (2, 1))
+        self.assertEqual(self._facets(), self._rebuilt())
+
+    def test_bulk_writes_rebuild(self):
+        bulk_create_products(self.user, [Product(**product_data(i, category="socks")) for i in range(3)])
+        bulk_delete_products(
+            self.user, [str(pk) for pk in Product.objects.for_user(self.user).filter(category="boots").values_list("pk", flat=True)]
+        )
+        facets = self._facets()
+        self.assertEqual(facets["socks"], (3, 1))
+        self.assertNotIn("boots", facets)
+        self.assertEqual(facets, self._rebuilt())
+
+    def test_unknown_previous_category_rebuilds(self):
+        product = Product.objects.for_user(self.user).first()
+        Product(pk=product.pk, user=self.user, **product_data(1, category="socks")).save(force_update=True)
+        self.assertEqual(self._facets(), self._rebuilt())
+
+
+class CursorPaginationTests(CatalogTestCase):
+    url = reverse("main:api_product_list")
+
+    def _walk(self, **params):
+        seen, cursor = [], None
+        while True:
+            query = {"limit": 2, **params, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get(self.url, query).json()
+            seen.extend(p["name"] for p in data["products"])
+            cursor = data["next"]
+            if not cursor:
+                return seen
+
+    def test_pages_cover_the_catalog_once_in_order(self):
+        expected = list(
+            Product.objects.for_user(self.user)
+            .order_by("-is_featured", "name", "id")
+            .values_list("name", flat=True)
+        )
+        self.assertEqual(self._walk(), expected)
+        by_price = list(
+            Product.objects.for_user(self.user).order_by("price", "id").values_list("name", flat=True)
+        )
+        self.assertEqual(self._walk(sort="price"), by_price)
+
+    def test_bad_cursors_are_rejected(self):
+        cursor = self.client.get(self.url, {"limit": 2}).json()["next"]
+        for params in ({"cursor": "not-a-cursor"}, {"cursor": cursor, "sort": "price"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()["error"], "invalid_cursor")
+
+    def test_tampered_cursors_are_rejected(self):
+        tampered = [
+            ["featured", {"a": 1}, "x", "y"],
+            ["featured", False, "x", "not-a-uuid"],
+            ["featured", None, None, None],
+            ["price", "cheap", str(uuid.uuid4())],
+        ]
+        for values in tampered:
+            cursor = encode_cursor(values)
+            response = self.client.get(self.url, {"cursor": cursor, "sort": values[0]})
+            self.assertEqual(response.status_code, 400, values)
+            self.assertEqual(response.json()["error"], "invalid_cursor")
+            # The storefront falls back to the first page
+            response = self.client.get(reverse("main:show_main"), {"cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+
+
+class BulkApiTests(CatalogTestCase):
+    def _post(self, name, items):
+        return self.client.post(
+            reverse(f"main:{name}"), json.dumps(items), content_type="application/json"
+        )
+
+    def test_create_reports_per_item_errors(self):
+        response = self._post(
+            "api_product_bulk_create", [product_data(20), {"name": "No price"}, "junk"]
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertFalse(data["ok"])
+        self.assertEqual(data["created"], 1)
+        self.assertEqual([r["ok"] for r in data["results"]], [True, False, False])
+        self.assertIn("price", data["results"][1]["errors"])
+        self.assertEqual(Product.objects.for_user(self.user).count(), 7)
+
+    def test_update_and_delete_only_touch_own_products(self):
+        other = User.objects.create_user(username="other")
+        theirs = Product.objects.create(user=other, **product_data(30))
+        mine = Product.objects.for_user(self.user).first()
+        data = self._post(
+            "api_product_bulk_update",
+            [{"pk": str(mine.pk), "price": 5}, {"pk": str(theirs.pk), "price": 5}, {"pk": "x"}],
+        ).json()
+        self.assertEqual([r["ok"] for r in data["results"]], [True, False, False])
+        self.assertEqual(data["results"][1]["error"], "not_found")
+        mine.refresh_from_db()
+        self.assertEqual(mine.price, 5)
+
+        data = self._post("api_product_bulk_delete", [str(mine.pk), str(theirs.pk)]).json()
+        self.assertEqual(data["deleted"], 1)
+        self.assertEqual([r["ok"] for r in data["results"]], [True, False])
+        self.assertTrue(Product.objects.for_user(other).filter(pk=theirs.pk).exists())
+
+    def test_malformed_bodies(self):
+        response = self.client.post(
+            reverse("main:api_product_bulk_create"), "{", content_type="application/json"
+        )
+        self.assertEqual(response.json()["error"], "invalid_json")
+        response = self._post("api_product_bulk_create", {"name": "Not a list"})
+        self.assertEqual(response.json()["error"], "expected_array")
+
+
+class SearchTests(CatalogTestCase):
+    def _search(self, q):
+        data = self.client.get(reverse("main:api_product_search"), {"q": q}).json()
+        return [p["name"] for p in data["products"]]
+
+    def test_name_matches_rank_above_description_matches(self):
+        Product.objects.create(user=self.user, **product_data(40, name="Plain", description="striker boots"))
+        Product.objects.create(user=self.user, **product_data(41, name="Striker", description="plain"))
+        self.assertEqual(self._search("striker"), ["Striker", "Plain"])
+
+    def test_prefix_match_and_owner_isolation(self):
+        other = User.objects.create_user(username="other")
+        Product.objects.create(user=other, **product_data(42, name="Bench boots"))
+        names = self._search("boo")  # prefix of "boots"
+        self.assertEqual(
+            sorted(names),
+            sorted(Product.objects.for_user(self.user).filter(category="boots").values_list("name", flat=True)),
+        )
+
+    def test_equal_scores_page_without_overlap(self):
+        twins = [
+            Product.objects.create(user=self.user, **product_data(50 + i, name="Twin", description=""))
+            for i in range(5)
+        ]
+        seen, page, has_next = [], 1, True
+        while has_next:
+            products, has_next = search_products(self.user, "twin", page=page, limit=2)
+            seen += [p.pk for p in products]
+            page += 1
+        self.assertCountEqual(seen, [p.pk for p in twins])
+
+
+class ChangeFeedTests(CatalogTestCase):
+    url = reverse("main:api_product_changes")
+
+    def _changes(self, since, **params):
+        return self.client.get(self.url, {"since": since, **params})
+
+    def test_full_then_delta_sync(self):
+        full = self._changes(0).json()
+        self.assertEqual(len(full["products"]), 6)
+        self.assertFalse(full["more"])
+        self.assertEqual(self._changes(0, limit=4).json()["more"], True)
+
+        updated, deleted = Product.objects.for_user(self.user)[:2]
+        updated.name = "Updated"
+        updated.save()
+        deleted_pk = str(deleted.pk)
+        deleted.delete()
+        delta = self._changes(full["cursor"]).json()
+        self.assertEqual([p["name"] for p in delta["products"]], ["Updated"])
+        self.assertEqual(delta["deleted"], [deleted_pk])
+        self.assertGreater(delta["cursor"], full["cursor"])
+        self.assertEqual(self._changes(delta["cursor"]).json()["products"], [])
+
+    def test_cursor_before_compaction_expires(self):
+        cursor = self._changes(0).json()["cursor"]
+        Product.objects.for_user(self.user).first().delete()
+        self.assertEqual(compact_tombstones(older_than=timedelta(0)), 1)
+        self.assertEqual(self._changes(cursor).status_code, 410)
+        self.assertEqual(self._changes("-1").status_code, 400)
+
+    def test_deleting_the_owner_leaves_no_tombstones(self):
+        Product.objects.for_user(self.user).first().delete()
+        self.user.delete()
+        for alias in shards.shard_databases():
+            for model in (Product, ProductTombstone, CategoryFacet):
+                self.assertFalse(model.objects.using(alias).exists())
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM main_product_fts")
+                self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_write_is_stamped_in_its_own_transaction(self):
+        with CaptureQueriesContext(connections[self.shard]) as queries:
+            product = Product.objects.create(user=self.user, **product_data(99))
+        sql = [q["sql"] for q in queries.captured_queries]
+        # change_seq goes out with the INSERT and the receivers share its
+        # transaction: no savepoints, no second UPDATE of the row
+        self.assertFalse([q for q in sql if "SAVEPOINT" in q or 'UPDATE "main_product"' in q])
+        self.assertEqual(
+            Product.objects.for_user(self.user).values_list("change_seq", flat=True).get(pk=product.pk),
+            ChangeSequence.objects.shard(self.user).get(pk=1).last_seq,
+        )
+
+    def test_failing_receiver_rolls_the_write_back(self):
+        last_seq = ChangeSequence.objects.shard(self.user).get(pk=1).last_seq
+        with mock.patch("main.facets.apply_facet_deltas", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError), transaction.atomic(self.shard):
+                Product.objects.create(user=self.user, **product_data(99))
+        self.assertFalse(Product.objects.for_user(self.user).filter(name="Bench product 99").exists())
+        self.assertEqual(ChangeSequence.objects.shard(self.user).get(pk=1).last_seq, last_seq)
+
+
+class EventStreamTests(CatalogTestCase):
+    url = reverse("main:api_product_events")
+
+    async def _open(self, **headers):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(self.url, headers=headers)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return response.streaming_content
+
+    async def _next(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    def test_wsgi_gets_no_stream(self):
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    async def test_replays_from_last_event_id(self):
+        cursor = await sync_to_async(self._feed_cursor)()
+        product = await (await Product.objects.afor_user(self.user)).afirst()
+        pk = str(product.pk)
+        await product.adelete()
+        stream = await self._open(**{"Last-Event-ID": str(cursor)})
+        self.assertTrue((await self._next(stream)).startswith("retry:"))
+        event = await self._next(stream)
+        self.assertIn("event: deleted", event)
+        self.assertIn(pk, event)
+        await stream.aclose()
+
+    async def test_live_events_follow_ready(self):
+        stream = await self._open()
+        await self._next(stream)  # retry
+        self.assertIn("event: ready", await self._next(stream))
+
+        def write():
+            with self.captureOnCommitCallbacks(using=self.shard, execute=True):
+                Product.objects.create(user=self.user, **product_data(60, name="Live"))
+
+        await sync_to_async(write)()
+        event = await self._next(stream)
+        self.assertIn('"name": "Live"', event)
+        await stream.aclose()
+
+    def _feed_cursor(self):
+        return self.client.get(reverse("main:api_product_changes"), {"since": 0}).json()["cursor"]
+
+
+class BatchLookupTests(CatalogTestCase):
+    url = reverse("main:product_batch_json")
+
+    def test_request_order_and_unknown_ids(self):
+        pks = [str(pk) for pk in Product.objects.for_user(self.user).values_list("pk", flat=True)[:3]][::-1]
+        unknown = str(uuid.uuid4())
+        response = self.client.get(self.url, {"ids": ",".join([pks[0], unknown, *pks[1:]])})
+        self.assertEqual([row["pk"] for row in response.json()], pks)
+
+    @override_settings(PRODUCT_BATCH_MAX_IDS=2)
+    def test_invalid_ids(self):
+        pks = [str(pk) for pk in Product.objects.for_user(self.user).values_list("pk", flat=True)[:3]]
+        for ids in ("nope", "", ",".join(pks)):
+            with self.subTest(ids=ids):
+                response = self.client.get(self.url, {"ids": ids})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()["error"], "invalid_ids")
+
+
+@override_settings(
+    LOGIN_THROTTLE_ENABLED=True,
+    LOGIN_THROTTLE_SHARED=False,
+    LOGIN_THROTTLE_IP_BURST=3,
+    LOGIN_THROTTLE_USERNAME_BURST=2,
+)
+class LoginThrottleTests(TestCase):
+    databases = "__all__"
+
+    url = reverse("main:api_login")
+
+    def setUp(self):
+        throttle._buckets.clear()
+        caches["default"].clear()
+
+    def _login(self, username):
+        return self.client.post(self.url, {"username": username, "password": "wrong"})
+
+    def test_username_bucket_refuses_before_hashing(self):
+        before = throttle.throttle_stats().get("api_login:username", 0)
+        with mock.patch.object(passwords, "run_hasher", wraps=passwords.run_hasher) as hasher:
+            statuses = [self._login("Alice").status_code for _ in range(2)]
+            refused = self._login(" alice ")  # same bucket after normalising
+        self.assertEqual(statuses, [400, 400])
+        self.assertEqual(refused.status_code, 429)
+        self.assertGreater(int(refused["Retry-After"]), 0)
+        self.assertFalse(refused.json()["ok"])
+        self.assertEqual(hasher.await_count, 2)
+        self.assertEqual(throttle.throttle_stats()["api_login:username"], before + 1)
+
+    def test_ip_bucket_spans_usernames(self):
+        statuses = [self._login(f"user{i}").status_code for i in range(4)]
+        self.assertEqual(statuses, [400, 400, 400, 429])
+
+    @override_settings(LOGIN_THROTTLE_SHARED=True)
+    def test_shared_buckets_live_in_the_cache(self):
+        statuses = [self._login("bob").status_code for _ in range(3)]
+        self.assertEqual(statuses, [400, 400, 429])
+        self.assertEqual(throttle._buckets, {})
+
+    @override_settings(LOGIN_THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual({self._login("carol").status_code for _ in range(4)}, {400})
+
+
+class AuthBackendTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="regular", password=PASSWORD)
+
+    def test_sessions_from_plain_model_backend_stay_logged_in(self):
+        self.client.force_login(self.user, backend="django.contrib.auth.backends.ModelBackend")
+        request = HttpRequest()
+        request.session = self.client.session
+        self.assertEqual(get_user(request), self.user)
+
+    def test_rejected_password_is_hashed_once(self):
+        with mock.patch.object(User, "check_password", autospec=True, return_value=False) as check:
+            self.assertIsNone(authenticate(username="regular", password="wrong"))
+        self.assertEqual(check.call_count, 1)
+
+
+class ThumbnailTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.enterContext(
+            override_settings(THUMBNAIL_CACHE_DIR=self.enterContext(tempfile.TemporaryDirectory()))
+        )
+        thumbnails._failures.clear()
+        self.addCleanup(thumbnails._failures.clear)
+
+    def _get(self, src):
+        Product.objects.create(user=self.user, **{**product_data(99), "thumbnail": src})
+        return self.client.get(
+            reverse("main:product_thumbnail", kwargs={"width": 160, "fmt": "webp"}), {"src": src}
+        )
+
+    @override_settings(THUMBNAIL_ORIGIN=None)
+    def test_non_public_addresses_are_never_fetched(self):
+        with FakeOrigin() as origin:
+            for src in (
+                f"{origin.url}/a.jpg",
+                f"http://[::ffff:127.0.0.1]:{origin.server.server_port}/a.jpg",
+                "http://169.254.169.254/latest/meta-data/",
+                "http://10.0.0.1/a.jpg",
+            ):
+                with self.subTest(src=src):
+                    self.assertEqual(self._get(src).status_code, 502)
+            self.assertEqual(origin.requests, 0)
+
+    def test_redirects_are_checked_hop_by_hop(self):
+        with FakeOrigin() as internal:
+            hop = f"http://localhost:{internal.server.server_port}/a.jpg"
+            with FakeOrigin(location=hop) as origin, override_settings(THUMBNAIL_ORIGIN=origin.url):
+                self.assertEqual(self._get("https://cdn.example/a.jpg").status_code, 502)
+            self.assertEqual((origin.requests, internal.requests), (1, 0))
+
+    def test_failing_origin_is_not_retried_right_away(self):
+        with FakeOrigin(status=500) as origin:
+            with override_settings(THUMBNAIL_ORIGIN=origin.url):
+                self.assertEqual(self._get("https://cdn.example/a.jpg").status_code, 502)
+                self.assertEqual(self._get("https://cdn.example/a.jpg").status_code, 502)
+                self.assertEqual(origin.requests, 1)
+                with override_settings(THUMBNAIL_FAILURE_TTL=0):
+                    thumbnails._remember_failure("https://cdn.example/a.jpg")
+                    self.assertEqual(self._get("https://cdn.example/a.jpg").status_code, 502)
+                self.assertEqual(origin.requests, 2)
+
+    def test_trusted_origin_renders(self):
+        with FakeOrigin() as origin, override_settings(THUMBNAIL_ORIGIN=origin.url):
+            response = self._get("https://cdn.example/a.jpg")
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, "image/webp"))
+
+    def test_unrenderable_static_images_dont_fail_collectstatic(self):
+        storage = ManifestStaticStorage(location=self.enterContext(tempfile.TemporaryDirectory()))
+        paths = {"main/img/bad.png": (storage, "main/img/bad.png")}
+        with (
+            mock.patch.object(CompressedManifestStaticFilesStorage, "post_process", return_value=iter([])),
+            mock.patch("main.storage.prerender", side_effect=thumbnails.ThumbnailError("bad image")),
+            self.assertLogs("main.storage", "WARNING"),
+        ):
+            self.assertEqual(list(storage.post_process(paths)), [])
+
+
+class ProfilingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(
+            override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1, PROFILING_DIR=directory)
+        )
+        self.directory = Path(directory)
+
+    def _capture(self):
+        (meta,) = self.directory.glob("*.json")
+        return json.loads(meta.read_text()), meta.with_suffix(".collapsed").read_text()
+
+    def test_sync_view_under_wsgi(self):
+        self.client.get(reverse("main:api_product_search"), {"q": "bench"})
+        meta, stacks = self._capture()
+        self.assertEqual((meta["view"], meta["status"]), ("main:api_product_search", 200))
+        self.assertIn("search_products", stacks)
+
+    async def test_async_view_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        await client.get(reverse("main:api_product_list"))
+        meta, stacks = await sync_to_async(self._capture)()
+        self.assertEqual((meta["view"], meta["status"]), ("main:api_product_list", 200))
+        self.assertIn("api_product_list", stacks)  # the view's own steps on the loop
+        self.assertIn("execute", stacks)  # and its queries on the sync thread
+
+    def test_streamed_export_is_captured_once_read(self):
+        response = self.client.get(reverse("main:product_list_json"))
+        self.assertEqual(list(self.directory.glob("*.json")), [])
+        b"".join(response.streaming_content)
+        self.assertIn("iter_serialized", self._capture()[1])
+
+    def test_view_exceptions_reach_process_exception(self):
+        # ShardMoveMiddleware only sees the exception if the profiler lets it through
+        self.addCleanup(shards.forget, self.user.pk)
+        with override_settings(SHARD_DATABASES=settings.SHARD_DATABASES or ["default"]):
+            ShardAssignment.objects.update_or_create(
+                user=self.user,
+                defaults={"alias": shards.shard_for(self.user.pk), "moving": True},
+            )
+            shards.forget(self.user.pk)
+            response = self.client.post(reverse("main:api_product_create"), product_data(70))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self._capture()[0]["status"], 503)
+
+
+@override_settings(SHARD_DATABASES=settings.SHARD_DATABASES or ["default"])
+class ShardPlacementTests(TestCase):
+    databases = "__all__"
+
+    def test_only_the_first_write_assigns_a_shard(self):
+        user = User.objects.create_user(username="newcomer")
+        # Ids come round again once earlier tests roll back
+        shards.forget(user.pk)
+        self.addCleanup(shards.forget, user.pk)
+        home = shards.home_shard(user.pk)
+        self.assertEqual(shards.shard_for(user.pk), home)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("main:api_product_list")).status_code, 200)
+        self.assertEqual(Client().get(reverse("main:product_list_json")).status_code, 200)
+        self.assertFalse(ShardAssignment.objects.filter(user=user).exists())
+        Product(user=user, **product_data(1)).save()
+        self.assertEqual(ShardAssignment.objects.get(user=user).alias, home)
+
+
+@skipUnless(len(settings.SHARD_DATABASES) >= 2, "needs two SHARD_DATABASES")
+class ShardMoveTests(TransactionTestCase):
+    databases = "__all__"
+
+    def _merchant(self, username, alias):
+        user = User.objects.create_user(username=username)
+        ShardAssignment.objects.create(user=user, alias=alias)
+        self.addCleanup(shards.forget, user.pk)
+        products = bulk_create_products(user, [Product(**product_data(i)) for i in range(5)])
+        products[0].name = "Renamed"
+        products[0].save()
+        products[1].delete()
+        ProductImport.objects.shard(user).create(
+            user=user, source_name="seed.csv", source_key="k" * 64
+        )
+        return user
+
+    def _changes(self, user, since):
+        client = Client()
+        client.force_login(user)
+        return client.get(reverse("main:api_product_changes"), {"since": since}).json()
+
+    def test_move_onto_a_shard_that_holds_data(self):
+        source, target = settings.SHARD_DATABASES[:2]
+        mover = self._merchant("mover", source)
+        resident = self._merchant("resident", target)
+        cursor = self._changes(mover, 0)["cursor"]
+
+        self.assertEqual(shards.move_merchant(mover.pk, target, grace=0), 4)
+
+        self.assertEqual(shards.shard_for(mover.pk), target)
+        for user in (mover, resident):
+            self.assertEqual(Product.objects.using(target).filter(user=user).count(), 4)
+            self.assertEqual(
+                sum(f.product_count for f in CategoryFacet.objects.using(target).filter(user=user)), 4
+            )
+            self.assertEqual(ProductImport.objects.using(target).filter(user=user).count(), 1)
+            self.assertEqual(ProductTombstone.objects.using(target).filter(user=user).count(), 1)
+        self.assertFalse(Product.objects.using(source).filter(user=mover).exists())
+
+        # The old cursor still works: no product is missed, the delete is
+        # sent again, and later writes come after everything copied
+        delta = self._changes(mover, cursor)
+        self.assertEqual(delta["products"], [])
+        self.assertEqual(len(delta["deleted"]), 1)
+        Product.objects.for_user(mover).get(name="Renamed").delete()
+        later = self._changes(mover, delta["cursor"])
+        self.assertEqual(len(later["deleted"]), 1)
+        self.assertGreater(later["cursor"], delta["cursor"])
+        self.assertEqual(len(self._changes(resident, 0)["products"]), 4)
 
-# Create your tests here.
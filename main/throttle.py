@@ -0,0 +1,201 @@
+# main/throttle.py
+import functools
+import math
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+from .metrics import register_counter
+
+
+# ------------------------------------------------------------------
+# Token buckets in front of password hashing
+#
+# Each POST to api_login, api_register, login_user and register runs a
+# full PBKDF2 hash. throttle_auth() charges every attempt one token
+# from a bucket for the client IP and one for the (case-folded)
+# username. When either bucket is empty the request gets a 429 with
+# Retry-After before the view runs, so no hash is computed. Buckets
+# hold up to LOGIN_THROTTLE_*_BURST tokens and refill at
+# LOGIN_THROTTLE_*_PER_MINUTE; a burst of 0 turns that key off.
+#
+# Buckets live in this process. With LOGIN_THROTTLE_SHARED they live in
+# the cache instead, so every worker draws from the same ones. The
+# cache has no compare-and-swap, so two workers racing on one bucket
+# can occasionally let an extra attempt through.
+# ------------------------------------------------------------------
+_MAX_BUCKETS = 50_000
+
+# key -> (tokens, stamp)
+_buckets = {}
+_buckets_lock = threading.Lock()
+_avoided = Counter()
+_avoided_lock = threading.Lock()
+
+
+def throttle_stats():
+    """Attempts turned away (hashes avoided), by view and exhausted key."""
+    with _avoided_lock:
+        return dict(_avoided)
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address LOGIN_THROTTLE_PROXY_COUNT proxies in front saw."""
+    proxies = getattr(settings, "LOGIN_THROTTLE_PROXY_COUNT", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        return hops[max(0, len(hops) - proxies)]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def _limits(request):
+    """[(kind, key, burst, tokens per second)] for the buckets this attempt draws on."""
+    username = request.POST.get("username", "").strip().casefold()
+    limits = [
+        (
+            "ip",
+            f"ip:{client_ip(request)}",
+            settings.LOGIN_THROTTLE_IP_BURST,
+            settings.LOGIN_THROTTLE_IP_PER_MINUTE / 60,
+        ),
+        (
+            "username",
+            f"username:{username}",
+            settings.LOGIN_THROTTLE_USERNAME_BURST,
+            settings.LOGIN_THROTTLE_USERNAME_PER_MINUTE / 60,
+        ),
+    ]
+    return [
+        limit for limit in limits if limit[2] > 0 and limit[3] > 0 and limit[1] != "username:"
+    ]
+
+
+def _take(limits, states, now):
+    """
+    Spend one token from every bucket, or none if any is empty. Returns
+    `(new_states, None)` or `(None, (kind, seconds until it refills))`.
+    """
+    levels = []
+    for (kind, _, burst, rate), state in zip(limits, states):
+        tokens, stamp = state or (burst, now)
+        level = min(burst, tokens + (now - stamp) * rate)
+        if level < 1:
+            return None, (kind, (1 - level) / rate)
+        levels.append(level)
+    return [(level - 1, now) for level in levels], None
+
+
+def _take_local(limits):
+    now = time.monotonic()
+    with _buckets_lock:
+        states, refused = _take(limits, [_buckets.get(key) for _, key, _, _ in limits], now)
+        if states is None:
+            return refused
+        if len(_buckets) >= _MAX_BUCKETS:
+            # A bucket untouched for long enough is full again, which is
+            # what a missing one means anyway
+            horizon = now - max(burst / rate for _, _, burst, rate in limits)
+            for key in [k for k, (_, stamp) in _buckets.items() if stamp < horizon]:
+                del _buckets[key]
+        _buckets.update((key, state) for (_, key, _, _), state in zip(limits, states))
+    return None
+
+
+def _cache_args(limits, states):
+    return {
+        f"throttle:{key}": state for (_, key, _, _), state in zip(limits, states)
+    }, math.ceil(max(burst / rate for _, _, burst, rate in limits)) + 1
+
+
+def _take_shared(limits):
+    cache = caches[settings.LOGIN_THROTTLE_CACHE_ALIAS]
+    found = cache.get_many([f"throttle:{key}" for _, key, _, _ in limits])
+    states, refused = _take(
+        limits, [found.get(f"throttle:{key}") for _, key, _, _ in limits], time.time()
+    )
+    if states is None:
+        return refused
+    cache.set_many(*_cache_args(limits, states))
+    return None
+
+
+async def _atake_shared(limits):
+    cache = caches[settings.LOGIN_THROTTLE_CACHE_ALIAS]
+    found = await cache.aget_many([f"throttle:{key}" for _, key, _, _ in limits])
+    states, refused = _take(
+        limits, [found.get(f"throttle:{key}") for _, key, _, _ in limits], time.time()
+    )
+    if states is None:
+        return refused
+    await cache.aset_many(*_cache_args(limits, states))
+    return None
+
+
+def _refuse(view_name, refused, as_json):
+    kind, wait = refused
+    with _avoided_lock:
+        _avoided[f"{view_name}:{kind}"] += 1
+    retry_after = str(math.ceil(wait))
+    message = f"Too many attempts. Try again in {retry_after} seconds."
+    if as_json:
+        response = JsonResponse({"ok": False, "status": False, "message": message}, status=429)
+    else:
+        response = HttpResponse(message, content_type="text/plain", status=429)
+    response["Retry-After"] = retry_after
+    return response
+
+
+def throttle_auth(as_json=True):
+    """
+    Rate-limit POSTs to a login/register view (sync or async). Refusals
+    are JSON in the API's {"ok", "status", "message"} shape, or plain
+    text for the HTML forms with `as_json=False`.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method == "POST" and settings.LOGIN_THROTTLE_ENABLED:
+                    limits = _limits(request)
+                    if limits:
+                        if settings.LOGIN_THROTTLE_SHARED:
+                            refused = await _atake_shared(limits)
+                        else:
+                            refused = _take_local(limits)
+                        if refused:
+                            return _refuse(view.__name__, refused, as_json)
+                return await view(request, *args, **kwargs)
+
+        else:
+
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method == "POST" and settings.LOGIN_THROTTLE_ENABLED:
+                    limits = _limits(request)
+                    if limits:
+                        if settings.LOGIN_THROTTLE_SHARED:
+                            refused = _take_shared(limits)
+                        else:
+                            refused = _take_local(limits)
+                        if refused:
+                            return _refuse(view.__name__, refused, as_json)
+                return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+register_counter(
+    "kickoffkart_password_hashes_avoided_total",
+    "Login/register attempts refused by the throttle before hashing, by view and key.",
+    throttle_stats,
+)
@@ -0,0 +1,370 @@
+# main/thumbnails.py
+import asyncio
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# ------------------------------------------------------------------
+# Resized product thumbnails
+#
+# Product.thumbnail is whatever URL the merchant pasted, often a
+# multi-megabyte original. /thumbnails/<width>/<fmt>/?src=... serves it
+# at one of THUMBNAIL_WIDTHS as WebP or JPEG instead. The first request
+# for a source fetches it once and renders every width and format in
+# one go, on a pool of THUMBNAIL_WORKERS threads; concurrent requests
+# for the same source wait on that render rather than fetching again.
+#
+# Variants live under THUMBNAIL_CACHE_DIR, one directory per source.
+# The directory holds at most THUMBNAIL_CACHE_MAX_BYTES: past that the
+# least recently served files are deleted. Hits refresh a file's mtime
+# (at most every THUMBNAIL_TOUCH_SECONDS, to keep hits read-only), so
+# mtime order is LRU order. Usage is tracked per process and re-counted
+# from disk at each eviction, so several workers sharing the directory
+# only drift until the next one.
+#
+# Sources without a scheme are static files (the fixtures use these);
+# collectstatic renders theirs ahead of time.
+# THUMBNAIL_ORIGIN, when set, replaces the scheme and host of every
+# remote source, which lets tests point fetches at a local fake origin.
+#
+# Remote sources are merchant input, so fetches only go to public
+# addresses: the host is resolved once, refused if any address is
+# loopback, private, link-local (cloud metadata) or otherwise not
+# global, and the connection goes to the address that was checked so a
+# second lookup can't answer differently. Redirects are followed by
+# hand, up to THUMBNAIL_MAX_REDIRECTS, and every hop is checked the same
+# way. Only THUMBNAIL_ORIGIN itself is trusted. A source that fails to
+# fetch or render is not retried for THUMBNAIL_FAILURE_TTL seconds.
+# ------------------------------------------------------------------
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_inflight = {}
+_inflight_lock = threading.Lock()
+_usage = None
+_usage_lock = threading.Lock()
+_MAX_FAILURES = 10_000
+# src -> time.monotonic() until which it isn't retried
+_failures = {}
+_failures_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "THUMBNAIL_WORKERS", 2),
+                thread_name_prefix="thumbnail",
+            )
+        return _executor
+
+
+def _cache_dir():
+    return Path(getattr(settings, "THUMBNAIL_CACHE_DIR", Path(settings.MEDIA_ROOT) / "thumbnails"))
+
+
+def source_key(src):
+    return hashlib.sha256(src.encode()).hexdigest()
+
+
+def variant_path(src, width, fmt):
+    key = source_key(src)
+    return _cache_dir() / key[:2] / key / f"{width}.{fmt}"
+
+
+def read_variant(src, width, fmt):
+    """Return the cached variant's bytes, or None on a miss."""
+    path = variant_path(src, width, fmt)
+    try:
+        with open(path, "rb") as fh:
+            data = fh.read()
+            touched = os.fstat(fh.fileno()).st_mtime
+    except FileNotFoundError:
+        return None
+    if touched < time.time() - getattr(settings, "THUMBNAIL_TOUCH_SECONDS", 3600):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted since we read it
+    return data
+
+
+# ------------------------------------------------------------------
+# Fetch
+# ------------------------------------------------------------------
+def _origin_url(src):
+    origin = getattr(settings, "THUMBNAIL_ORIGIN", None)
+    if not origin:
+        return src
+    parts = urllib.parse.urlsplit(src)
+    base = urllib.parse.urlsplit(origin)
+    return urllib.parse.urlunsplit((base.scheme, base.netloc, parts.path, parts.query, ""))
+
+
+def _public_address(host, port):
+    """The address to connect to for `host`, if every address it has is public."""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as exc:
+        raise ThumbnailError(f"Resolving {host!r} failed: {exc}") from exc
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ThumbnailError(f"{host!r} resolves to non-public address {address}")
+    return infos[0][4][0]
+
+
+def _trusted(parts):
+    origin = getattr(settings, "THUMBNAIL_ORIGIN", None)
+    if not origin:
+        return False
+    base = urllib.parse.urlsplit(origin)
+    return (parts.scheme, parts.netloc) == (base.scheme, base.netloc)
+
+
+def _fetch_remote(src, limit):
+    url = _origin_url(src)
+    timeout = getattr(settings, "THUMBNAIL_FETCH_TIMEOUT", 10)
+    for _ in range(getattr(settings, "THUMBNAIL_MAX_REDIRECTS", 3) + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ThumbnailError(f"Unsupported source URL {url!r}")
+        try:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            address = parts.hostname if _trusted(parts) else _public_address(parts.hostname, port)
+            if parts.scheme == "https":
+                conn = http.client.HTTPSConnection(parts.hostname, port, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(parts.hostname, port, timeout=timeout)
+            # Connect to the checked address; Host, SNI and the certificate
+            # check still use the hostname
+            conn._create_connection = lambda _, *args: socket.create_connection(
+                (address, port), *args
+            )
+            try:
+                conn.request(
+                    "GET",
+                    urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, "")),
+                    headers={"User-Agent": "kickoffkart-thumbnailer"},
+                )
+                response = conn.getresponse()
+                location = response.getheader("Location")
+                if response.status in (301, 302, 303, 307, 308) and location:
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                if response.status != 200:
+                    raise ThumbnailError(f"Fetching {src!r} failed: HTTP {response.status}")
+                return response.read(limit + 1)
+            finally:
+                conn.close()
+        except (OSError, http.client.HTTPException, ValueError) as exc:
+            raise ThumbnailError(f"Fetching {src!r} failed: {exc}") from exc
+    raise ThumbnailError(f"Fetching {src!r} failed: too many redirects")
+
+
+def fetch_source(src):
+    """Return the original image bytes for `src`."""
+    limit = getattr(settings, "THUMBNAIL_MAX_SOURCE_BYTES", 20 * 1024 * 1024)
+    scheme = urllib.parse.urlsplit(src).scheme
+    if not scheme:
+        path = finders.find(src.removeprefix(settings.STATIC_URL).lstrip("/"))
+        if path is None:
+            raise ThumbnailError(f"No static file {src!r}")
+        data = Path(path).read_bytes()
+    elif scheme in ("http", "https"):
+        data = _fetch_remote(src, limit)
+    else:
+        raise ThumbnailError(f"Unsupported source scheme {scheme!r}")
+    if len(data) > limit:
+        raise ThumbnailError(f"{src!r} is larger than THUMBNAIL_MAX_SOURCE_BYTES")
+    return data
+
+
+# ------------------------------------------------------------------
+# Render
+# ------------------------------------------------------------------
+def _encode(image, fmt):
+    quality = getattr(settings, "THUMBNAIL_QUALITY", 80)
+    out = io.BytesIO()
+    if fmt == "jpeg":
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flat = Image.new("RGB", image.size, "white")
+            flat.paste(image, mask=image.getchannel("A"))
+            image = flat
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def render_variants(data):
+    """Return {(width, fmt): bytes} for every configured width and format."""
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            original = ImageOps.exif_transpose(original)
+            original.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        raise ThumbnailError(f"Not a usable image: {exc}") from exc
+
+    variants = {}
+    # Largest first, each resized from the previous one: visually the
+    # same as resizing the original every time, for a fraction of the work.
+    source = original
+    for width in sorted(settings.THUMBNAIL_WIDTHS, reverse=True):
+        if width < source.width:
+            height = max(1, round(source.height * width / source.width))
+            source = source.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for fmt in FORMATS:
+            variants[width, fmt] = _encode(source, fmt)
+    return variants
+
+
+# ------------------------------------------------------------------
+# Disk cache
+# ------------------------------------------------------------------
+def _store(src, variants):
+    written = 0
+    for (width, fmt), body in variants.items():
+        path = variant_path(src, width, fmt)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(body)
+        os.replace(tmp, path)
+        written += len(body)
+    _account(written)
+
+
+def _scan():
+    files = []
+    for dirpath, _, filenames in os.walk(_cache_dir()):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+    return files
+
+
+def evict(max_bytes=None):
+    """
+    Delete least recently served variants until the cache is under 90%
+    of `max_bytes` (default THUMBNAIL_CACHE_MAX_BYTES). Returns the
+    bytes still in use.
+    """
+    global _usage
+    if max_bytes is None:
+        max_bytes = settings.THUMBNAIL_CACHE_MAX_BYTES
+    files = _scan()
+    used = sum(size for _, size, _ in files)
+    if used > max_bytes:
+        target = max_bytes * 0.9
+        for _, size, path in sorted(files):
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            used -= size
+            try:
+                os.rmdir(os.path.dirname(path))  # succeeds once a source is gone
+            except OSError:
+                pass
+    with _usage_lock:
+        _usage = used
+    return used
+
+
+def _account(written):
+    global _usage
+    with _usage_lock:
+        if _usage is not None:
+            _usage += written
+            if _usage <= settings.THUMBNAIL_CACHE_MAX_BYTES:
+                return
+    evict()
+
+
+def prerender(src):
+    """Render and store every variant of `src` now; see main/storage.py."""
+    _store(src, render_variants(fetch_source(src)))
+
+
+def _failed_recently(src):
+    with _failures_lock:
+        until = _failures.get(src)
+        if until is None:
+            return False
+        if until > time.monotonic():
+            return True
+        del _failures[src]
+        return False
+
+
+def _remember_failure(src):
+    now = time.monotonic()
+    with _failures_lock:
+        if len(_failures) >= _MAX_FAILURES:
+            for key in [k for k, until in _failures.items() if until <= now]:
+                del _failures[key]
+            if len(_failures) >= _MAX_FAILURES:
+                _failures.clear()
+        _failures[src] = now + getattr(settings, "THUMBNAIL_FAILURE_TTL", 60)
+
+
+def _render(src):
+    try:
+        variants = render_variants(fetch_source(src))
+        _store(src, variants)
+        return variants
+    except ThumbnailError:
+        _remember_failure(src)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(src, None)
+
+
+async def arender(src, width, fmt):
+    """
+    Fetch and render `src` (once, however many requests are waiting)
+    and return the bytes of the requested variant.
+    """
+    if _failed_recently(src):
+        raise ThumbnailError(f"{src!r} failed recently")
+    with _inflight_lock:
+        future = _inflight.get(src)
+        if future is None:
+            future = _inflight[src] = _pool().submit(_render, src)
+    variants = await asyncio.wrap_future(future)
+    return variants[width, fmt]
@@ -15,21 +15,34 @@ urlpatterns = [
     # Data-delivery endpoints (JSON/XML)
     path("products/json/", views.product_list_json, name="product_list_json"),
     path("products/xml/", views.product_list_xml, name="product_list_xml"),
+    path("products/json/batch/", views.product_batch_json, name="product_batch_json"),
+    path("products/xml/batch/", views.product_batch_xml, name="product_batch_xml"),
     path("products/json/<uuid:pk>/", views.product_detail_json, name="product_detail_json"),
     path("products/xml/<uuid:pk>/", views.product_detail_xml, name="product_detail_xml"),
+    path("thumbnails/<int:width>/<str:fmt>/", views.product_thumbnail, name="product_thumbnail"),
 
     # API (read) endpoints
     path("api/products/", views.api_product_list, name="api_product_list"),
+    path("api/products/facets/", views.api_product_facets, name="api_product_facets"),
+    path("api/products/search/", views.api_product_search, name="api_product_search"),
+    path("api/products/changes/", views.api_product_changes, name="api_product_changes"),
+    path("api/products/events/", views.api_product_events, name="api_product_events"),
     path("api/products/<uuid:pk>/", views.api_product_detail, name="api_product_detail"),
 
     # API (write) endpoints
     path("api/products/create/", views.api_product_create, name="api_product_create"),
     path("api/products/<uuid:pk>/update/", views.api_product_update, name="api_product_update"),
     path("api/products/<uuid:pk>/delete/", views.api_product_delete, name="api_product_delete"),
+    path("api/products/bulk/create/", views.api_product_bulk_create, name="api_product_bulk_create"),
+    path("api/products/bulk/update/", views.api_product_bulk_update, name="api_product_bulk_update"),
+    path("api/products/bulk/delete/", views.api_product_bulk_delete, name="api_product_bulk_delete"),
 
     # API (auth) endpoints
     path("api/auth/login/", views.api_login, name="api_login"),
     path("api/auth/logout/", views.api_logout, name="api_logout"),
     path("api/auth/register/", views.api_register, name="api_register"),
     path("login/", views.login_page, name="login"),
+
+    # Operations
+    path("metrics/", views.metrics, name="metrics"),
 ]
\ No newline at end of file
@@ -1,14 +1,21 @@
 ﻿# main/views.py
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+import uuid
+
+from itertools import chain
+
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.http import (
     HttpResponse,
+    StreamingHttpResponse,
     JsonResponse,
     Http404,
     HttpResponseForbidden,
 )
 from django.core import serializers
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import alogin, alogout, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
@@ -17,10 +24,43 @@ from django.urls import reverse
 from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.forms import ModelForm
+from django.forms.models import model_to_dict
 from django.middleware.csrf import get_token
-
+from django.conf import settings
+
+from .bulk import bulk_create_products, bulk_delete_products, bulk_update_products
+from .cache import acached_catalog, cached_catalog
+from .changes import (
+    InvalidSyncCursor,
+    SyncCursorExpired,
+    acheck_since,
+    achanges_since,
+    parse_since,
+)
+from .conditional import (
+    all_products,
+    batch_products,
+    conditional_on,
+    one_product,
+    parse_product_ids,
+    prefetched_rows,
+    user_product,
+    user_products,
+)
+from .encoders import PRODUCT_VALUES, ProductRows, payload_json
+from .events import event_stream
+from .facets import user_facets
+from .metrics import render_prometheus
+from .filters import InvalidFilter, afacet_counts, apply_filters, parse_filters
 from .models import Product
 from .forms import ProductForm
+from .passwords import aauthenticate, ahash_password
+from .pagination import InvalidCursor, apaginate, paginate, parse_limit
+from .routers import replica_reads
+from .search import search_products
+from .streaming import aiter_serialized, iter_serialized
+from .throttle import throttle_auth
+from .thumbnails import CACHE_CONTROL, FORMATS, ThumbnailError, arender, read_variant
 
 
 # Simple login page redirect (if you still link to a dedicated page)
@@ -44,6 +84,26 @@ def product_to_dict(p):
     }
 
 
+def json_body(payload):
+    # Same bytes JsonResponse would produce; ProductRows values take the
+    # fast values_list() path (see main/encoders.py)
+    return payload_json(payload)
+
+
+def cached_json_response(request, kind, build, status=200):
+    body = cached_catalog(request.user.pk, kind, request.GET, lambda: json_body(build()))
+    return HttpResponse(body, content_type="application/json", status=status)
+
+
+async def acached_json_response(request, kind, build, status=200):
+    async def abuild():
+        return json_body(await build())
+
+    user = await request.auser()
+    body = await acached_catalog(user.pk, kind, request.GET, abuild)
+    return HttpResponse(body, content_type="application/json", status=status)
+
+
 class ProductAjaxForm(ModelForm):
     class Meta:
         model = Product
@@ -53,20 +113,45 @@ class ProductAjaxForm(ModelForm):
 @login_required(login_url="main:login")
 def show_main(request):
     category = request.GET.get("category")
-    qs = Product.objects.filter(user=request.user).order_by("-is_featured", "name")
+    qs = Product.objects.for_user(request.user).order_by("-is_featured", "name")
     if category:
         qs = qs.filter(category=category)
     # AJAX lightweight list?
     if request.GET.get("ajax"):
-        data = [product_to_dict(p) for p in qs]
-        return JsonResponse({"count": len(data), "category": category, "products": data})
+        def build():
+            page, next_cursor = paginate(
+                qs, request.GET.get("cursor"), request.GET.get("limit"), fields=PRODUCT_VALUES
+            )
+            return {
+                "count": len(page),
+                "category": category,
+                "products": ProductRows(page),
+                "next": next_cursor,
+            }
+
+        try:
+            return cached_json_response(request, "ajax-list", build)
+        except InvalidCursor:
+            return JsonResponse({"ok": False, "error": "invalid_cursor"}, status=400)
+    # One keyset page of cards; the total comes from the category facets
+    # the nav bar loads anyway, so neither depends on catalog size.
+    try:
+        products, next_cursor = paginate(qs, request.GET.get("cursor"), request.GET.get("limit"))
+    except InvalidCursor:
+        products, next_cursor = paginate(qs, limit=request.GET.get("limit"))
+    total = sum(
+        f.product_count for f in user_facets(request) if not category or f.category == category
+    )
     context = {
         "app_name": "KickoffKart",
         "your_name": "Juansao Fortunio Tandi",
         "your_class": "KKI",
         "your_npm": "2406365345",
-        "products": list(qs),
-        "total_products": qs.count(),
+        "products": products,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
+        "card_cache_timeout": settings.PRODUCT_CARD_CACHE_TIMEOUT,
+        "total_products": total,
         "active_category": category or "",
         "selected_category": category,
         "last_login": request.COOKIES.get("last_login"),
@@ -99,15 +184,23 @@ def add_product(request):
     return render(request, "product_form.html", {"form": form})
 
 
+def _product_or_404(request, pk):
+    # Any merchant's product, so look on every shard (the user's first)
+    try:
+        return Product.objects.locate(user=request.user, pk=pk)
+    except Product.DoesNotExist:
+        raise Http404("No Product matches the given query.")
+
+
 @login_required(login_url="main:login")
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    product = _product_or_404(request, pk)
     return render(request, "product_detail.html", {"product": product})
 
 
 @login_required(login_url="main:login")
 def product_edit(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    product = _product_or_404(request, pk)
     if product.user != request.user:
         is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
         if is_ajax:
@@ -136,7 +229,7 @@ def product_edit(request, pk):
 
 @login_required(login_url="main:login")
 def product_delete(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    product = _product_or_404(request, pk)
     if product.user != request.user:
         is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
         if is_ajax:
@@ -157,33 +250,101 @@ def product_delete(request, pk):
 
 
 # Legacy data delivery
+def _serialized_list_response(request, fmt, content_type):
+    # Bound now: a streamed body is read after the view (and its
+    # replica_reads scope) has returned
+    shards = Product.objects.on_each_shard()
+    if settings.PRODUCT_EXPORT_STREAMING:
+        # Same bytes as serializers.serialize(), sent chunk by chunk; ASGI
+        # would buffer a sync iterator whole (see main/streaming.py)
+        stream = aiter_serialized if isinstance(request, ASGIRequest) else iter_serialized
+        return StreamingHttpResponse(stream(fmt, shards), content_type=content_type)
+    return HttpResponse(serializers.serialize(fmt, chain(*shards)), content_type=content_type)
+
+
+@replica_reads
+@conditional_on(all_products)
 def product_list_json(request):
-    data = serializers.serialize("json", Product.objects.all())
-    return HttpResponse(data, content_type="application/json")
+    return _serialized_list_response(request, "json", "application/json")
 
 
+@replica_reads
+@conditional_on(all_products)
 def product_list_xml(request):
-    data = serializers.serialize("xml", Product.objects.all())
-    return HttpResponse(data, content_type="application/xml")
+    return _serialized_list_response(request, "xml", "application/xml")
 
 
-def product_detail_json(request, pk):
-    qs = Product.objects.filter(pk=pk)
-    if not qs.exists():
+# The detail and batch reads reuse the rows conditional_on fetched for
+# the ETag, so each costs a single query.
+def _serialized_detail_response(request, pk, fmt, content_type):
+    rows = prefetched_rows(request, one_product(request, pk))
+    if not rows:
         raise Http404("Product not found")
-    data = serializers.serialize("json", qs)
-    return HttpResponse(data, content_type="application/json")
+    return HttpResponse(serializers.serialize(fmt, rows), content_type=content_type)
 
 
+@conditional_on(one_product, require_rows=True, prefetch=True, last_modified=True)
+def product_detail_json(request, pk):
+    return _serialized_detail_response(request, pk, "json", "application/json")
+
+
+@conditional_on(one_product, require_rows=True, prefetch=True, last_modified=True)
 def product_detail_xml(request, pk):
-    qs = Product.objects.filter(pk=pk)
-    if not qs.exists():
-        raise Http404("Product not found")
-    data = serializers.serialize("xml", qs)
-    return HttpResponse(data, content_type="application/xml")
+    return _serialized_detail_response(request, pk, "xml", "application/xml")
+
+
+def _serialized_batch_response(request, fmt, content_type):
+    """Every product among `?ids=`, in request order; unknown ids are left out."""
+    try:
+        pks = parse_product_ids(request.GET)
+    except ValueError as exc:
+        return JsonResponse({"ok": False, "error": "invalid_ids", "message": str(exc)}, status=400)
+    order = {pk: i for i, pk in enumerate(pks)}
+    rows = sorted(
+        prefetched_rows(request, batch_products(request)), key=lambda p: order[str(p.pk)]
+    )
+    return HttpResponse(serializers.serialize(fmt, rows), content_type=content_type)
+
+
+@require_GET
+@conditional_on(batch_products, prefetch=True)
+def product_batch_json(request):
+    return _serialized_batch_response(request, "json", "application/json")
+
+
+@require_GET
+@conditional_on(batch_products, prefetch=True)
+def product_batch_xml(request):
+    return _serialized_batch_response(request, "xml", "application/xml")
+
+
+@require_GET
+async def product_thumbnail(request, width, fmt):
+    """
+    `?src=` (a product's thumbnail URL) resized to `width` as `fmt`; see
+    main/thumbnails.py. Variants never change for a given URL, so they
+    are cached for a year.
+    """
+    src = request.GET.get("src", "")
+    if width not in settings.THUMBNAIL_WIDTHS or fmt not in FORMATS or not src:
+        raise Http404("Unknown thumbnail variant")
+    body = read_variant(src, width, fmt)
+    if body is None:
+        # Only render what some product points at, so this can't be
+        # used as an open proxy. Cached variants passed this already.
+        if not await Product.objects.aexists_anywhere(thumbnail=src):
+            raise Http404("Unknown thumbnail source")
+        try:
+            body = await arender(src, width, fmt)
+        except ThumbnailError:
+            return HttpResponse(status=502)
+    response = HttpResponse(body, content_type=FORMATS[fmt])
+    response["Cache-Control"] = CACHE_CONTROL
+    return response
 
 
 # Standard HTML auth views
+@throttle_auth(as_json=False)
 def register(request):
     if request.method == "POST":
         form = UserCreationForm(request.POST)
@@ -196,6 +357,7 @@ def register(request):
     return render(request, "register.html", {"form": form})
 
 
+@throttle_auth(as_json=False)
 def login_user(request):
     if request.method == "POST":
         form = AuthenticationForm(request, data=request.POST)
@@ -225,28 +387,171 @@ def logout_user(request):
 
 
 # API (read)
+# The read and auth API views below are async: under ASGI they wait on
+# the database and cache without holding a worker thread, and password
+# hashing runs on the bounded pool in main/passwords.py.
 @require_GET
-def api_product_list(request):
+@replica_reads
+@conditional_on(user_products)
+async def api_product_list(request):
+    user = await request.auser()
     # Return JSON instead of redirecting to HTML login page
+    if not user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+
+    try:
+        filters = parse_filters(request.GET)
+    except InvalidFilter as exc:
+        return JsonResponse({"ok": False, "error": "invalid_filter", "message": str(exc)}, status=400)
+
+    base = await Product.objects.afor_user(user)
+    cursor = request.GET.get("cursor")
+
+    async def build():
+        page, next_cursor = await apaginate(
+            apply_filters(base, filters),
+            cursor,
+            request.GET.get("limit"),
+            filters["sort"],
+            fields=PRODUCT_VALUES,
+        )
+        data = {"ok": True, "products": ProductRows(page), "next": next_cursor}
+        # Facet counts come with the first page only; later pages reuse them
+        if not cursor:
+            data["facets"] = await afacet_counts(base, filters)
+        return data
+
+    try:
+        return await acached_json_response(request, "list", build)
+    except InvalidCursor:
+        return JsonResponse({"ok": False, "error": "invalid_cursor"}, status=400)
+
+
+@require_GET
+async def api_product_changes(request):
+    """
+    Delta sync: products created/updated and pks deleted after `since`
+    (0 or absent for a full sync). Call again with the returned
+    `cursor` while `more` is true.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+
+    try:
+        since = parse_since(request.GET.get("since"))
+        await acheck_since(since, user)
+    except InvalidSyncCursor as exc:
+        return JsonResponse({"ok": False, "error": "invalid_cursor", "message": str(exc)}, status=400)
+    except SyncCursorExpired:
+        # Tombstones this client needs were compacted; start over from 0
+        return JsonResponse({"ok": False, "error": "cursor_expired"}, status=410)
+    limit = parse_limit(request.GET.get("limit"))
+
+    async def build():
+        rows, deleted, cursor, more = await achanges_since(user, since, limit)
+        return {
+            "ok": True,
+            "products": ProductRows(rows),
+            "deleted": deleted,
+            "cursor": cursor,
+            "more": more,
+        }
+
+    return await acached_json_response(request, "changes", build)
+
+
+@require_GET
+async def api_product_events(request):
+    """Server-sent stream of the user's catalog changes (see main/events.py)."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+    # A WSGI worker would be held for the life of the stream; 204 tells
+    # EventSource not to reconnect, and the page keeps working without it.
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    response = StreamingHttpResponse(
+        event_stream(user, last_event_id), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@require_GET
+def api_product_search(request):
     if not request.user.is_authenticated:
         return JsonResponse(
             {"ok": False, "error": "auth_required"},
             status=401,
         )
 
-    qs = Product.objects.filter(user=request.user).order_by("-is_featured", "name")
-    category = request.GET.get("category")
-    if category:
-        qs = qs.filter(category=category)
+    query = request.GET.get("q", "").strip()
+    try:
+        page = max(1, int(request.GET.get("page") or 1))
+    except ValueError:
+        page = 1
+    limit = parse_limit(request.GET.get("limit"))
 
-    data = [product_to_dict(p) for p in qs]
-    return JsonResponse({"ok": True, "products": data}, status=200)
+    def build():
+        products, has_next = search_products(request.user, query, page, limit)
+        return {
+            "ok": True,
+            "query": query,
+            "page": page,
+            "next": page + 1 if has_next else None,
+            "products": [product_to_dict(p) for p in products],
+        }
+
+    return cached_json_response(request, "search", build)
+
+
+@require_GET
+def api_product_facets(request):
+    if not request.user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+
+    facets = user_facets(request)
+    return JsonResponse(
+        {
+            "ok": True,
+            "total": sum(f.product_count for f in facets),
+            "featured": sum(f.featured_count for f in facets),
+            "categories": [
+                {"category": f.category, "count": f.product_count, "featured": f.featured_count}
+                for f in facets
+            ],
+        },
+        status=200,
+    )
 
 
 @login_required
-def api_product_detail(request, pk):
-    p = get_object_or_404(Product, pk=pk, user=request.user)
-    return JsonResponse(product_to_dict(p), status=200)
+@replica_reads
+@conditional_on(user_product, require_rows=True, last_modified=True)
+async def api_product_detail(request, pk):
+    user = await request.auser()
+
+    async def build():
+        p = await aget_object_or_404(await Product.objects.afor_user(user), pk=pk)
+        return product_to_dict(p)
+
+    return await acached_json_response(request, f"detail:{pk}", build)
 
 
 # API (write)
@@ -280,7 +585,7 @@ def api_product_update(request, pk):
             status=401,
         )
 
-    p = get_object_or_404(Product, pk=pk, user=request.user)
+    p = get_object_or_404(Product.objects.for_user(request.user), pk=pk)
     form = ProductAjaxForm(request.POST, instance=p)
     if form.is_valid():
         p = form.save()
@@ -300,21 +605,143 @@ def api_product_delete(request, pk):
             status=401,
         )
 
-    p = get_object_or_404(Product, pk=pk, user=request.user)
+    p = get_object_or_404(Product.objects.for_user(request.user), pk=pk)
     pk_str = str(p.pk)
     p.delete()
     return JsonResponse({"ok": True, "deleted": pk_str}, status=200)
 
+# API (bulk write, JSON array bodies)
+def _bulk_items(request):
+    """Parse the request body as a JSON array; return (items, error_response)."""
+    try:
+        items = json.loads(request.body or b"null")
+    except ValueError:
+        return None, JsonResponse({"ok": False, "error": "invalid_json"}, status=400)
+    if not isinstance(items, list):
+        return None, JsonResponse({"ok": False, "error": "expected_array"}, status=400)
+    if len(items) > settings.PRODUCT_BULK_MAX_ITEMS:
+        return None, JsonResponse(
+            {"ok": False, "error": "too_many_items", "max": settings.PRODUCT_BULK_MAX_ITEMS},
+            status=400,
+        )
+    return items, None
+
+
+def _item_pk(item):
+    raw = item.get("pk") if isinstance(item, dict) else item
+    try:
+        return str(uuid.UUID(str(raw)))
+    except ValueError:
+        return None
+
+
+@csrf_exempt
+@require_POST
+def api_product_bulk_create(request):
+    if not request.user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+    items, error = _bulk_items(request)
+    if error:
+        return error
+
+    results, valid = [], []
+    for index, item in enumerate(items):
+        form = ProductAjaxForm(item if isinstance(item, dict) else {})
+        if form.is_valid():
+            valid.append((index, form.save(commit=False)))
+            results.append(None)
+        else:
+            results.append({"index": index, "ok": False, "errors": form.errors})
+
+    bulk_create_products(request.user, [p for _, p in valid])
+    for index, p in valid:
+        results[index] = {"index": index, "ok": True, "product": product_to_dict(p)}
+    return JsonResponse(
+        {"ok": len(valid) == len(items), "created": len(valid), "results": results},
+        status=201 if valid else 400,
+    )
+
+
+@csrf_exempt
+@require_POST
+def api_product_bulk_update(request):
+    if not request.user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+    items, error = _bulk_items(request)
+    if error:
+        return error
+
+    pks = [_item_pk(item) for item in items]
+    existing = Product.objects.for_user(request.user).in_bulk([pk for pk in pks if pk])
+
+    results, valid, fields = [], [], set()
+    for index, (item, pk) in enumerate(zip(items, pks)):
+        p = existing.get(uuid.UUID(pk)) if pk else None
+        if not isinstance(item, dict) or p is None:
+            results.append({"index": index, "ok": False, "error": "not_found"})
+            continue
+        # Partial updates: start from the stored values, overlay the item
+        data = {**model_to_dict(p, fields=ProductAjaxForm._meta.fields), **item}
+        form = ProductAjaxForm(data, instance=p)
+        if form.is_valid():
+            valid.append((index, form.save(commit=False)))
+            fields.update(form.changed_data)
+            results.append(None)
+        else:
+            results.append({"index": index, "ok": False, "errors": form.errors})
+
+    bulk_update_products(request.user, [p for _, p in valid], sorted(fields))
+    for index, p in valid:
+        results[index] = {"index": index, "ok": True, "product": product_to_dict(p)}
+    return JsonResponse(
+        {"ok": len(valid) == len(items), "updated": len(valid), "results": results},
+        status=200 if valid or not items else 400,
+    )
+
+
+@csrf_exempt
+@require_POST
+def api_product_bulk_delete(request):
+    if not request.user.is_authenticated:
+        return JsonResponse(
+            {"ok": False, "error": "auth_required"},
+            status=401,
+        )
+    items, error = _bulk_items(request)
+    if error:
+        return error
+
+    pks = [_item_pk(item) for item in items]
+    deleted = set(bulk_delete_products(request.user, [pk for pk in pks if pk]))
+    results = [
+        {"index": index, "ok": True, "deleted": pk}
+        if pk in deleted
+        else {"index": index, "ok": False, "error": "not_found"}
+        for index, pk in enumerate(pks)
+    ]
+    return JsonResponse(
+        {"ok": len(deleted) == len(items), "deleted": len(deleted), "results": results},
+        status=200,
+    )
+
+
 # API auth (form-encoded)
 @csrf_exempt
 @require_POST
-def api_login(request):
+@throttle_auth()
+async def api_login(request):
     username = request.POST.get("username", "").strip()
     password = request.POST.get("password", "")
-    user = authenticate(request, username=username, password=password)
+    user = await aauthenticate(request, username, password)
 
     if user is not None:
-        login(request, user)
+        await alogin(request, user)
         next_url = (
             request.GET.get("next")
             or request.POST.get("next")
@@ -344,9 +771,10 @@ def api_login(request):
 
 @csrf_exempt
 @require_POST
-def api_logout(request):
-    if request.user.is_authenticated:
-        logout(request)
+async def api_logout(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        await alogout(request)
     return JsonResponse(
         {
             "ok": True,
@@ -359,7 +787,8 @@ def api_logout(request):
 
 @csrf_exempt
 @require_POST
-def api_register(request):
+@throttle_auth()
+async def api_register(request):
     username = request.POST.get("username", "").strip()
     email = request.POST.get("email", "").strip()
     password = request.POST.get("password", "")
@@ -374,7 +803,7 @@ def api_register(request):
             status=400,
         )
 
-    if User.objects.filter(username=username).exists():
+    if await User.objects.filter(username=username).aexists():
         return JsonResponse(
             {
                 "ok": False,
@@ -384,8 +813,14 @@ def api_register(request):
             status=400,
         )
 
-    user = User.objects.create_user(username=username, email=email, password=password)
-    login(request, user)
+    user = User(
+        username=User.normalize_username(username),
+        email=User.objects.normalize_email(email),
+        password=await ahash_password(password),
+    )
+    await user.asave()
+    # Not authenticated by a backend, so name the one that loads it back
+    await alogin(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
 
     return JsonResponse(
         {
@@ -397,3 +832,11 @@ def api_register(request):
         },
         status=201,
     )
+
+
+# Operations
+@require_GET
+def metrics(request):
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4")